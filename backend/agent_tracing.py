@@ -0,0 +1,158 @@
+"""Трассировка на стороне агента: шаги модели, вызовы тулов и HTTP запросы к MCP серверу"""
+from typing import Any
+from uuid import UUID
+
+import httpx
+from langchain_core.callbacks import AsyncCallbackHandler
+
+from backend import tracing
+
+
+class AgentTracingCallback(AsyncCallbackHandler):
+    """Спаны для каждого обращения к модели и каждого вызова тула внутри agent.ainvoke
+
+    Обработчик выполняется inline, поэтому спан тула становится текущим
+    в контексте вызова тула и вызов MCP сервера получает его traceparent.
+    """
+
+    run_inline = True
+
+    def __init__(self):
+        self._spans: dict[UUID, tuple[tracing.Span, tracing.Span | None]] = {}
+
+    def _start(self, run_id: UUID, parent_run_id: UUID | None, name: str, **attributes) -> tracing.Span:
+        parent = self._spans.get(parent_run_id, (None,))[0] if parent_run_id else None
+        previous = tracing.current_span()
+        span = tracing.start_span(name, parent or previous, **attributes)
+        self._spans[run_id] = (span, previous)
+        return span
+
+    def _finish(self, run_id: UUID, error: BaseException | None = None) -> tracing.Span | None:
+        entry = self._spans.pop(run_id, None)
+        if entry is None:
+            return None
+        span, previous = entry
+        if error is not None:
+            span.record_error(error)
+        span.finish()
+        if tracing.current_span() is span:
+            tracing.activate(previous)
+        return span
+
+    async def on_chat_model_start(
+        self,
+        serialized: dict[str, Any],
+        messages: list[list[Any]],
+        *,
+        run_id: UUID,
+        parent_run_id: UUID | None = None,
+        **kwargs: Any,
+    ) -> None:
+        params = kwargs.get("invocation_params") or {}
+        model = params.get("model") or params.get("model_name") or (serialized or {}).get("name", "model")
+        self._start(run_id, parent_run_id, f"llm {model}", messages=sum(len(batch) for batch in messages))
+
+    async def on_llm_end(self, response, *, run_id: UUID, **kwargs: Any) -> None:
+        span = self._spans.get(run_id, (None,))[0]
+        if span is not None:
+            usage = (response.llm_output or {}).get("token_usage") or {}
+            span.set(
+                prompt_tokens=usage.get("prompt_tokens"),
+                completion_tokens=usage.get("completion_tokens"),
+            )
+            tool_calls = [
+                call["name"]
+                for generations in response.generations
+                for generation in generations
+                for call in getattr(getattr(generation, "message", None), "tool_calls", None) or []
+            ]
+            if tool_calls:
+                span.set(tool_calls=",".join(tool_calls))
+        self._finish(run_id)
+
+    async def on_llm_error(self, error: BaseException, *, run_id: UUID, **kwargs: Any) -> None:
+        self._finish(run_id, error)
+
+    async def on_tool_start(
+        self,
+        serialized: dict[str, Any],
+        input_str: str,
+        *,
+        run_id: UUID,
+        parent_run_id: UUID | None = None,
+        **kwargs: Any,
+    ) -> None:
+        span = self._start(run_id, parent_run_id, f"tool {serialized.get('name', 'unknown')}", kind="client")
+        # Дочерние спаны (HTTP запросы к MCP) создаются в контексте вызова тула
+        tracing.activate(span)
+
+    async def on_tool_end(self, output: Any, *, run_id: UUID, **kwargs: Any) -> None:
+        self._finish(run_id)
+
+    async def on_tool_error(self, error: BaseException, *, run_id: UUID, **kwargs: Any) -> None:
+        self._finish(run_id, error)
+
+
+class _SpanStream(httpx.AsyncByteStream):
+    """Тело ответа, по закрытию которого завершается спан запроса (ответы MCP бывают потоковыми)"""
+
+    def __init__(self, stream: httpx.AsyncByteStream, span: tracing.Span):
+        self._stream = stream
+        self._span = span
+
+    async def __aiter__(self):
+        async for chunk in self._stream:
+            yield chunk
+
+    async def aclose(self):
+        try:
+            await self._stream.aclose()
+        finally:
+            self._span.finish()
+
+
+class TracingTransport(httpx.AsyncBaseTransport):
+    """Транспорт httpx: спан на каждый запрос и заголовок traceparent для MCP сервера"""
+
+    def __init__(self, transport: httpx.AsyncBaseTransport | None = None):
+        self._transport = transport or httpx.AsyncHTTPTransport()
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        if tracing.current_span() is None:
+            # Служебные запросы пула сеансов (ping, initialize) вне хода агента не трассируем
+            return await self._transport.handle_async_request(request)
+        span = tracing.start_span(f"mcp.http {request.method}", kind="client", url=request.url.path)
+        request.headers["traceparent"] = span.traceparent
+        try:
+            response = await self._transport.handle_async_request(request)
+        except BaseException as e:
+            span.record_error(e)
+            span.finish()
+            raise
+        span.set(status_code=response.status_code)
+        if response.status_code >= 400:
+            span.record_error(f"HTTP {response.status_code}")
+        return httpx.Response(
+            status_code=response.status_code,
+            headers=response.headers,
+            stream=_SpanStream(response.stream, span),
+            extensions=response.extensions,
+        )
+
+    async def aclose(self):
+        await self._transport.aclose()
+
+
+def traced_http_client(
+    headers: dict[str, str] | None = None,
+    timeout: httpx.Timeout | None = None,
+    auth: httpx.Auth | None = None,
+) -> httpx.AsyncClient:
+    """httpx_client_factory для MultiServerMCPClient (те же умолчания, что у mcp)"""
+    return httpx.AsyncClient(
+        headers=headers,
+        timeout=timeout or httpx.Timeout(30.0),
+        auth=auth,
+        follow_redirects=True,
+        transport=TracingTransport(),
+    )
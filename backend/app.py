@@ -1,23 +1,39 @@
+from __future__ import annotations
+
+from backend.startup import startup  # отсчет времени запуска - до остальных импортов
+
 import os
 import json
 import asyncio
+import importlib
+import secrets
 from contextlib import asynccontextmanager
-from fastapi import FastAPI
-from telegram import Update
-from telegram.ext import ApplicationBuilder, CommandHandler, MessageHandler, filters, ContextTypes, Application
-from openai import AsyncOpenAI
+from typing import TYPE_CHECKING
+from fastapi import FastAPI, Request, Response
 from dotenv import load_dotenv
 from sqlalchemy import select
-from langchain.messages import HumanMessage, AIMessage
 import sys
 import traceback
 
 # ... ваши импорты БД ...
 from backend.database import Base, engine, SessionLocal
 from shared_models import Employee
-from backend.langchain_agent import init_agent
+from backend.conversation_store import create_store
+from backend.memory import memory
+from backend.scheduler import scheduler
+from backend.update_dispatcher import UpdateDispatcher, QueueFull
+from backend.streaming import MessageStream, PLACEHOLDER, stream_agent_turn
+from backend import tracing
+
+if TYPE_CHECKING:
+    from telegram import Update
+    from telegram.ext import Application, ContextTypes
+
+# telegram и агент (langchain) импортируются в lifespan: агент - в фоне, параллельно с БД и ботом
+startup.mark("imports")
 
 load_dotenv()
+tracing.init_tracing("telegram-bot")
 
 agent = None
 
@@ -30,10 +46,17 @@ with open("secret.json", "r", encoding="utf-8") as f:
 # --- Настройка Бота ---
 ptb_app: Application = None
 
-client = AsyncOpenAI(
-    api_key=os.getenv("AI_API_KEY"),
-    base_url="https://foundation-models.api.cloud.ru/v1"
-)
+# polling - один процесс забирает обновления сам; webhook - Telegram присылает их на /telegram/webhook
+TG_MODE = os.getenv("TG_MODE", "polling")
+TG_WEBHOOK_URL = os.getenv("TG_WEBHOOK_URL", "")
+TG_WEBHOOK_PATH = "/telegram/webhook"
+TG_WEBHOOK_SECRET = os.getenv("TG_WEBHOOK_SECRET", "")
+dispatcher: UpdateDispatcher = None
+
+NO_REPLY = "Не удалось получить ответ, попробуйте переформулировать запрос."
+
+# История диалогов в Postgres: общая для всех воркеров бота (CONVERSATION_STORE=memory - в памяти)
+conversations = create_store()
 
 
 async def start(update: Update, context: ContextTypes.DEFAULT_TYPE):
@@ -44,61 +67,96 @@ async def start(update: Update, context: ContextTypes.DEFAULT_TYPE):
 
 async def handle_message(update: Update, context: ContextTypes.DEFAULT_TYPE):
     print(f"MSG from {update.effective_user.id}: {update.message.text}")
-    await update.message.reply_text("pong")
+    # Заглушка сразу: пользователь видит реакцию, пока ход ждет очереди и модели
+    stream = MessageStream(await update.message.reply_text(PLACEHOLDER))
     # 1. ЛОГ: Видим ли мы вообще сообщение?
     print(f"📩 DEBUG: Пришло сообщение от {update.effective_user.first_name}: {update.message.text}")
 
-    # 2. Инициализация истории для конкретного пользователя (вместо глобальной)
-    if "history" not in context.user_data:
-        context.user_data["history"] = {"messages": []}
-    
-    # Получаем ссылку на историю пользователя
-    history = context.user_data["history"]
-    
-    user_text = HumanMessage(content=update.message.text)
+    chat_id = update.effective_chat.id
 
-    try:
-        # Добавляем сообщение пользователя
-        history["messages"].append(user_text)
+    @tracing.traced("agent.turn")
+    async def run_turn(text: str):
+        from langchain_core.messages import AIMessage, HumanMessage
+
+        # 2. Последние ходы чата из общего хранилища
+        user_message = HumanMessage(content=text)
+
+        # Справочные вопросы (какие отделы, кто в отделе) отвечаем без модели
+        router = importlib.import_module("backend.langchain_agent").get_router()
+        reply = await router.route(text)
+        if reply is not None:
+            tracing.current_span().set(fast_path=True)
+            await conversations.append(chat_id, [user_message, AIMessage(content=reply)])
+            return AIMessage(content=reply)
+
+        messages = await conversations.load(chat_id)
+
+        # Добавляем сообщение пользователя и укладываем историю в бюджет токенов
+        messages = memory.compact(chat_id, messages + [user_message])
 
         # Вызываем агента
         print("🤖 DEBUG: Отправляю запрос агенту...")
-        # Важно: agent.ainvoke возвращает новый стейт
-        new_history = await agent.ainvoke(history)
-        
-        # Обновляем историю в user_data
-        context.user_data["history"] = new_history
-        
+        # Потоковый ход: в сообщении видны вызовы тулов и текст ответа по мере генерации
+        new_messages = await stream_agent_turn(agent, messages, stream.set_status, stream.set_text)
+
+        # Дописываем в хранилище только новые сообщения хода
+        await conversations.append(chat_id, [user_message] + new_messages)
+
         # Получаем последний ответ
-        last_message = new_history["messages"][-1]
-        
-        # Проверка: last_message может быть объектом или строкой
-        response_text = last_message.content if hasattr(last_message, "content") else str(last_message)
+        if not new_messages or new_messages[-1].type != "ai":
+            # Поток оборвался без ответа модели (пустой поток или только ошибка тула)
+            return AIMessage(content=NO_REPLY)
+        return new_messages[-1]
+
+    try:
+        with tracing.span("telegram.message", chat_id=chat_id) as span:
+            # Ходы одного чата выполняются по очереди, быстрые досылки склеиваются в один ход
+            last_message = await scheduler.submit(chat_id, update.message.text, run_turn)
+            if last_message is None:
+                # Сообщение вошло в ход, запущенный предыдущим сообщением чата
+                span.set(coalesced=True)
+                await stream.discard()
+                return
+            
+            # Проверка: last_message может быть объектом или строкой
+            response_text = last_message.content if hasattr(last_message, "content") else str(last_message)
 
-        print(f"📤 DEBUG: Ответ агента: {response_text[:50]}...")
-        await update.message.reply_text(response_text)
+            print(f"📤 DEBUG: Ответ агента: {response_text[:50]}...")
+            with tracing.span("telegram.reply") as reply_span:
+                await stream.finish(response_text)
+                reply_span.set(edits=stream.edits)
 
     except Exception as e:
         # 3. ЛОГ: Если упало, то почему?
         print("❌ ОШИБКА В HANDLER:")
         traceback.print_exc() # Выведет полный текст ошибки в консоль
-        await update.message.reply_text(f"Внутренняя ошибка бота: {e}")
+        await stream.finish(f"Внутренняя ошибка бота: {e}")
 
 def setup_bot():
-    app = ApplicationBuilder().token(os.getenv("TG_TOKEN")).build()
+    from telegram.ext import ApplicationBuilder, CommandHandler, MessageHandler, filters
+
+    # Обновления обрабатываются параллельно, порядок внутри чата обеспечивает scheduler
+    app = ApplicationBuilder().token(os.getenv("TG_TOKEN")).concurrent_updates(True).build()
     app.add_handler(CommandHandler("start", start))
     app.add_handler(MessageHandler(filters.TEXT & ~filters.COMMAND, handle_message))
     return app
 
-# --- LIFESPAN (Самое важное) ---
-@asynccontextmanager
-async def lifespan(app: FastAPI):
-    # 1. БД
+def set_agent(new_agent):
+    # Агент пересобирается в фоне, если на MCP сервере изменились схемы тулов
+    global agent
+    agent = new_agent
+
+async def load_agent():
+    with startup.phase("agent_import"):
+        langchain_agent = importlib.import_module("backend.langchain_agent")
+        await asyncio.to_thread(langchain_agent.import_dependencies)
+    with startup.phase("agent_init"):
+        return await langchain_agent.init_agent(on_update=set_agent)
+
+async def init_database():
     async with engine.begin() as conn:
         await conn.run_sync(Base.metadata.create_all)
     print("✅ БД готова")
-    global agent
-    agent = await init_agent()
 
     print("DEBUG: Проверяю сотрудников...")
     async with SessionLocal() as session:
@@ -140,41 +198,118 @@ async def lifespan(app: FastAPI):
         else:
             print("В БД уже есть сотрудники")
 
-    # 2. Инициализация и Запуск Бота (Polling)
-    print("DEBUG: Настраиваю бота...")
-    global ptb_app
-    ptb_app = setup_bot()
-    
-    print("DEBUG: Инициализация ptb_app...")
-    await ptb_app.initialize()
-    print("DEBUG: Старт ptb_app...")
-    await ptb_app.start()
-    
-    # ⚠️ ВАЖНО: Удаляем вебхук перед поллингом (иначе ошибка 409)
-    print("DEBUG: Удаление вебхука...")
-    await ptb_app.bot.delete_webhook()
-    print("DEBUG: Вебхук удален")
+# --- LIFESPAN (Самое важное) ---
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    from telegram import Update
+
+    # Агент собирается в фоне: импорт langchain и схемы тулов (из кэша) не ждут БД и Telegram
+    agent_task = asyncio.create_task(load_agent())
+    global agent, ptb_app, dispatcher
+    try:
+        # 1. БД
+        with startup.phase("database"):
+            await init_database()
+
+        # 2. Инициализация Бота
+        print("DEBUG: Настраиваю бота...")
+        with startup.phase("bot_init"):
+            ptb_app = setup_bot()
+            print("DEBUG: Инициализация ptb_app...")
+            await ptb_app.initialize()
+            print("DEBUG: Старт ptb_app...")
+            await ptb_app.start()
+
+        with startup.phase("agent_wait"):
+            agent = await agent_task
+    except BaseException:
+        agent_task.cancel()
+        raise
     
-    # Запускаем поллинг в фоне (Updater)
-    print("🚀 Запускаю Polling...")
-    await ptb_app.updater.start_polling()
+    # 3. Прием обновлений
+    if TG_MODE == "webhook":
+        # Обновления принимает /telegram/webhook, обрабатывает диспетчер (очередь на чат)
+        dispatcher = UpdateDispatcher(ptb_app.process_update)
+        dispatcher.start()
+        print(f"🚀 Устанавливаю вебхук {TG_WEBHOOK_URL}{TG_WEBHOOK_PATH}, воркеров: {dispatcher.workers}")
+        await ptb_app.bot.set_webhook(
+            url=f"{TG_WEBHOOK_URL}{TG_WEBHOOK_PATH}",
+            secret_token=TG_WEBHOOK_SECRET or None,
+            allowed_updates=Update.ALL_TYPES,
+        )
+    else:
+        # ⚠️ ВАЖНО: Удаляем вебхук перед поллингом (иначе ошибка 409)
+        print("DEBUG: Удаление вебхука...")
+        await ptb_app.bot.delete_webhook()
+        print("DEBUG: Вебхук удален")
+        
+        # Запускаем поллинг в фоне (Updater)
+        print("🚀 Запускаю Polling...")
+        await ptb_app.updater.start_polling()
+
+    print(f"✅ Запуск за {startup.ready()} с, этапы: {startup.phases}")
 
     yield # Приложение работает
 
-    # 3. Остановка
+    # 4. Остановка
     print("🛑 Остановка бота...")
-    await ptb_app.updater.stop()
+    await importlib.import_module("backend.langchain_agent").close_agent()
+    if dispatcher is not None:
+        # Вебхук не удаляем: обновления продолжат получать другие экземпляры
+        await dispatcher.stop()
+    else:
+        await ptb_app.updater.stop()
     await ptb_app.stop()
     await ptb_app.shutdown()
 
 app = FastAPI(lifespan=lifespan)
 
-# Эндпоинт /webhook больше НЕ НУЖЕН!
 # Ваши API эндпоинты работают параллельно с ботом
 @app.get("/")
 async def root():
     return {"message": "FastAPI работает, Бот тоже работает!"}
 
+@app.post(TG_WEBHOOK_PATH)
+async def telegram_webhook(request: Request):
+    """Прием обновлений от Telegram (TG_MODE=webhook)
+
+    Обновление только проверяется и ставится в очередь, ответ уходит сразу;
+    при переполнении очереди 503 - Telegram повторит доставку позже.
+    """
+    if dispatcher is None:
+        return Response(status_code=404)
+
+    token = request.headers.get("X-Telegram-Bot-Api-Secret-Token", "")
+    if TG_WEBHOOK_SECRET and not secrets.compare_digest(token, TG_WEBHOOK_SECRET):
+        return Response(status_code=403)
+
+    from telegram import Update
+
+    try:
+        update = Update.de_json(await request.json(), ptb_app.bot)
+    except Exception as e:
+        print(f"❌ Некорректное обновление: {e}")
+        return Response(status_code=400)
+
+    chat_key = update.effective_chat.id if update.effective_chat else update.update_id
+    try:
+        dispatcher.submit(update.update_id, chat_key, update)
+    except QueueFull:
+        return Response(status_code=503)
+    return Response(status_code=200)
+
+@app.get("/stats")
+async def stats():
+    result = {"startup": startup.report(), "memory": memory.metrics(), "scheduler": scheduler.metrics()}
+    if "backend.langchain_agent" in sys.modules:
+        langchain_agent = sys.modules["backend.langchain_agent"]
+        result["tool_schema"] = langchain_agent.tool_schema
+        result["mcp_pool"] = langchain_agent.get_pool().metrics()
+        result["intent_router"] = langchain_agent.get_router().metrics()
+    if dispatcher is not None:
+        result["updates"] = dispatcher.metrics()
+    return result
+
 if __name__ == "__main__":
     import uvicorn
     uvicorn.run("backend.app:app", host="0.0.0.0", port=8002, reload=False)
@@ -0,0 +1,224 @@
+"""Индекс свободного времени сотрудников для поиска общих окон
+
+Свободное время каждого сотрудника на ближайшие AVAILABILITY_DAYS дней хранится
+строкой битов: один бит на интервал длиной AVAILABILITY_BUCKET_MINUTES. Поиск
+"первые K окон длиной D, в которые свободны хотя бы M человек" сводится к
+операциям NumPy над всей матрицей сразу: биты людей упаковываются в байты по
+каждому интервалу, скользящее И по D / bucket соседним интервалам оставляет
+тех, кто свободен все окно, а popcount считает их число. Для сотен сотрудников
+и двух недель это доли миллисекунды без единого запроса к Cal.com.
+"""
+import math
+import os
+import time
+import uuid
+from datetime import date, datetime, timedelta
+
+import numpy as np
+
+from backend.intervals import Interval
+from backend.preferences import LOCAL_TZ, Preference
+
+AVAILABILITY_BUCKET_MINUTES = int(os.getenv("AVAILABILITY_BUCKET_MINUTES", "15"))
+AVAILABILITY_DAYS = int(os.getenv("AVAILABILITY_DAYS", "14"))
+# Сколько секунд строка сотрудника считается актуальной
+AVAILABILITY_TTL = float(os.getenv("AVAILABILITY_TTL", "300"))
+
+
+def window_and(bits: np.ndarray, length: int) -> np.ndarray:
+    """Скользящее побитовое И по оси времени
+
+    Окно длины length собирается из окон длины степени двойки (удвоением),
+    поэтому операций O(log length), а не O(length).
+
+    Args:
+        bits (np.ndarray): матрица [интервалы, байты людей] (uint8)
+        length (int): длина окна в интервалах
+
+    Returns:
+        np.ndarray: матрица [интервалы - length + 1, байты людей], строка t -
+            И интервалов [t, t + length)
+    """
+    starts = bits.shape[0] - length + 1
+    if starts <= 0:
+        return np.zeros((0, bits.shape[1]), dtype=bits.dtype)
+    result = np.full((starts, bits.shape[1]), 0xFF, dtype=bits.dtype)
+    block, span, offset = bits, 1, 0
+    remaining = length
+    while remaining:
+        if remaining & 1:
+            result &= block[offset:offset + starts]
+            offset += span
+        remaining >>= 1
+        if remaining:
+            block = block[:-span] & block[span:]
+            span *= 2
+    return result
+
+
+class AvailabilityIndex:
+    """Битовые строки свободного времени сотрудников
+
+    Args:
+        bucket_minutes (int): длина интервала сетки, минуты
+        days (int): горизонт индекса в днях
+        ttl (float): время жизни строки сотрудника, секунды
+    """
+
+    def __init__(
+        self,
+        bucket_minutes: int = AVAILABILITY_BUCKET_MINUTES,
+        days: int = AVAILABILITY_DAYS,
+        ttl: float = AVAILABILITY_TTL,
+    ):
+        self.bucket = timedelta(minutes=bucket_minutes)
+        self.days = days
+        self.ttl = ttl
+        self.size = days * (timedelta(days=1) // self.bucket)
+        self.queries = 0
+        self.reset()
+
+    def reset(self, origin: date | None = None):
+        """Очистить индекс и начать сетку с полуночи origin (по умолчанию сегодня) в LOCAL_TZ"""
+        origin = origin or datetime.now(LOCAL_TZ).date()
+        self.origin = datetime.combine(origin, datetime.min.time(), LOCAL_TZ)
+        self._free = np.zeros((0, self.size), dtype=bool)
+        self._rows: dict[uuid.UUID, int] = {}
+        self._updated: dict[uuid.UUID, float] = {}
+        # Предпочтение -> интервалы сетки, в которые оно разрешает встречи
+        self._allowed: dict[Preference, np.ndarray] = {}
+
+    @property
+    def end(self) -> datetime:
+        return self.origin + timedelta(days=self.days)
+
+    def roll(self):
+        """Наступил новый день - сетка сдвигается, строки придется загрузить заново"""
+        if datetime.now(LOCAL_TZ).date() > self.origin.date():
+            self.reset()
+
+    def _position(self, moment: datetime) -> float:
+        return (moment - self.origin) / self.bucket
+
+    def _row(self, employee_id: uuid.UUID) -> int:
+        row = self._rows.get(employee_id)
+        if row is None:
+            row = self._rows[employee_id] = len(self._rows)
+            if row >= len(self._free):
+                grown = np.zeros((max(2 * len(self._free), 16), self.size), dtype=bool)
+                grown[:len(self._free)] = self._free
+                self._free = grown
+        return row
+
+    def __contains__(self, employee_id: uuid.UUID) -> bool:
+        return employee_id in self._rows
+
+    def stale(self, employee_ids: list[uuid.UUID]) -> list[uuid.UUID]:
+        """Сотрудники, строк которых нет в индексе или они устарели"""
+        now = time.monotonic()
+        return [
+            employee_id for employee_id in employee_ids
+            if now - self._updated.get(employee_id, -math.inf) > self.ttl
+        ]
+
+    def set_free(self, employee_id: uuid.UUID, intervals: list[Interval]):
+        """Заменить строку сотрудника: свободны интервалы сетки, целиком покрытые intervals"""
+        row = np.zeros(self.size, dtype=bool)
+        for start, end in intervals:
+            first = max(math.ceil(self._position(start)), 0)
+            last = min(math.floor(self._position(end)), self.size)
+            if first < last:
+                row[first:last] = True
+        # Индекс строки - до обращения к self._free: _row может заменить матрицу
+        index = self._row(employee_id)
+        self._free[index] = row
+        self._updated[employee_id] = time.monotonic()
+
+    def allowed(self, preference: Preference) -> np.ndarray:
+        """Интервалы сетки, целиком подходящие под предпочтение (кэшируется до сдвига сетки)"""
+        mask = self._allowed.get(preference)
+        if mask is None:
+            mask = np.zeros(self.size, dtype=bool)
+            for day in range(self.days):
+                for start, end in preference.day_windows(self.origin.date() + timedelta(days=day)):
+                    first = max(math.ceil(self._position(start)), 0)
+                    last = min(math.floor(self._position(end)), self.size)
+                    mask[first:last] = True
+            self._allowed[preference] = mask
+        return mask
+
+    def mark_busy(self, employee_ids: list[uuid.UUID], start: datetime, end: datetime):
+        """Отметить встречу занятой, не дожидаясь перезагрузки строк"""
+        first = max(math.floor(self._position(start)), 0)
+        last = min(math.ceil(self._position(end)), self.size)
+        if first >= last:
+            return
+        for employee_id in employee_ids:
+            row = self._rows.get(employee_id)
+            if row is not None:
+                self._free[row, first:last] = False
+
+    def earliest_windows(
+        self,
+        employee_ids: list[uuid.UUID],
+        duration_minutes: int,
+        min_free: int,
+        count: int,
+        start: datetime,
+        end: datetime,
+        preferences: list[Preference] | None = None,
+    ) -> list[tuple[datetime, datetime, np.ndarray]]:
+        """Первые count непересекающихся окон, в которые свободны хотя бы min_free сотрудников
+
+        Args:
+            employee_ids (list[uuid.UUID]): сотрудники (строки должны быть в индексе)
+            duration_minutes (int): длительность окна
+            min_free (int): минимум свободных сотрудников
+            count (int): сколько окон вернуть
+            start (datetime): окна начинаются не раньше
+            end (datetime): окна заканчиваются не позже
+            preferences (list[Preference] | None): предпочтения сотрудников в порядке
+                employee_ids: вне них сотрудник считается занятым
+
+        Returns:
+            list[tuple[datetime, datetime, np.ndarray]]: (начало, конец, маска
+                свободных сотрудников в порядке employee_ids)
+        """
+        self.queries += 1
+        length = math.ceil(timedelta(minutes=duration_minutes) / self.bucket)
+        first = max(math.ceil(self._position(start)), 0)
+        last = min(math.floor(self._position(end)), self.size)
+        if not employee_ids or length <= 0 or last - first < length:
+            return []
+
+        free = self._free[[self._rows[e] for e in employee_ids], first:last]
+        if preferences is not None and not all(p.unconstrained for p in preferences):
+            # Разных предпочтений обычно единицы: маски собираются по уникальным
+            unique = {p: i for i, p in enumerate(dict.fromkeys(preferences))}
+            allowed = np.stack([self.allowed(p)[first:last] for p in unique])
+            free &= allowed[[unique[p] for p in preferences]]
+        # [интервалы, байты людей]: бит - свободен ли сотрудник в интервале.
+        # Упаковка по непрерывной оси в разы быстрее упаковки по столбцам
+        packed = np.packbits(np.ascontiguousarray(free.T), axis=1)
+        windows = window_and(packed, length)
+        free_count = np.bitwise_count(windows).sum(axis=1, dtype=np.int32)
+        candidates = np.flatnonzero(free_count >= min_free)
+
+        found = []
+        position = 0
+        while len(found) < count and position < len(candidates):
+            offset = int(candidates[position])
+            moment = self.origin + (first + offset) * self.bucket
+            mask = np.unpackbits(windows[offset], count=len(employee_ids)).astype(bool)
+            found.append((moment, moment + length * self.bucket, mask))
+            # Следующее окно не пересекается с найденным
+            position = int(np.searchsorted(candidates, offset + length, side="left"))
+        return found
+
+    def metrics(self) -> dict:
+        return {
+            "employees": len(self._rows),
+            "origin": self.origin.date().isoformat(),
+            "buckets": self.size,
+            "queries": self.queries,
+        }
@@ -0,0 +1,321 @@
+"""Локальная копия бронирований Cal.com
+
+Таблица bookings пополняется тулом create_meeting и фоновой синхронизацией
+с Cal.com. Конфликты и занятость сотрудника проверяются одним запросом
+по индексу (employee_id, start_time), без обращения к /v1/slots.
+
+Cal.com API v1 не умеет отдавать бронирования, измененные после заданного
+момента, поэтому синхронизация запрашивает их отсортированными по updatedAt
+по убыванию и листает страницы, пока не дойдет до уже загруженных (курсор).
+Удаленные в Cal.com бронирования в такой выдаче не видны, поэтому раз
+в BOOKINGS_RECONCILE_INTERVAL синхронизация сверяет копию с календарем целиком.
+"""
+import asyncio
+import logging
+import os
+import time
+import uuid
+from datetime import datetime, timedelta, timezone
+
+from sqlalchemy import delete, select, tuple_
+from sqlalchemy.dialects.postgresql import insert
+
+from backend.calcom_client import calcom
+from backend.database import SessionLocal
+from backend.directory import directory, EmployeeRecord
+from backend.instrumentation import track_upstream
+from backend.intervals import parse_time
+from backend.preferences import as_local
+from backend.rate_limiter import Priority
+from shared_models import Booking, BookingSyncCursor
+
+logger = logging.getLogger(__name__)
+
+# BOOKINGS_MIRROR=0 отключает локальную копию (например, без БД в бенчмарке)
+BOOKINGS_MIRROR = os.getenv("BOOKINGS_MIRROR", "1") == "1"
+BOOKINGS_SYNC_INTERVAL = float(os.getenv("BOOKINGS_SYNC_INTERVAL", "60"))
+BOOKINGS_RECONCILE_INTERVAL = float(os.getenv("BOOKINGS_RECONCILE_INTERVAL", "3600"))
+SYNC_PAGE_SIZE = 100
+SYNC_MAX_PAGES = 20
+SYNC_PARALLEL = 4
+# Встречи длиннее не бывают: ограничивает диапазон индекса при поиске пересечений
+MAX_MEETING_LENGTH = timedelta(hours=24)
+INACTIVE_STATUSES = ("CANCELLED", "REJECTED")
+
+# Незаконченный проход синхронизации сотрудника: следующая страница
+# и самое новое изменение на уже пройденных страницах
+_resume: dict[uuid.UUID, tuple[int, datetime | None]] = {}
+
+
+def _changed_at(booking: dict) -> datetime | None:
+    value = booking.get("updatedAt") or booking.get("createdAt")
+    return as_local(parse_time(value)) if value else None
+
+
+def _rows(booking: dict, owner: EmployeeRecord) -> list[dict]:
+    """Строки bookings для бронирования из календаря owner: владелец и участники-сотрудники"""
+    attendees = booking.get("attendees") or []
+    participants = [owner.name] + [a.get("name") or a.get("email") for a in attendees]
+    common = {
+        "calcom_booking_id": booking["id"],
+        "title": booking.get("title") or "Meeting",
+        "start_time": as_local(parse_time(booking["startTime"])),
+        "end_time": as_local(parse_time(booking["endTime"])),
+        "status": booking.get("status") or "ACCEPTED",
+        "participants": participants,
+        "calcom_updated_at": _changed_at(booking),
+    }
+    rows = [{**common, "employee_id": owner.id, "role": "organizer"}]
+    by_email = {e.email.casefold(): e for e in directory.all() if e.email}
+    for attendee in attendees:
+        employee = by_email.get((attendee.get("email") or "").casefold())
+        if employee is not None and employee.id != owner.id:
+            rows.append({**common, "employee_id": employee.id, "role": "attendee"})
+    return rows
+
+
+async def _upsert(session, rows: list[dict]):
+    # Одна строка на ключ: ON CONFLICT не может обновить строку дважды за запрос
+    rows = list({(row["employee_id"], row["calcom_booking_id"]): row for row in rows}.values())
+    statement = insert(Booking).values(rows)
+    statement = statement.on_conflict_do_update(
+        constraint="uq_bookings_employee_id_calcom_booking_id",
+        set_={
+            column: statement.excluded[column]
+            for column in ("title", "start_time", "end_time", "status", "participants", "calcom_updated_at")
+        },
+    )
+    await session.execute(statement)
+    # Сотрудники, убранные из участников бронирования, больше не заняты им
+    await session.execute(
+        delete(Booking).where(
+            Booking.calcom_booking_id.in_({row["calcom_booking_id"] for row in rows}),
+            Booking.role == "attendee",
+            tuple_(Booking.employee_id, Booking.calcom_booking_id).not_in(
+                [(row["employee_id"], row["calcom_booking_id"]) for row in rows]
+            ),
+        )
+    )
+
+
+async def record_booking(
+    organizer: EmployeeRecord,
+    attendee: EmployeeRecord,
+    booking: dict,
+    start_time: str,
+    duration_minutes: int,
+    title: str,
+):
+    """Записать созданное тулом бронирование, не дожидаясь синхронизации"""
+    if not BOOKINGS_MIRROR or booking.get("id") is None:
+        return
+    start = as_local(parse_time(start_time))
+    data = {
+        "id": booking["id"],
+        "title": title,
+        "startTime": start.isoformat(),
+        "endTime": (start + timedelta(minutes=duration_minutes)).isoformat(),
+        "status": booking.get("status") or "ACCEPTED",
+        "attendees": [{"name": attendee.name, "email": attendee.email}],
+    }
+    try:
+        async with SessionLocal() as session:
+            async with track_upstream("db", "bookings_record"):
+                await _upsert(session, _rows(data, organizer))
+                await session.commit()
+    except Exception as e:
+        # Копия - вспомогательная: бронирование в Cal.com уже создано, синхронизация его подтянет
+        logger.error(f"Не удалось записать бронирование {booking.get('id')} в БД: {e}")
+
+
+async def find_conflicts(employee_ids: list[uuid.UUID], start: datetime, end: datetime) -> list[Booking]:
+    """Активные встречи сотрудников, пересекающиеся с [start, end)
+
+    Ограничение start_time с обеих сторон делает запрос диапазоном по индексу
+    (employee_id, start_time) для каждого сотрудника.
+    """
+    start, end = as_local(start), as_local(end)
+    query = (
+        select(Booking)
+        .where(
+            Booking.employee_id.in_(employee_ids),
+            Booking.start_time >= start - MAX_MEETING_LENGTH,
+            Booking.start_time < end,
+            Booking.end_time > start,
+            Booking.status.not_in(INACTIVE_STATUSES),
+        )
+        .order_by(Booking.start_time)
+    )
+    async with SessionLocal() as session:
+        async with track_upstream("db", "bookings_conflicts"):
+            return list((await session.execute(query)).scalars().all())
+
+
+async def employee_bookings(employee_id: uuid.UUID, start: datetime, end: datetime) -> list[Booking]:
+    """Встречи сотрудника, начинающиеся в [start, end)"""
+    query = (
+        select(Booking)
+        .where(
+            Booking.employee_id == employee_id,
+            Booking.start_time >= as_local(start),
+            Booking.start_time < as_local(end),
+            Booking.status.not_in(INACTIVE_STATUSES),
+        )
+        .order_by(Booking.start_time)
+    )
+    async with SessionLocal() as session:
+        async with track_upstream("db", "bookings_range"):
+            return list((await session.execute(query)).scalars().all())
+
+
+def describe(booking: Booking) -> dict:
+    return {
+        "title": booking.title,
+        "start": booking.start_time.isoformat(),
+        "end": booking.end_time.isoformat(),
+        "role": booking.role,
+        "participants": booking.participants,
+    }
+
+
+async def _bookings_page(employee: EmployeeRecord, page: int) -> list[dict]:
+    """Страница бронирований календаря сотрудника, от последних изменений"""
+    response = await calcom.get(
+        "/v1/bookings",
+        api_key=employee.cal_com_api_key,
+        params={"sortBy": "updatedAt", "order": "desc", "take": SYNC_PAGE_SIZE, "page": page},
+        priority=Priority.BACKGROUND,
+    )
+    response.raise_for_status()
+    return response.json().get("bookings", [])
+
+
+async def _delete_missing(session, employee: EmployeeRecord, listed: set[int], since: datetime | None) -> int:
+    """Удалить бронирования календаря сотрудника, которых нет в выдаче Cal.com
+
+    Выдача отсортирована по updatedAt, поэтому в ней есть все существующие
+    бронирования, измененные не раньше since (None - выдача полная). Время
+    изменения только растет: строка, измененная не раньше since и не попавшая
+    в выдачу, удалена в Cal.com.
+    """
+    query = select(Booking.calcom_booking_id).where(
+        Booking.employee_id == employee.id,
+        Booking.role == "organizer",
+        Booking.calcom_booking_id.not_in(listed),
+    )
+    if since is not None:
+        query = query.where(Booking.calcom_updated_at >= since)
+    missing = list((await session.execute(query)).scalars().all())
+    if missing:
+        # Вместе со строками участников-сотрудников
+        await session.execute(delete(Booking).where(Booking.calcom_booking_id.in_(missing)))
+    return len(missing)
+
+
+async def sync_employee(employee: EmployeeRecord, reconcile: bool = False) -> int:
+    """Загрузить бронирования календаря сотрудника, измененные после курсора
+
+    Если за SYNC_MAX_PAGES страниц курсор не достигнут, курсор остается
+    прежним, а следующий запуск продолжает со следующей страницы: иначе
+    изменения между последней пройденной страницей и курсором потерялись бы.
+    Новые изменения только сдвигают выдачу вниз, так что при продолжении
+    страницы могут повториться, но не пропуститься.
+
+    Args:
+        employee (EmployeeRecord): сотрудник
+        reconcile (bool): пролистать календарь дальше курсора и удалить из копии
+            бронирования, которых в Cal.com больше нет
+
+    Returns:
+        int: количество загруженных бронирований
+    """
+    async with SessionLocal() as session:
+        async with track_upstream("db", "bookings_cursor"):
+            state = await session.get(BookingSyncCursor, employee.id)
+    cursor = state.cursor if state else None
+
+    first_page, newest = _resume.pop(employee.id, (1, cursor))
+    if reconcile:
+        first_page, newest = 1, cursor
+
+    changed: list[dict] = []
+    listed: set[int] = set()
+    oldest: datetime | None = None
+    exhausted = caught_up = False
+    for page in range(first_page, first_page + SYNC_MAX_PAGES):
+        items = await _bookings_page(employee, page)
+        for booking in items:
+            changed_at = _changed_at(booking)
+            listed.add(booking["id"])
+            if changed_at is not None and (oldest is None or changed_at < oldest):
+                oldest = changed_at
+            # Фильтр "изменено после курсора" - на нашей стороне
+            if cursor is not None and changed_at is not None and changed_at < cursor:
+                caught_up = True
+                if not reconcile:
+                    continue
+            changed.append(booking)
+            if changed_at is not None and (newest is None or changed_at > newest):
+                newest = changed_at
+        if len(items) < SYNC_PAGE_SIZE:
+            exhausted = caught_up = True
+            break
+        if caught_up and not reconcile:
+            break
+    if not caught_up:
+        _resume[employee.id] = (page + 1, newest)
+        logger.info(f"Синхронизация {employee.name} продолжится со страницы {page + 1}")
+
+    deleted = 0
+    async with SessionLocal() as session:
+        async with track_upstream("db", "bookings_sync"):
+            rows = [row for booking in changed for row in _rows(booking, employee)]
+            if rows:
+                await _upsert(session, rows)
+            # Сверка идет по выдаче с первой страницы: при продолжении начало ее не видно
+            if reconcile and first_page == 1 and (exhausted or oldest is not None):
+                deleted = await _delete_missing(session, employee, listed, None if exhausted else oldest)
+            statement = insert(BookingSyncCursor).values(
+                employee_id=employee.id,
+                cursor=newest if caught_up else cursor
+            )
+            await session.execute(statement.on_conflict_do_update(
+                index_elements=[BookingSyncCursor.employee_id],
+                set_={"cursor": statement.excluded.cursor, "synced_at": datetime.now(timezone.utc)},
+            ))
+            await session.commit()
+    if deleted:
+        logger.info(f"Удалено из копии бронирований {employee.name}: {deleted}")
+    return len(changed)
+
+
+async def sync_all(reconcile: bool = False) -> int:
+    """Синхронизировать календари всех сотрудников справочника"""
+    await directory.ensure_loaded()
+    semaphore = asyncio.Semaphore(SYNC_PARALLEL)
+
+    async def sync(employee: EmployeeRecord) -> int:
+        async with semaphore:
+            try:
+                return await sync_employee(employee, reconcile)
+            except Exception as e:
+                logger.error(f"Не удалось синхронизировать бронирования {employee.name}: {e}")
+                return 0
+
+    return sum(await asyncio.gather(*(sync(e) for e in directory.all())))
+
+
+async def run_sync_loop(interval: float = BOOKINGS_SYNC_INTERVAL):
+    """Фоновая задача: периодическая инкрементальная синхронизация и сверка"""
+    reconciled_at = None
+    while True:
+        reconcile = reconciled_at is None or time.monotonic() - reconciled_at >= BOOKINGS_RECONCILE_INTERVAL
+        try:
+            changed = await sync_all(reconcile)
+            if reconcile:
+                reconciled_at = time.monotonic()
+            if changed:
+                logger.info(f"Синхронизировано бронирований: {changed}")
+        except Exception as e:
+            logger.error(f"Синхронизация бронирований не удалась: {e}")
+        await asyncio.sleep(interval)
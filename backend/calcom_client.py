@@ -0,0 +1,202 @@
+import asyncio
+import os
+import logging
+
+import httpx
+from dotenv import load_dotenv
+
+from backend.instrumentation import track_upstream
+from backend.metrics import REGISTRY
+from backend.rate_limiter import (
+    CALCOM_MAX_RETRIES,
+    CALCOM_MAX_RETRY_AFTER,
+    RETRIES,
+    Priority,
+    RateLimiter,
+    backoff_delay,
+    parse_retry_after,
+)
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+CAL_COM_URL = os.getenv("CALCOM_HOST", "https://api.cal.com")
+
+# Настройки пула соединений и таймаутов (можно переопределить через .env)
+CALCOM_MAX_CONNECTIONS = int(os.getenv("CALCOM_MAX_CONNECTIONS", "50"))
+CALCOM_MAX_KEEPALIVE = int(os.getenv("CALCOM_MAX_KEEPALIVE", "20"))
+CALCOM_KEEPALIVE_EXPIRY = float(os.getenv("CALCOM_KEEPALIVE_EXPIRY", "30"))
+CALCOM_CONNECT_TIMEOUT = float(os.getenv("CALCOM_CONNECT_TIMEOUT", "5"))
+CALCOM_READ_TIMEOUT = float(os.getenv("CALCOM_READ_TIMEOUT", "10"))
+CALCOM_POOL_TIMEOUT = float(os.getenv("CALCOM_POOL_TIMEOUT", "5"))
+
+# Ответы, после которых запрос можно повторить
+RETRY_STATUSES = {429, 502, 503, 504}
+# Для неидемпотентных запросов (создание брони) - только если сервер точно его не выполнил
+UNSAFE_RETRY_STATUSES = {429, 503}
+# Ошибки, при которых запрос не был отправлен: повторять безопасно любой метод
+NOT_SENT_ERRORS = (httpx.ConnectError, httpx.ConnectTimeout, httpx.PoolTimeout)
+
+try:
+    import h2  # noqa: F401
+    HTTP2_AVAILABLE = True
+except ImportError:
+    HTTP2_AVAILABLE = False
+
+
+class CalComError(Exception):
+    """Cal.com вернул неуспешный ответ"""
+
+    def __init__(self, status_code: int, details: str):
+        super().__init__(f"Cal.com API error: {status_code}")
+        self.status_code = status_code
+        self.details = details
+
+
+class CalComClient:
+    """Асинхронный клиент Cal.com с общим пулом keep-alive соединений
+
+    Все запросы к Cal.com идут через один httpx.AsyncClient, поэтому
+    соединения переиспользуются между вызовами тулов и не блокируют event loop.
+    Так как все запросы идут на один хост, лимит соединений пула
+    одновременно является лимитом на хост.
+
+    Частота запросов ограничивается корзинами токенов на API ключ и на хост
+    (см. backend.rate_limiter), ответы 429/5xx и сбои соединения повторяются
+    с экспоненциальной задержкой.
+    """
+
+    def __init__(
+        self,
+        base_url: str = CAL_COM_URL,
+        max_connections: int = CALCOM_MAX_CONNECTIONS,
+        max_keepalive_connections: int = CALCOM_MAX_KEEPALIVE,
+        keepalive_expiry: float = CALCOM_KEEPALIVE_EXPIRY,
+        timeout: httpx.Timeout | None = None,
+        http2: bool = HTTP2_AVAILABLE,
+    ):
+        self.base_url = base_url
+        self.limits = httpx.Limits(
+            max_connections=max_connections,
+            max_keepalive_connections=max_keepalive_connections,
+            keepalive_expiry=keepalive_expiry,
+        )
+        self.timeout = timeout or httpx.Timeout(
+            connect=CALCOM_CONNECT_TIMEOUT,
+            read=CALCOM_READ_TIMEOUT,
+            write=CALCOM_READ_TIMEOUT,
+            pool=CALCOM_POOL_TIMEOUT,
+        )
+        self.http2 = http2
+        self._client: httpx.AsyncClient | None = None
+        self.limiter = RateLimiter()
+
+    @property
+    def client(self) -> httpx.AsyncClient:
+        if self._client is None or self._client.is_closed:
+            self._client = httpx.AsyncClient(
+                base_url=self.base_url,
+                limits=self.limits,
+                timeout=self.timeout,
+                http2=self.http2,
+            )
+            logger.info(
+                f"Cal.com client: {self.base_url}, http2={self.http2}, "
+                f"max_connections={self.limits.max_connections}"
+            )
+        return self._client
+
+    async def request(
+        self,
+        method: str,
+        path: str,
+        api_key: str,
+        params: dict | None = None,
+        json: dict | None = None,
+        priority: Priority = Priority.DEFAULT,
+    ) -> httpx.Response:
+        """Выполнить запрос к Cal.com API
+
+        Args:
+            method (str): HTTP метод
+            path (str): путь, например "/v1/slots"
+            api_key (str): ключ доступа к календарю сотрудника
+            params (dict, optional): query-параметры. Defaults to None.
+            json (dict, optional): тело запроса. Defaults to None.
+            priority (Priority, optional): полоса очереди при троттлинге. Defaults to Priority.DEFAULT.
+
+        Returns:
+            httpx.Response: ответ Cal.com (после исчерпания повторов - последний полученный)
+        """
+        query = {"apiKey": api_key}
+        if params:
+            query.update({k: v for k, v in params.items() if v is not None})
+        idempotent = method in ("GET", "HEAD", "OPTIONS")
+        retry_statuses = RETRY_STATUSES if idempotent else UNSAFE_RETRY_STATUSES
+
+        for attempt in range(CALCOM_MAX_RETRIES + 1):
+            await self.limiter.acquire(api_key, priority)
+            try:
+                async with track_upstream("calcom", f"{method} {path}") as call:
+                    response = await self.client.request(method, path, params=query, json=json)
+                    call.status = str(response.status_code)
+            except NOT_SENT_ERRORS as e:
+                error, reason, retry_after = e, type(e).__name__, None
+            except (httpx.TimeoutException, httpx.TransportError) as e:
+                # Запрос мог дойти до Cal.com: повторяем только чтение
+                if not idempotent:
+                    raise
+                error, reason, retry_after = e, type(e).__name__, None
+            else:
+                if response.status_code not in retry_statuses:
+                    if response.status_code < 400:
+                        self.limiter.succeeded(api_key)
+                    return response
+                error, reason = None, str(response.status_code)
+                retry_after = parse_retry_after(response.headers.get("Retry-After"))
+                if response.status_code == 429:
+                    self.limiter.throttled(api_key, retry_after or backoff_delay(attempt))
+
+            delay = backoff_delay(attempt, retry_after)
+            if attempt == CALCOM_MAX_RETRIES or delay > CALCOM_MAX_RETRY_AFTER:
+                if error is not None:
+                    raise error
+                return response
+            RETRIES.inc(reason=reason)
+            logger.warning(f"Cal.com {method} {path}: {reason}, повтор {attempt + 1} через {delay:.2f} с")
+            await asyncio.sleep(delay)
+
+    async def get(
+        self,
+        path: str,
+        api_key: str,
+        params: dict | None = None,
+        priority: Priority = Priority.DEFAULT,
+    ) -> httpx.Response:
+        return await self.request("GET", path, api_key, params=params, priority=priority)
+
+    async def post(
+        self,
+        path: str,
+        api_key: str,
+        params: dict | None = None,
+        json: dict | None = None,
+        priority: Priority = Priority.DEFAULT,
+    ) -> httpx.Response:
+        return await self.request("POST", path, api_key, params=params, json=json, priority=priority)
+
+    async def aclose(self):
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+
+calcom = CalComClient()
+
+REGISTRY.gauge(
+    "calcom_throttle_waiting",
+    "Запросы к Cal.com, ожидающие токена",
+    ("lane",),
+    lambda: calcom.limiter.waiting(),
+)
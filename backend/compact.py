@@ -0,0 +1,99 @@
+"""Компактные результаты тулов для контекста модели
+
+Результат тула попадает в историю диалога и повторно отправляется модели на каждом
+следующем ходе. Поэтому по умолчанию тулы отдают сжатую форму: свободные слоты -
+диапазонами по дням в местном времени, бронирование - только то, что нужно для
+ответа пользователю. Полная форма доступна по флагу detail.
+"""
+import os
+from datetime import timedelta
+
+from backend.intervals import merge_intervals, parse_time
+from backend.preferences import LOCAL_TZ
+
+# Сколько диапазонов свободного времени отдавать модели в компактном ответе
+COMPACT_MAX_RANGES = int(os.getenv("COMPACT_MAX_RANGES", "40"))
+
+
+def slot_ranges(
+    slots: dict[str, list[dict]],
+    duration_minutes: int,
+    max_ranges: int = COMPACT_MAX_RANGES,
+) -> tuple[dict[str, list[str]], bool]:
+    """Слоты Cal.com ({дата: [{"time": ...}]}) в диапазоны по дням
+
+    Соседние и пересекающиеся слоты склеиваются: слоты 10:00, 10:30, 11:00 по
+    30 минут дают диапазон "10:00-11:30". Начать встречу можно не в любую минуту
+    диапазона, а только на сетке слотов: от начала диапазона с шагом slot_step.
+
+    Args:
+        slots (dict[str, list[dict]]): слоты Cal.com по дням
+        duration_minutes (int): длительность слота
+        max_ranges (int): максимум диапазонов в ответе
+
+    Returns:
+        tuple[dict[str, list[str]], bool]: {"YYYY-MM-DD": ["HH:MM-HH:MM", ...]}
+            в LOCAL_TZ и признак того, что диапазоны обрезаны
+    """
+    duration = timedelta(minutes=duration_minutes)
+    intervals = merge_intervals([
+        (parse_time(slot["time"]), parse_time(slot["time"]) + duration)
+        for day_slots in slots.values()
+        for slot in day_slots
+    ])
+
+    days: dict[str, list[str]] = {}
+    for start, end in intervals[:max_ranges]:
+        local_start = start.astimezone(LOCAL_TZ)
+        local_end = end.astimezone(LOCAL_TZ)
+        # Диапазон через полночь помечаем датой окончания
+        end_label = local_end.strftime("%H:%M")
+        if local_end.date() != local_start.date():
+            end_label = local_end.strftime("%Y-%m-%d %H:%M")
+        days.setdefault(local_start.date().isoformat(), []).append(f"{local_start:%H:%M}-{end_label}")
+    return days, len(intervals) > max_ranges
+
+
+def slot_step(slots: dict[str, list[dict]], duration_minutes: int) -> int:
+    """Шаг сетки начал слотов в минутах (наименьший промежуток между соседними слотами)"""
+    starts = sorted({parse_time(slot["time"]) for day_slots in slots.values() for slot in day_slots})
+    gaps = [(b - a) // timedelta(minutes=1) for a, b in zip(starts, starts[1:])]
+    return min((gap for gap in gaps if gap > 0), default=duration_minutes)
+
+
+def compact_slots(employee: str, slots: dict[str, list[dict]], duration_minutes: int) -> dict:
+    """Компактный ответ free_slots"""
+    ranges, truncated = slot_ranges(slots, duration_minutes)
+    result = {
+        "employee": employee,
+        "duration_minutes": duration_minutes,
+        "timezone": str(LOCAL_TZ),
+        "free": ranges,
+        # Встреча начинается только на сетке слотов, а не в любую минуту диапазона
+        "start_step_minutes": slot_step(slots, duration_minutes),
+        "total_slots": sum(len(day_slots) for day_slots in slots.values()),
+    }
+    if truncated:
+        result["truncated"] = f"показаны первые {COMPACT_MAX_RANGES} диапазонов: сузьте даты или передайте detail=true"
+    return result
+
+
+def compact_booking(booking: dict) -> dict:
+    """Компактный ответ create_meeting: ошибка как есть, иначе суть бронирования"""
+    if "error" in booking:
+        return {"success": False, **booking}
+    meeting = booking["meeting"]
+    start = parse_time(meeting["start_time"])
+    # Время без часового пояса оставляем как передала модель
+    if start.tzinfo is not None:
+        start = start.astimezone(LOCAL_TZ)
+    return {
+        "success": True,
+        "booking_id": meeting.get("booking_id"),
+        "title": meeting["title"],
+        "start": start.strftime("%Y-%m-%d %H:%M"),
+        "timezone": str(start.tzinfo or LOCAL_TZ),
+        "duration_minutes": meeting["duration_minutes"],
+        "organizer": booking["organizer"]["name"],
+        "attendee": booking["attendee"]["name"],
+    }
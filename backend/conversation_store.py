@@ -0,0 +1,144 @@
+from __future__ import annotations
+
+import os
+from collections import defaultdict
+from typing import TYPE_CHECKING, Hashable, Protocol
+
+from sqlalchemy import func, insert, select
+
+from backend.database import SessionLocal
+from backend.instrumentation import track_upstream
+from shared_models import ConversationMessage
+
+if TYPE_CHECKING:
+    from langchain_core.messages import BaseMessage
+
+CONVERSATION_STORE = os.getenv("CONVERSATION_STORE", "postgres")
+# Сколько последних ходов поднимать из хранилища; дальше историю режет memory.compact
+HISTORY_LOAD_TURNS = int(os.getenv("HISTORY_LOAD_TURNS", "20"))
+
+# Поля, которые не нужны для повторной отправки истории в модель
+_DROPPED_FIELDS = {"type", "response_metadata", "usage_metadata", "artifact", "id"}
+
+
+def serialize_message(message: BaseMessage) -> dict:
+    """Компактное представление сообщения: без пустых полей и метаданных ответа модели"""
+    from langchain_core.messages import message_to_dict
+
+    data = message_to_dict(message)["data"]
+    compact = {}
+    for key, value in data.items():
+        if key in _DROPPED_FIELDS or value in (None, "", [], {}):
+            continue
+        if key == "status" and value == "success":
+            continue
+        if key == "additional_kwargs":
+            value = {k: v for k, v in value.items() if v is not None}
+            if not value:
+                continue
+        if key == "tool_calls":
+            value = [{k: v for k, v in call.items() if k != "type"} for call in value]
+        compact[key] = value
+    compact.setdefault("content", "")
+    return compact
+
+
+def deserialize_message(role: str, payload: dict) -> BaseMessage:
+    from langchain_core.messages import messages_from_dict
+
+    return messages_from_dict([{"type": role, "data": payload}])[0]
+
+
+def recent_window(messages: list[BaseMessage], turns: int) -> list[BaseMessage]:
+    """Последние turns ходов (ход начинается с сообщения пользователя)"""
+    starts = [i for i, m in enumerate(messages) if m.type == "human"]
+    if len(starts) <= turns:
+        return messages
+    return messages[starts[-turns]:]
+
+
+class ConversationStore(Protocol):
+    """Хранилище истории диалогов агента"""
+
+    async def load(self, conversation_id: Hashable) -> list[BaseMessage]:
+        """Последние ходы диалога в хронологическом порядке"""
+        ...
+
+    async def append(self, conversation_id: Hashable, messages: list[BaseMessage]) -> None:
+        """Дописать новые сообщения в конец диалога"""
+        ...
+
+
+class InMemoryConversationStore:
+    """История в памяти процесса (консоль, тесты, один воркер без БД)"""
+
+    def __init__(self, load_turns: int = HISTORY_LOAD_TURNS):
+        self.load_turns = load_turns
+        self._messages: dict[str, list[BaseMessage]] = defaultdict(list)
+
+    async def load(self, conversation_id: Hashable) -> list[BaseMessage]:
+        return recent_window(list(self._messages[str(conversation_id)]), self.load_turns)
+
+    async def append(self, conversation_id: Hashable, messages: list[BaseMessage]) -> None:
+        self._messages[str(conversation_id)].extend(messages)
+
+
+class PostgresConversationStore:
+    """История в Postgres: общая для всех воркеров бота и переживает рестарты
+
+    Сообщения только дописываются в conversation_messages. При загрузке
+    поднимаются лишь строки начиная с load_turns-го с конца сообщения
+    пользователя - по индексу (conversation_id, id), без чтения всего диалога.
+    """
+
+    def __init__(self, session_factory=SessionLocal, load_turns: int = HISTORY_LOAD_TURNS):
+        self.session_factory = session_factory
+        self.load_turns = load_turns
+
+    async def load(self, conversation_id: Hashable) -> list[BaseMessage]:
+        conversation_id = str(conversation_id)
+        window_start = (
+            select(ConversationMessage.id)
+            .where(
+                ConversationMessage.conversation_id == conversation_id,
+                ConversationMessage.role == "human",
+            )
+            .order_by(ConversationMessage.id.desc())
+            .offset(self.load_turns - 1)
+            .limit(1)
+            .scalar_subquery()
+        )
+        query = (
+            select(ConversationMessage.role, ConversationMessage.payload)
+            .where(
+                ConversationMessage.conversation_id == conversation_id,
+                # Если ходов меньше load_turns - весь диалог
+                ConversationMessage.id >= func.coalesce(window_start, 0),
+            )
+            .order_by(ConversationMessage.id)
+        )
+        async with self.session_factory() as session:
+            async with track_upstream("db", "conversation_load"):
+                rows = (await session.execute(query)).all()
+        return [deserialize_message(role, payload) for role, payload in rows]
+
+    async def append(self, conversation_id: Hashable, messages: list[BaseMessage]) -> None:
+        if not messages:
+            return
+        rows = [
+            {"conversation_id": str(conversation_id), "role": m.type, "payload": serialize_message(m)}
+            for m in messages
+        ]
+        async with self.session_factory() as session:
+            async with track_upstream("db", "conversation_append"):
+                await session.execute(insert(ConversationMessage), rows)
+                await session.commit()
+
+
+def create_store(kind: str = CONVERSATION_STORE) -> ConversationStore:
+    """Хранилище по имени: postgres или memory"""
+    if kind == "memory":
+        return InMemoryConversationStore()
+    if kind == "postgres":
+        return PostgresConversationStore()
+    raise ValueError(f"Неизвестное хранилище диалогов: {kind}")
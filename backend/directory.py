@@ -0,0 +1,179 @@
+import asyncio
+import logging
+import os
+
+from sqlalchemy import select, text
+
+from backend.database import SessionLocal
+from backend.instrumentation import track_upstream
+from backend.name_index import NameIndex
+from shared_models import Employee
+
+logger = logging.getLogger(__name__)
+
+DIRECTORY_REFRESH_INTERVAL = float(os.getenv("DIRECTORY_REFRESH_INTERVAL", "30"))
+
+# Нечеткое совпадение считается однозначным, если оценка не ниже порога
+# и лучший кандидат заметно опережает второго
+RESOLVE_MIN_SCORE = 0.75
+RESOLVE_MIN_MARGIN = 0.15
+
+# Дешевый "отпечаток" таблицы: меняется при любом изменении строк
+VERSION_QUERY = text(
+    "SELECT md5(coalesce(string_agg(e::text, '|' ORDER BY e.id), '')) FROM employees e"
+)
+
+
+def normalize_name(name: str) -> str:
+    """Привести имя к виду для поиска без учета регистра и лишних пробелов"""
+    return " ".join(name.casefold().replace("ё", "е").split())
+
+
+class EmployeeRecord:
+    """Компактная неизменяемая копия строки Employee для справочника"""
+
+    __slots__ = (
+        "id",
+        "name",
+        "email",
+        "position",
+        "department",
+        "preference",
+        "cal_com_username",
+        "cal_com_api_key",
+    )
+
+    def __init__(self, employee: Employee):
+        for field in self.__slots__:
+            object.__setattr__(self, field, getattr(employee, field))
+
+    def __setattr__(self, name, value):
+        raise AttributeError("EmployeeRecord is read-only")
+
+    def as_dict(self) -> dict:
+        data = {field: getattr(self, field) for field in self.__slots__}
+        data["id"] = str(self.id)
+        return data
+
+    def __repr__(self) -> str:
+        return f"EmployeeRecord(name={self.name!r}, department={self.department!r})"
+
+
+class EmployeeDirectory:
+    """Справочник сотрудников в памяти процесса
+
+    Таблица employees маленькая и меняется редко, поэтому она целиком
+    загружается при старте MCP сервера, а тулы читают ее без запросов к БД.
+    Актуальность поддерживается периодической проверкой версии таблицы.
+    """
+
+    def __init__(self):
+        self.version: str | None = None
+        self._by_name: dict[str, EmployeeRecord] = {}
+        self._by_folded: dict[str, EmployeeRecord] = {}
+        self._by_department: dict[str, list[EmployeeRecord]] = {}
+        self._names = NameIndex()
+        self._lock = asyncio.Lock()
+        self._loaded = False
+
+    @property
+    def loaded(self) -> bool:
+        return self._loaded
+
+    def replace(self, records: list[EmployeeRecord], version: str | None = None):
+        """Атомарно заменить содержимое справочника"""
+        by_name = {}
+        by_folded = {}
+        by_department: dict[str, list[EmployeeRecord]] = {}
+        for record in records:
+            by_name[record.name] = record
+            by_folded.setdefault(normalize_name(record.name), record)
+            by_department.setdefault(record.department, []).append(record)
+
+        self._by_name = by_name
+        self._by_folded = by_folded
+        self._by_department = by_department
+        self._names = NameIndex(records)
+        self.version = version
+        self._loaded = True
+
+    async def load(self):
+        """Загрузить всех сотрудников из БД"""
+        async with self._lock:
+            async with SessionLocal() as session:
+                async with track_upstream("db", "employees_version"):
+                    version = (await session.execute(VERSION_QUERY)).scalar_one()
+                async with track_upstream("db", "employees_load"):
+                    result = await session.execute(select(Employee))
+                records = [EmployeeRecord(e) for e in result.scalars().all()]
+            self.replace(records, version)
+        logger.info(f"Справочник сотрудников загружен: {len(records)} записей")
+
+    async def ensure_loaded(self):
+        if not self._loaded:
+            await self.load()
+
+    async def refresh_if_changed(self) -> bool:
+        """Перезагрузить справочник, если таблица employees изменилась
+
+        Returns:
+            bool: был ли справочник перезагружен
+        """
+        async with SessionLocal() as session:
+            async with track_upstream("db", "employees_version"):
+                version = (await session.execute(VERSION_QUERY)).scalar_one()
+        if version == self.version:
+            return False
+        await self.load()
+        return True
+
+    async def run_refresh_loop(self, interval: float = DIRECTORY_REFRESH_INTERVAL):
+        """Фоновая задача: периодически проверять версию таблицы"""
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                await self.refresh_if_changed()
+            except Exception as e:
+                logger.error(f"Не удалось обновить справочник сотрудников: {e}")
+
+    def get(self, name: str) -> EmployeeRecord | None:
+        """Найти сотрудника по точному имени, затем без учета регистра"""
+        return self._by_name.get(name) or self._by_folded.get(normalize_name(name))
+
+    def search(self, query: str, limit: int = 5) -> list[tuple[EmployeeRecord, float]]:
+        """Нечеткий поиск сотрудников по имени (триграммы, префиксы, транслитерация)"""
+        return self._names.search(query, limit)
+
+    def resolve(self, name: str) -> tuple[EmployeeRecord | None, list[tuple[EmployeeRecord, float]]]:
+        """Найти сотрудника по имени, допуская неточное написание
+
+        Returns:
+            tuple: найденный сотрудник (или None, если совпадение неоднозначно)
+                и список кандидатов с оценками
+        """
+        record = self.get(name)
+        if record:
+            return record, [(record, 1.0)]
+
+        candidates = self.search(name)
+        if candidates:
+            best_score = candidates[0][1]
+            second_score = candidates[1][1] if len(candidates) > 1 else 0.0
+            if best_score >= RESOLVE_MIN_SCORE and best_score - second_score >= RESOLVE_MIN_MARGIN:
+                return candidates[0][0], candidates
+        return None, candidates
+
+    def departments(self) -> list[str]:
+        return sorted(self._by_department)
+
+    def by_department(self, department: str) -> list[EmployeeRecord]:
+        return list(self._by_department.get(department, []))
+
+    def all(self) -> list[EmployeeRecord]:
+        return list(self._by_name.values())
+
+    def __len__(self) -> int:
+        return len(self._by_name)
+
+
+directory = EmployeeDirectory()
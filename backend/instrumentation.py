@@ -0,0 +1,57 @@
+"""Замеры обращений к Cal.com и БД
+
+Модуль не зависит от fastmcp, поэтому его можно импортировать и в процессе бота.
+"""
+import time
+from contextlib import asynccontextmanager
+from contextvars import ContextVar
+
+from backend import tracing
+from backend.metrics import REGISTRY
+
+UPSTREAM_DURATION = REGISTRY.histogram(
+    "upstream_request_duration_seconds", "Длительность запросов к Cal.com и БД", ("service", "operation")
+)
+UPSTREAM_CALLS = REGISTRY.counter(
+    "upstream_requests_total", "Количество запросов к Cal.com и БД", ("service", "operation", "status")
+)
+
+UPSTREAM_SERVICES = ("calcom", "db")
+
+# Счетчики обращений к внешним сервисам в рамках текущего вызова тула
+upstream_counts: ContextVar[dict[str, int] | None] = ContextVar("upstream_counts", default=None)
+
+
+class UpstreamCall:
+    """Результат запроса к внешнему сервису (статус можно уточнить внутри блока)"""
+
+    __slots__ = ("status",)
+
+    def __init__(self):
+        self.status = "ok"
+
+
+@asynccontextmanager
+async def track_upstream(service: str, operation: str):
+    """Замерить запрос к внешнему сервису
+
+    Args:
+        service (str): "calcom" или "db"
+        operation (str): операция, например "GET /v1/slots"
+    """
+    call = UpstreamCall()
+    counts = upstream_counts.get()
+    if counts is not None:
+        counts[service] = counts.get(service, 0) + 1
+
+    started = time.perf_counter()
+    try:
+        with tracing.span(f"{service} {operation}", kind="client") as span:
+            yield call
+            span.set(status=call.status)
+    except Exception as e:
+        call.status = type(e).__name__
+        raise
+    finally:
+        UPSTREAM_DURATION.observe(time.perf_counter() - started, service=service, operation=operation)
+        UPSTREAM_CALLS.inc(service=service, operation=operation, status=call.status)
@@ -0,0 +1,208 @@
+"""Быстрые ответы на справочные вопросы без обращения к модели
+
+"Какие есть отделы?" или "Кто в отделе AI?" не требуют рассуждений: достаточно
+одного вызова тула и шаблонного ответа. Роутер распознает такие вопросы правилами
+(ключевые слова и названия отделов из справочника) и отвечает сам, только если
+в сообщении нет ничего, кроме запроса списка. Все остальное (имена сотрудников,
+уточнения, в первую очередь диалоги о встречах) отдает агенту.
+"""
+import json
+import logging
+import re
+import time
+from typing import Any, Awaitable, Callable
+
+from backend.name_index import name_key
+
+logger = logging.getLogger(__name__)
+
+# Как долго доверять загруженному списку отделов, секунды
+DEPARTMENTS_TTL = 300.0
+
+# Признаки планирования: такие сообщения всегда обрабатывает агент
+SCHEDULING_WORDS = (
+    "встреч", "созвон", "звонок", "бронир", "заброн", "заплан", "заняты", "назнач",
+    "слот", "свобод", "время", "времен", "когда", "завтра", "сегодня", "недел",
+    "перенес", "отмен", "meet", "call", "book", "schedul", "slot", "free", "time",
+)
+DEPARTMENT_WORDS = ("отдел", "департамент", "подразделен", "department", "dept", "team", "команд")
+LIST_WORDS = ("какие", "какой", "список", "перечисл", "все ", "всех", "покажи", "назови", "есть ли", "list", "which", "what", "all ")
+MEMBER_WORDS = ("кто", "сотрудник", "состав", "работа", "люди", "человек", "список", "who", "member", "people", "employee", "staff")
+
+# Словарь чистого запроса списка: сообщение из одних этих слов и названий отделов
+# роутер отвечает сам. Любое другое слово (имя сотрудника, "руководитель", "старше")
+# уточняет вопрос, и список отделов или сотрудников на него не ответ
+QUERY_WORDS = {
+    "какие", "какой", "каких", "кто", "все", "всех", "весь", "есть", "ли", "в", "во", "у", "нас",
+    "а", "и", "мне", "пожалуйста", "список", "покажи", "покажите", "назови", "назовите",
+    "перечисли", "перечислите", "работает", "работают", "входит", "входят", "люди", "людей",
+    "человек", "состав",
+    "what", "which", "who", "is", "are", "there", "in", "the", "of", "our", "we", "do", "does",
+    "have", "has", "list", "show", "me", "all", "please", "tell", "a", "on", "work", "works",
+    "people", "staff",
+}
+# Основы слов с падежными формами; на них не начинаются имена сотрудников
+QUERY_STEMS = (
+    "отдел", "департамент", "подразделен", "команд", "сотрудник", "компани",
+    "department", "team", "employee", "member", "compan",
+)
+
+LIST_DEPARTMENTS = "list_departments"
+DEPARTMENT_MEMBERS = "department_members"
+
+
+def _normalize(text: str) -> str:
+    return " ".join(re.sub(r"[^\w]+", " ", text.casefold()).split()) + " "
+
+
+def _contains(text: str, words: tuple[str, ...]) -> bool:
+    return any(word in text for word in words)
+
+
+def is_pure_list_query(normalized: str, departments: list[str]) -> bool:
+    """Состоит ли сообщение только из слов запроса списка и названий отделов departments"""
+    department_words = {word for department in departments for word in name_key(department).split()}
+    return all(
+        token in QUERY_WORDS or token.startswith(QUERY_STEMS) or name_key(token) in department_words
+        for token in normalized.split()
+    )
+
+
+def is_candidate(text: str) -> bool:
+    """Может ли сообщение быть справочным вопросом (без обращения к справочнику)"""
+    normalized = _normalize(text)
+    return not _contains(normalized, SCHEDULING_WORDS) and (
+        _contains(normalized, DEPARTMENT_WORDS) or _contains(normalized, MEMBER_WORDS)
+    )
+
+
+def classify(text: str, departments: list[str]) -> tuple[str, str | None] | None:
+    """Распознать справочный вопрос
+
+    Args:
+        text (str): Сообщение пользователя
+        departments (list[str]): Названия отделов из справочника
+
+    Returns:
+        tuple[str, str | None] | None: (интент, отдел) или None, если сообщение
+            нужно отдать агенту
+    """
+    normalized = _normalize(text)
+    if _contains(normalized, SCHEDULING_WORDS):
+        return None
+
+    # Название отдела ищем по ключу имени: регистр и раскладка ("AI", "ai", "Аи") не важны
+    key = f" {name_key(text)} "
+    mentioned = [d for d in departments if name_key(d) and f" {name_key(d)} " in key]
+    # Несколько отделов в одном вопросе - это сравнение или уточнение, его ведет агент
+    if len(mentioned) > 1:
+        return None
+    # "Какой отдел у Николая?", "Кто руководитель отдела Sales?" - не запрос списка
+    if not is_pure_list_query(normalized, mentioned):
+        return None
+
+    if mentioned and _contains(normalized, MEMBER_WORDS):
+        return DEPARTMENT_MEMBERS, mentioned[0]
+    if not mentioned and _contains(normalized, DEPARTMENT_WORDS) and _contains(normalized, LIST_WORDS):
+        return LIST_DEPARTMENTS, None
+    return None
+
+
+def tool_result(result: Any) -> Any:
+    """Значение из ответа tools/call (CallToolResult)
+
+    Raises:
+        RuntimeError: тул завершился ошибкой
+    """
+    if result.isError:
+        text = " ".join(getattr(block, "text", "") for block in result.content)
+        raise RuntimeError(text or "ошибка вызова тула")
+    if result.structuredContent is not None:
+        # FastMCP оборачивает не-объектные результаты в {"result": ...}
+        return result.structuredContent.get("result", result.structuredContent)
+    texts = [block.text for block in result.content if getattr(block, "text", None) is not None]
+    if len(texts) == 1:
+        try:
+            return json.loads(texts[0])
+        except ValueError:
+            return texts[0]
+    return texts
+
+
+class IntentRouter:
+    """Справочные ответы напрямую из тулов MCP сервера
+
+    Args:
+        call_tool (Callable): вызов тула, совместимый с ClientSession.call_tool
+    """
+
+    def __init__(self, call_tool: Callable[..., Awaitable[Any]]):
+        self.call_tool = call_tool
+        self._departments: list[str] = []
+        self._loaded_at = 0.0
+        self.hits: dict[str, int] = {LIST_DEPARTMENTS: 0, DEPARTMENT_MEMBERS: 0}
+        self.misses = 0
+        self.errors = 0
+
+    async def _tool(self, name: str, arguments: dict | None = None) -> Any:
+        return tool_result(await self.call_tool(name, arguments or {}))
+
+    async def departments(self) -> list[str]:
+        """Список отделов (кэшируется на DEPARTMENTS_TTL секунд)"""
+        if not self._departments or time.monotonic() - self._loaded_at > DEPARTMENTS_TTL:
+            self._departments = list(await self._tool("get_all_departments"))
+            self._loaded_at = time.monotonic()
+        return self._departments
+
+    async def route(self, text: str) -> str | None:
+        """Ответ на справочный вопрос
+
+        Returns:
+            str | None: готовый ответ или None, если сообщение нужно отдать агенту
+        """
+        if not is_candidate(text):
+            self.misses += 1
+            return None
+        try:
+            departments = await self.departments()
+            intent = classify(text, departments)
+            if intent is None:
+                self.misses += 1
+                return None
+
+            kind, department = intent
+            if kind == LIST_DEPARTMENTS:
+                reply = self._format_departments(departments)
+            else:
+                members = await self._tool("get_all_employees_from_department", {"department": department})
+                reply = self._format_members(department, members)
+        except Exception as e:
+            # Справочник недоступен - агент разберется сам (или объяснит пользователю)
+            self.errors += 1
+            logger.warning(f"Быстрый ответ не удался, передаю агенту: {e}")
+            return None
+
+        self.hits[kind] += 1
+        return reply
+
+    @staticmethod
+    def _format_departments(departments: list[str]) -> str:
+        if not departments:
+            return "В справочнике пока нет ни одного отдела."
+        lines = "\n".join(f"• {name}" for name in departments)
+        return f"В компании {len(departments)} отдел(ов):\n{lines}"
+
+    @staticmethod
+    def _format_members(department: str, members: list[str]) -> str:
+        if not members:
+            return f"В отделе {department} пока нет сотрудников."
+        lines = "\n".join(f"• {name}" for name in members)
+        return f"Сотрудники отдела {department} ({len(members)}):\n{lines}"
+
+    def metrics(self) -> dict:
+        return {
+            "hits": dict(self.hits),
+            "misses": self.misses,
+            "errors": self.errors,
+            "departments": len(self._departments),
+        }
@@ -0,0 +1,77 @@
+from datetime import datetime, timedelta
+
+Interval = tuple[datetime, datetime]
+
+
+def parse_time(value: str) -> datetime:
+    """Разобрать время Cal.com в формате ISO 8601 (в т.ч. с суффиксом Z)"""
+    return datetime.fromisoformat(value.replace('Z', '+00:00'))
+
+
+def merge_intervals(intervals: list[Interval]) -> list[Interval]:
+    """Объединить пересекающиеся и смежные интервалы
+
+    Args:
+        intervals (list[Interval]): интервалы (start, end) в любом порядке
+
+    Returns:
+        list[Interval]: отсортированные непересекающиеся интервалы
+    """
+    merged: list[Interval] = []
+    for start, end in sorted(intervals):
+        if merged and start <= merged[-1][1]:
+            if end > merged[-1][1]:
+                merged[-1] = (merged[-1][0], end)
+        else:
+            merged.append((start, end))
+    return merged
+
+
+def intersect_intervals(a: list[Interval], b: list[Interval]) -> list[Interval]:
+    """Пересечение двух отсортированных списков непересекающихся интервалов
+
+    Классический проход двумя указателями за O(len(a) + len(b)).
+    """
+    result: list[Interval] = []
+    i = j = 0
+    while i < len(a) and j < len(b):
+        start = max(a[i][0], b[j][0])
+        end = min(a[i][1], b[j][1])
+        if start < end:
+            result.append((start, end))
+        # Сдвигаем тот интервал, который заканчивается раньше
+        if a[i][1] < b[j][1]:
+            i += 1
+        else:
+            j += 1
+    return result
+
+
+def subtract_intervals(a: list[Interval], b: list[Interval]) -> list[Interval]:
+    """Части интервалов a, не покрытые b (оба списка отсортированы и не пересекаются)"""
+    result: list[Interval] = []
+    j = 0
+    for start, end in a:
+        # Интервалы b, закончившиеся до начала текущего, больше не понадобятся
+        while j < len(b) and b[j][1] <= start:
+            j += 1
+        k = j
+        while k < len(b) and b[k][0] < end:
+            if start < b[k][0]:
+                result.append((start, b[k][0]))
+            start = max(start, b[k][1])
+            k += 1
+        if start < end:
+            result.append((start, end))
+    return result
+
+
+def slots_to_intervals(slots: dict[str, list[dict]], duration_minutes: int) -> list[Interval]:
+    """Превратить слоты Cal.com ({дата: [{"time": ...}]}) в свободные интервалы"""
+    duration = timedelta(minutes=duration_minutes)
+    intervals = []
+    for day_slots in slots.values():
+        for slot in day_slots:
+            start = parse_time(slot["time"])
+            intervals.append((start, start + duration))
+    return merge_intervals(intervals)
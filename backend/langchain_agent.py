@@ -1,20 +1,24 @@
 import asyncio
+import importlib
 import os
+import time
 from datetime import datetime
+from functools import cache
+from typing import Callable
 
-from langchain_openai import ChatOpenAI
-from langchain_mcp_adapters.client import MultiServerMCPClient
-from langchain.agents import create_agent
-from langchain.messages import SystemMessage, HumanMessage, AIMessage
 from dotenv import load_dotenv
-import sys
+
+from backend import tool_cache, tracing
+from backend.memory import memory
 
 load_dotenv()
 
-# Импортируем адаптеры для MCP
-from langchain_mcp_adapters.tools import load_mcp_tools
+# Тяжелые модули (langchain_openai, langchain_mcp_adapters, langchain.agents)
+# импортируются при первой сборке агента, а не при импорте этого модуля
 
-MODEL_NAME = "Qwen/Qwen3-235B-A22B-Instruct-2507"
+MODEL_NAME = os.getenv("LLM_MODEL", "Qwen/Qwen3-235B-A22B-Instruct-2507")
+LLM_BASE_URL = os.getenv("LLM_BASE_URL", "https://foundation-models.api.cloud.ru/v1/")
+MCP_SERVER_URL = os.getenv("MCP_SERVER_URL", "http://127.0.0.1:8007/mcp")
 
 SYSTEM_PROMPT = \
 f"""
@@ -25,48 +29,216 @@ f"""
     2. Текущая дата: {datetime.now().strftime("%Y-%m-%d")}. Все относительные даты ("завтра", "через неделю") считай от неё. Также ВСЕГДА передавай дату ровно в таком же формате.
     3. Для бронирования ОБЯЗАТЕЛЬНО узнай имена обоих пользователей, чтобы получить их свободные слоты из базы данных соответствующим тулом. Если пользователь не предоставил их - спроси.
        После этого запланируй встречу соответствующим тулом.
+       Чтобы найти время, удобное сразу нескольким сотрудникам, используй тул common_free_slots вместо сравнения слотов вручную.
+       Для встречи целого отдела или большой группы (или если достаточно, чтобы пришли не все) используй тул team_free_windows.
+       Тулы поиска времени уже учитывают предпочтения сотрудников (поле preference): подходящее время идет первым (у free_slots - в free, остальное - в outside_preference; у окон - fits_preferences), не запрашивай предпочтения отдельно.
+       Рядом с разобранными ограничениями (preference_parsed) в ответе есть исходный текст предпочтения (preference): если они расходятся, опирайся на текст. Если подходящего времени нет, предложи время вне предпочтений.
+       Если сотрудник не найден по имени, уточни его через тул find_employee, прежде чем переспрашивать пользователя.
+       Тул create_meeting ставит встречу в очередь и сразу отвечает status=pending с request_id. Чтобы подтвердить пользователю создание встречи, вызови booking_status с этим request_id (wait_seconds=5). Не вызывай create_meeting повторно из-за статуса pending: повтор с теми же параметрами не создаст вторую встречу.
     4. При каждом новом обращении о проверке свободных слотов ОБЯЗАТЕЛЬНО делай это с помощью соответствующего тула.
 """
 
 
 
-client = MultiServerMCPClient(
-    {
-        "Office manager": {
-            "transport": "http",
-            "url": "http://127.0.0.1:8007/mcp",
-        }
-    }
-)
+SERVER_NAME = "Office manager"
+# Как часто сверять кэш схем тулов с MCP сервером, секунды
+TOOLS_REFRESH_INTERVAL = float(os.getenv("TOOLS_REFRESH_INTERVAL", "300"))
 
-model = ChatOpenAI(
-    base_url="https://foundation-models.api.cloud.ru/v1/",
-    api_key=os.getenv("AI_API_KEY"),
-    model=MODEL_NAME,
-    temperature=0.1,
-    max_tokens=10000,
-    timeout=30
+# Откуда и какой версии схемы тулов у текущего агента (для /stats)
+tool_schema = {"source": None, "version": None, "tools": 0}
+_watch_task: asyncio.Task | None = None
+
+
+# Модули, которые агент импортирует при первой сборке
+AGENT_MODULES = (
+    "langchain.agents",
+    "langchain_mcp_adapters.sessions",
+    "langchain_mcp_adapters.tools",
+    "langchain_openai",
+    "backend.agent_tracing",
+    "backend.intent_router",
+    "backend.mcp_pool",
 )
 
 
-async def init_agent():
-    tools = await client.get_tools()
-    # print("Tools loaded successully! Available:", tools)
-    agent = create_agent(model, tools, system_prompt=SystemMessage(SYSTEM_PROMPT))
+def import_dependencies():
+    """Импорт тяжелых модулей агента заранее (например, в отдельном потоке при запуске)"""
+    for name in AGENT_MODULES:
+        importlib.import_module(name)
+
+
+def mcp_connection() -> dict:
+    from backend.agent_tracing import traced_http_client
+
+    return {
+        "transport": "http",
+        "url": MCP_SERVER_URL,
+        # traceparent в каждом запросе к MCP серверу
+        "httpx_client_factory": traced_http_client,
+    }
+
+
+@cache
+def get_pool():
+    """Пул долгоживущих сеансов с MCP сервером для всех вызовов тулов агента"""
+    from backend.mcp_pool import MCPSessionPool
+
+    return MCPSessionPool(mcp_connection())
+
+
+@cache
+def get_router():
+    """Быстрые ответы на справочные вопросы без модели (через тот же пул сеансов)"""
+    from backend.intent_router import IntentRouter
+
+    return IntentRouter(get_pool().call_tool)
+
+
+@cache
+def get_model():
+    from langchain_openai import ChatOpenAI
+
+    return ChatOpenAI(
+        base_url=LLM_BASE_URL,
+        api_key=os.getenv("AI_API_KEY"),
+        model=MODEL_NAME,
+        temperature=0.1,
+        max_tokens=10000,
+        timeout=30
+    )
+
+
+async def fetch_tool_schemas() -> list[dict]:
+    """Схемы тулов с MCP сервера (через сеанс из пула)"""
+    schemas = []
+    cursor = None
+    while True:
+        page = await get_pool().list_tools(cursor=cursor)
+        schemas.extend(t.model_dump(mode="json", exclude_none=True) for t in page.tools)
+        cursor = page.nextCursor
+        if not cursor:
+            break
+    return schemas
 
+
+def build_agent(schemas: list[dict]):
+    """Агент по схемам тулов; вызовы тулов идут через пул сеансов с MCP сервером"""
+    from langchain.agents import create_agent
+    from langchain.messages import SystemMessage
+    from langchain_mcp_adapters.tools import convert_mcp_tool_to_langchain_tool
+    from mcp.types import Tool
+
+    from backend.agent_tracing import AgentTracingCallback
+
+    # Пул реализует call_tool как ClientSession и подставляется вместо сеанса
+    pool = get_pool()
+    tools = [
+        convert_mcp_tool_to_langchain_tool(pool, Tool.model_validate(schema), server_name=SERVER_NAME)
+        for schema in schemas
+    ]
+    agent = create_agent(get_model(), tools, system_prompt=SystemMessage(SYSTEM_PROMPT))
+    # Спаны шагов модели и вызовов тулов
+    return agent.with_config(callbacks=[AgentTracingCallback()])
+
+
+async def watch_tool_schemas(version: str, on_update: Callable, delay: float):
+    """Фоновая сверка схем тулов: при смене версии на сервере пересобрать агента"""
+    while True:
+        await asyncio.sleep(delay)
+        delay = TOOLS_REFRESH_INTERVAL
+        try:
+            schemas = await fetch_tool_schemas()
+        except Exception as e:
+            print(f"Не удалось проверить схемы тулов MCP сервера: {e}")
+            continue
+
+        new_version = tool_cache.schema_version(schemas)
+        tool_schema["source"] = "server"
+        if new_version == version:
+            continue
+        tool_cache.save(MCP_SERVER_URL, schemas)
+        on_update(build_agent(schemas))
+        print(f"Схемы тулов изменились ({version} -> {new_version}), агент пересобран")
+        version = new_version
+        tool_schema.update(version=version, tools=len(schemas))
+
+
+async def init_agent(on_update: Callable | None = None):
+    """Собрать агента
+
+    Схемы тулов берутся из кэша на диске, а если его нет - с MCP сервера.
+
+    Args:
+        on_update (Callable | None): если передан, в фоне периодически сверяет
+            схемы с сервером и при изменении вызывает on_update(новый агент)
+    """
+    global _watch_task
+    started = time.perf_counter()
+    cached = tool_cache.load(MCP_SERVER_URL)
+    if cached:
+        schemas, version = cached
+        source = "cache"
+    else:
+        schemas = await fetch_tool_schemas()
+        version = tool_cache.save(MCP_SERVER_URL, schemas)
+        source = "server"
+
+    agent = build_agent(schemas)
+    tool_schema.update(source=source, version=version, tools=len(schemas))
+    print(
+        f"Агент собран за {time.perf_counter() - started:.2f} с: "
+        f"{len(schemas)} тулов из {'кэша' if source == 'cache' else 'MCP сервера'}, версия схем {version}"
+    )
+
+    if on_update is not None:
+        # Схемы из кэша проверяем сразу, полученные с сервера - через интервал
+        delay = 0 if source == "cache" else TOOLS_REFRESH_INTERVAL
+        _watch_task = asyncio.create_task(watch_tool_schemas(version, on_update, delay))
     return agent
 
+
+def stop_tool_watch():
+    if _watch_task is not None:
+        _watch_task.cancel()
+
+
+async def close_agent():
+    """Остановить фоновую сверку схем и закрыть сеансы с MCP сервером"""
+    stop_tool_watch()
+    await get_pool().close()
+
 async def main():
-    agent = await init_agent()
+    from langchain.messages import AIMessage, HumanMessage
+
+    from backend.conversation_store import create_store
+
+    def set_agent(new_agent):
+        nonlocal agent
+        agent = new_agent
+
+    tracing.init_tracing("agent-console")
+    started = time.perf_counter()
+    agent = await init_agent(on_update=set_agent)
+    print(f"Запуск занял {time.perf_counter() - started:.2f} с")
     print(f"Agent {MODEL_NAME} initialized successfuly!")
-    history = {"messages": []}
+    conversations = create_store()
     while True:
         print()
-        user_message = HumanMessage(input("...> "))
-        history["messages"].append(user_message)
-        history = await agent.ainvoke(history)
+        # input в отдельном потоке, чтобы фоновая сверка схем тулов не стояла
+        user_message = HumanMessage(await asyncio.to_thread(input, "...> "))
+        with tracing.span("console.turn"):
+            # Справочные вопросы (отделы, состав отдела) - без модели
+            reply = await get_router().route(user_message.content)
+            if reply is not None:
+                await conversations.append("console", [user_message, AIMessage(reply)])
+                print("ai:", reply)
+                continue
+            messages = await conversations.load("console")
+            messages = memory.compact("console", messages + [user_message])
+            history = await agent.ainvoke({"messages": messages})
+        await conversations.append("console", [user_message] + history["messages"][len(messages):])
         response = history["messages"][-1]
-        print(f"ai:", response.content)
+        print("ai:", response.content)
         
 if __name__ == "__main__":
     asyncio.run(main())
\ No newline at end of file
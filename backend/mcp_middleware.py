@@ -0,0 +1,100 @@
+"""Middleware FastMCP: латентность, ошибки и число внешних запросов каждого тула"""
+import logging
+import re
+import time
+
+from fastmcp.server.dependencies import get_http_headers
+from fastmcp.server.middleware import Middleware, MiddlewareContext
+
+from backend import tracing
+from backend.instrumentation import UPSTREAM_SERVICES, upstream_counts
+from backend.metrics import REGISTRY
+
+logger = logging.getLogger(__name__)
+
+TOOL_DURATION = REGISTRY.histogram(
+    "mcp_tool_duration_seconds", "Длительность вызова MCP тула", ("tool",)
+)
+TOOL_CALLS = REGISTRY.counter(
+    "mcp_tool_calls_total", "Количество вызовов MCP тулов", ("tool", "status")
+)
+TOOL_ERRORS = REGISTRY.counter(
+    "mcp_tool_errors_total", "Ошибки MCP тулов по классам", ("tool", "error_class")
+)
+TOOL_UPSTREAM = REGISTRY.histogram(
+    "mcp_tool_upstream_calls",
+    "Количество обращений к внешним сервисам за один вызов тула",
+    ("tool", "service"),
+    buckets=(0, 1, 2, 3, 4, 6, 10, 20, 50),
+)
+
+_STATUS_CODE = re.compile(r"\b([45]\d\d)\b")
+
+
+def classify_error(error) -> str:
+    """Класс ошибки из поля "error" результата тула"""
+    text = str(error)
+    if "Cal.com" in text:
+        match = _STATUS_CODE.search(text)
+        return f"calcom_{match.group(1)}" if match else "calcom"
+    if "не найден" in text:
+        return "not_found"
+    if "ожидания" in text:
+        return "timeout"
+    return "tool_error"
+
+
+def find_error(content) -> str | None:
+    """Найти ошибку в структурированном результате тула (в т.ч. во вложенных бронированиях)"""
+    if not isinstance(content, dict):
+        return None
+    if "error" in content:
+        return content["error"]
+    bookings = content.get("bookings")
+    if isinstance(bookings, dict):
+        for booking in bookings.values():
+            if isinstance(booking, dict) and "error" in booking:
+                return booking["error"]
+    return None
+
+
+class ToolMetricsMiddleware(Middleware):
+    """Middleware FastMCP: латентность, ошибки и число внешних запросов каждого тула"""
+
+    async def on_call_tool(self, context: MiddlewareContext, call_next):
+        tool = context.message.name
+        counts: dict[str, int] = {}
+        token = upstream_counts.set(counts)
+        started = time.perf_counter()
+        status = "ok"
+        # Продолжаем трассу агента: traceparent приходит в _meta запроса (пул сеансов)
+        # или в HTTP заголовке (отдельный сеанс на вызов)
+        request_context = context.fastmcp_context.request_context if context.fastmcp_context else None
+        meta = request_context.meta if request_context else None
+        traceparent = getattr(meta, "traceparent", None) or get_http_headers().get("traceparent")
+        span = tracing.start_span(f"mcp.tool {tool}", traceparent, kind="server")
+        span_token = tracing.activate(span)
+        try:
+            result = await call_next(context)
+            error = find_error(getattr(result, "structured_content", None))
+            if error is not None:
+                status = "error"
+                TOOL_ERRORS.inc(tool=tool, error_class=classify_error(error))
+                span.record_error(str(error))
+            return result
+        except Exception as e:
+            status = "exception"
+            TOOL_ERRORS.inc(tool=tool, error_class=type(e).__name__)
+            span.record_error(e)
+            raise
+        finally:
+            upstream_counts.reset(token)
+            tracing.deactivate(span_token)
+            duration = time.perf_counter() - started
+            TOOL_DURATION.observe(duration, tool=tool)
+            TOOL_CALLS.inc(tool=tool, status=status)
+            for service in UPSTREAM_SERVICES:
+                TOOL_UPSTREAM.observe(counts.get(service, 0), tool=tool, service=service)
+                span.set(**{f"{service}_calls": counts.get(service, 0)})
+            span.finish()
+            logger.info(f"{tool}: {duration * 1000:.1f} мс, статус {status}, внешние запросы {counts}")
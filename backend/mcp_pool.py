@@ -0,0 +1,209 @@
+"""Пул долгоживущих сеансов с MCP сервером
+
+Без пула langchain_mcp_adapters на каждый вызов тула открывает новый сеанс:
+initialize, notifications/initialized, tools/call и DELETE - четыре HTTP запроса
+вместо одного. Пул держит несколько сеансов открытыми, проверяет их ping'ом,
+переподключает упавшие и отдает вызов наименее загруженному сеансу.
+"""
+import asyncio
+import logging
+import os
+from typing import Any
+
+from mcp import ClientSession
+from mcp.shared.exceptions import McpError
+
+from backend import tracing
+
+logger = logging.getLogger(__name__)
+
+MCP_POOL_SIZE = int(os.getenv("MCP_POOL_SIZE", "4"))
+MCP_PING_INTERVAL = float(os.getenv("MCP_PING_INTERVAL", "30"))
+MCP_PING_TIMEOUT = 5.0
+MCP_CONNECT_TIMEOUT = float(os.getenv("MCP_CONNECT_TIMEOUT", "10"))
+RECONNECT_MIN_DELAY = 0.5
+RECONNECT_MAX_DELAY = 10.0
+
+
+def _root_error(error: BaseException) -> BaseException:
+    """Первая исходная ошибка из (вложенных) групп исключений anyio"""
+    while isinstance(error, BaseExceptionGroup) and error.exceptions:
+        error = error.exceptions[0]
+    return error
+
+
+class _PooledSession:
+    """Сеанс в отдельной задаче: контекст create_session должен открываться и закрываться в одной задаче"""
+
+    def __init__(self, pool: "MCPSessionPool", index: int):
+        self.pool = pool
+        self.index = index
+        self.session: ClientSession | None = None
+        self.in_flight = 0
+        self.ready = asyncio.Event()
+        # Устанавливается, когда текущее соединение закрылось: запросы в нем больше не завершатся
+        self.closed = asyncio.Event()
+        self._broken = asyncio.Event()
+        self.task = asyncio.create_task(self._run(), name=f"mcp-session-{index}")
+
+    def mark_broken(self, reason: str):
+        if self.session is not None and not self._broken.is_set():
+            logger.warning(f"MCP сеанс {self.index} будет переоткрыт: {reason}")
+            self._broken.set()
+
+    async def _run(self):
+        from langchain_mcp_adapters.sessions import create_session
+
+        delay = RECONNECT_MIN_DELAY
+        while True:
+            self.closed = asyncio.Event()
+            try:
+                async with create_session(self.pool.connection) as session:
+                    await session.initialize()
+                    self.session = session
+                    self.ready.set()
+                    self.pool.connects += 1
+                    delay = RECONNECT_MIN_DELAY
+                    await self._broken.wait()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                error = _root_error(e)
+                logger.warning(f"MCP сеанс {self.index}: ошибка соединения: {type(error).__name__}: {error}")
+            finally:
+                self.session = None
+                self.ready.clear()
+                self._broken.clear()
+                self.closed.set()
+
+            await asyncio.sleep(delay)
+            delay = min(delay * 2, RECONNECT_MAX_DELAY)
+
+
+class MCPSessionPool:
+    """Пул сеансов с одним MCP сервером
+
+    Args:
+        connection (dict): конфигурация подключения langchain_mcp_adapters
+        size (int): количество сеансов
+        ping_interval (float): период проверки простаивающих сеансов, секунды
+    """
+
+    def __init__(self, connection: dict, size: int = MCP_POOL_SIZE, ping_interval: float = MCP_PING_INTERVAL):
+        self.connection = connection
+        self.size = size
+        self.ping_interval = ping_interval
+        self._sessions: list[_PooledSession] = []
+        self._health_task: asyncio.Task | None = None
+        self.calls = 0
+        self.failures = 0
+        self.connects = 0
+
+    def _ensure_started(self):
+        if not self._sessions:
+            self._sessions = [_PooledSession(self, i) for i in range(self.size)]
+            self._health_task = asyncio.create_task(self._health_loop(), name="mcp-pool-health")
+
+    async def _acquire(self) -> _PooledSession:
+        """Наименее загруженный открытый сеанс; если открытых нет - ждем первый"""
+        self._ensure_started()
+        ready = [s for s in self._sessions if s.ready.is_set()]
+        if not ready:
+            waiters = [asyncio.create_task(s.ready.wait()) for s in self._sessions]
+            try:
+                await asyncio.wait(waiters, timeout=MCP_CONNECT_TIMEOUT, return_when=asyncio.FIRST_COMPLETED)
+            finally:
+                for waiter in waiters:
+                    waiter.cancel()
+            ready = [s for s in self._sessions if s.ready.is_set()]
+            if not ready:
+                raise ConnectionError(f"Нет соединения с MCP сервером за {MCP_CONNECT_TIMEOUT:.0f} с")
+        return min(ready, key=lambda s: s.in_flight)
+
+    async def _request(self, method: str, *args, **kwargs) -> Any:
+        pooled = await self._acquire()
+        pooled.in_flight += 1
+        request = asyncio.ensure_future(getattr(pooled.session, method)(*args, **kwargs))
+        closed = asyncio.ensure_future(pooled.closed.wait())
+        try:
+            # Если соединение оборвется, ответ на запрос не придет никогда - не ждем его
+            await asyncio.wait((request, closed), return_when=asyncio.FIRST_COMPLETED)
+            if not request.done():
+                raise ConnectionError("Соединение с MCP сервером закрылось во время запроса")
+            return request.result()
+        except McpError as e:
+            # Ошибка протокола (неизвестный тул, неверные аргументы) - сеанс исправен,
+            # кроме случая, когда сервер забыл сеанс (например, после перезапуска)
+            if "terminated" in str(e).lower():
+                pooled.mark_broken(str(e))
+            raise
+        except Exception as e:
+            # Вызовы тулов не повторяем: бронирование могло уже выполниться
+            self.failures += 1
+            pooled.mark_broken(f"{type(e).__name__}: {e}")
+            raise
+        finally:
+            request.cancel()
+            closed.cancel()
+            pooled.in_flight -= 1
+
+    async def call_tool(
+        self,
+        name: str,
+        arguments: dict[str, Any] | None = None,
+        read_timeout_seconds=None,
+        progress_callback=None,
+        *,
+        meta: dict[str, Any] | None = None,
+    ):
+        """Вызов тула на одном из сеансов пула (интерфейс ClientSession.call_tool)"""
+        self.calls += 1
+        with tracing.span(f"mcp.call {name}", kind="client") as span:
+            # HTTP запросы идут из задачи сеанса, поэтому traceparent передаем в _meta запроса
+            meta = {**(meta or {}), "traceparent": span.traceparent}
+            return await self._request(
+                "call_tool",
+                name,
+                arguments,
+                read_timeout_seconds=read_timeout_seconds,
+                progress_callback=progress_callback,
+                meta=meta,
+            )
+
+    async def list_tools(self, cursor: str | None = None):
+        return await self._request("list_tools", cursor=cursor)
+
+    async def _health_loop(self):
+        """Ping простаивающих сеансов: поддерживает соединение и находит мертвые сеансы"""
+        while True:
+            await asyncio.sleep(self.ping_interval)
+            for pooled in self._sessions:
+                session = pooled.session
+                if session is None or pooled.in_flight:
+                    continue
+                try:
+                    await asyncio.wait_for(session.send_ping(), MCP_PING_TIMEOUT)
+                except asyncio.CancelledError:
+                    raise
+                except Exception as e:
+                    pooled.mark_broken(f"ping: {type(e).__name__}: {e}")
+
+    async def close(self):
+        tasks = [s.task for s in self._sessions]
+        if self._health_task is not None:
+            tasks.append(self._health_task)
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        self._sessions = []
+        self._health_task = None
+
+    def metrics(self) -> dict:
+        return {
+            "size": self.size,
+            "ready": sum(1 for s in self._sessions if s.ready.is_set()),
+            "in_flight": [s.in_flight for s in self._sessions],
+            "calls": self.calls,
+            "failures": self.failures,
+            "connects": self.connects,
+        }
@@ -0,0 +1,194 @@
+from __future__ import annotations
+
+import json
+import os
+from typing import TYPE_CHECKING, Hashable
+
+if TYPE_CHECKING:
+    # langchain импортируется только вместе с агентом: бот стартует без него
+    from langchain_core.messages import BaseMessage, ToolMessage
+
+HISTORY_MAX_TOKENS = int(os.getenv("HISTORY_MAX_TOKENS", "8000"))
+HISTORY_RECENT_TURNS = int(os.getenv("HISTORY_RECENT_TURNS", "4"))
+TOOL_SUMMARY_CHARS = 200
+
+# Грубая оценка: для смеси кириллицы и JSON ~3 символа на токен
+CHARS_PER_TOKEN = 3
+
+COMPRESSED_MARK = "[сжато] "
+
+
+def message_text(message: BaseMessage) -> str:
+    """Текст сообщения (content бывает строкой или списком блоков)"""
+    content = message.content
+    if isinstance(content, str):
+        return content
+    parts = []
+    for block in content:
+        if isinstance(block, str):
+            parts.append(block)
+        elif isinstance(block, dict) and "text" in block:
+            parts.append(str(block["text"]))
+    return "\n".join(parts)
+
+
+def estimate_tokens(message: BaseMessage) -> int:
+    size = len(message_text(message))
+    for call in getattr(message, "tool_calls", None) or []:
+        size += len(call.get("name", "")) + len(json.dumps(call.get("args", {}), ensure_ascii=False))
+    return size // CHARS_PER_TOKEN + 4
+
+
+def summarize_tool_output(text: str) -> str:
+    """Короткое описание результата тула вместо полного JSON"""
+    try:
+        data = json.loads(text)
+    except ValueError:
+        data = None
+
+    if isinstance(data, dict):
+        if "error" in data:
+            return f"ошибка: {str(data['error'])[:TOOL_SUMMARY_CHARS]}"
+        if "free" in data:
+            # Компактный ответ free_slots: диапазоны по дням, начало - на сетке слотов
+            ranges = "; ".join(f"{day}: {', '.join(spans)}" for day, spans in data["free"].items())
+            if len(ranges) > TOOL_SUMMARY_CHARS:
+                ranges = ranges[:TOOL_SUMMARY_CHARS] + "…"
+            summary = (
+                f"{data.get('employee')}: {data.get('total_slots')} слотов по {data.get('duration_minutes')} мин, "
+                f"начало каждые {data.get('start_step_minutes')} мин от начала диапазона ({ranges or 'нет'})"
+            )
+            if data.get("outside_preference"):
+                summary += f"; вне предпочтения \"{data.get('preference')}\" есть еще слоты в {len(data['outside_preference'])} дн."
+            return summary
+        if "total_slots" in data:
+            date_range = data.get("date_range", {})
+            days = ", ".join(sorted(data.get("slots", {}))[:7])
+            return (
+                f"{data.get('employee')}: {data['total_slots']} слотов по {data.get('duration_minutes')} мин "
+                f"({date_range.get('from')} - {date_range.get('to')}; дни: {days})"
+            )
+        if "windows" in data:
+            best = data["windows"][0]["start"] if data["windows"] else "нет"
+            return f"{data.get('total_windows', len(data['windows']))} общих окон для {data.get('employees')}, лучшее: {best}"
+        if "bookings" in data or "summary" in data:
+            return f"бронирование: {json.dumps(data.get('summary', data.get('success')), ensure_ascii=False)}"
+
+    text = " ".join(text.split())
+    if len(text) > TOOL_SUMMARY_CHARS:
+        return text[:TOOL_SUMMARY_CHARS] + "…"
+    return text
+
+
+def compress_tool_message(message: ToolMessage) -> ToolMessage:
+    text = message_text(message)
+    from langchain_core.messages import ToolMessage
+
+    if text.startswith(COMPRESSED_MARK):
+        return message
+    return ToolMessage(
+        content=COMPRESSED_MARK + summarize_tool_output(text),
+        tool_call_id=message.tool_call_id,
+        name=message.name,
+        id=message.id,
+    )
+
+
+def split_turns(messages: list[BaseMessage]) -> tuple[list[BaseMessage], list[list[BaseMessage]]]:
+    """Разбить историю на системные сообщения и ходы (ход начинается с HumanMessage)"""
+    system = []
+    turns: list[list[BaseMessage]] = []
+    for message in messages:
+        if message.type == "system" and not turns:
+            system.append(message)
+        elif message.type == "human" or not turns:
+            turns.append([message])
+        else:
+            turns[-1].append(message)
+    return system, turns
+
+
+class ConversationMemory:
+    """Ограничение истории диалога по бюджету токенов
+
+    Системный промпт и последние ходы сохраняются дословно, результаты тулов
+    в старых ходах заменяются короткими сводками, а самые старые ходы
+    вытесняются, пока история не уложится в бюджет. Удаляются только целые
+    ходы, поэтому пары "вызов тула - результат" не разрываются.
+    """
+
+    def __init__(
+        self,
+        max_tokens: int = HISTORY_MAX_TOKENS,
+        recent_turns: int = HISTORY_RECENT_TURNS,
+    ):
+        self.max_tokens = max_tokens
+        self.recent_turns = recent_turns
+        self._stats: dict[Hashable, dict] = {}
+
+    def compact(self, user_id: Hashable, messages: list[BaseMessage]) -> list[BaseMessage]:
+        """Сжать историю пользователя перед отправкой в модель
+
+        Args:
+            user_id (Hashable): идентификатор пользователя/чата для метрик
+            messages (list[BaseMessage]): полная история
+
+        Returns:
+            list[BaseMessage]: история, укладывающаяся в бюджет токенов
+        """
+        system, turns = split_turns(messages)
+        split = max(len(turns) - self.recent_turns, 0)
+        old, recent = turns[:split], turns[split:]
+
+        compressed = 0
+        for turn in old:
+            for i, message in enumerate(turn):
+                if message.type == "tool" and not message_text(message).startswith(COMPRESSED_MARK):
+                    turn[i] = compress_tool_message(message)
+                    compressed += 1
+
+        budget = self.max_tokens - sum(estimate_tokens(m) for m in system)
+        evicted = 0
+        kept = old + recent
+        total = sum(estimate_tokens(m) for turn in kept for m in turn)
+        # Вытесняем старые ходы, последний ход оставляем всегда
+        while total > budget and len(kept) > 1:
+            total -= sum(estimate_tokens(m) for m in kept.pop(0))
+            evicted += 1
+
+        # Если не уложились - сжимаем результаты тулов и в недавних ходах, кроме последнего
+        if total > budget:
+            for turn in kept[:-1]:
+                for i, message in enumerate(turn):
+                    if message.type == "tool" and not message_text(message).startswith(COMPRESSED_MARK):
+                        turn[i] = compress_tool_message(message)
+                        compressed += 1
+            total = sum(estimate_tokens(m) for turn in kept for m in turn)
+
+        result = system + [m for turn in kept for m in turn]
+        stats = self._stats.setdefault(user_id, {"compressed_tool_results": 0, "evicted_turns": 0})
+        stats["messages"] = len(result)
+        stats["turns"] = len(kept)
+        stats["tokens"] = total + sum(estimate_tokens(m) for m in system)
+        stats["compressed_tool_results"] += compressed
+        stats["evicted_turns"] += evicted
+        return result
+
+    def stats(self, user_id: Hashable) -> dict:
+        return dict(self._stats.get(user_id, {}))
+
+    def metrics(self) -> dict:
+        """Сводные метрики памяти по всем пользователям"""
+        users = self._stats.values()
+        return {
+            "users": len(self._stats),
+            "max_tokens": self.max_tokens,
+            "total_tokens": sum(s.get("tokens", 0) for s in users),
+            "max_user_tokens": max((s.get("tokens", 0) for s in users), default=0),
+            "evicted_turns": sum(s["evicted_turns"] for s in users),
+            "compressed_tool_results": sum(s["compressed_tool_results"] for s in users),
+            "per_user": {str(user_id): dict(s) for user_id, s in self._stats.items()},
+        }
+
+
+memory = ConversationMemory()
@@ -0,0 +1,147 @@
+from typing import Iterable, Protocol
+
+# Транслитерация кириллицы в латиницу (упрощенная, близкая к паспортной)
+TRANSLIT = {
+    "а": "a", "б": "b", "в": "v", "г": "g", "д": "d", "е": "e", "ё": "e",
+    "ж": "zh", "з": "z", "и": "i", "й": "y", "к": "k", "л": "l", "м": "m",
+    "н": "n", "о": "o", "п": "p", "р": "r", "с": "s", "т": "t", "у": "u",
+    "ф": "f", "х": "kh", "ц": "ts", "ч": "ch", "ш": "sh", "щ": "shch",
+    "ъ": "", "ы": "y", "ь": "", "э": "e", "ю": "yu", "я": "ya",
+}
+
+# Сглаживание разных вариантов латинского написания одних и тех же звуков
+LATIN_FOLDS = (
+    ("shch", "sh"),
+    ("sch", "sh"),
+    ("dzh", "j"),
+    ("kh", "h"),
+    ("ck", "k"),
+    ("w", "v"),
+    ("x", "ks"),
+    ("y", "i"),
+    ("ii", "i"),
+)
+
+MIN_PREFIX = 2
+MIN_SCORE = 0.3
+
+
+def name_key(name: str) -> str:
+    """Ключ для нечеткого поиска: нижний регистр, латиница, сглаженное написание"""
+    chars = []
+    for ch in name.casefold():
+        if ch in TRANSLIT:
+            chars.append(TRANSLIT[ch])
+        elif ch.isalnum():
+            chars.append(ch)
+        else:
+            chars.append(" ")
+    key = " ".join("".join(chars).split())
+    for src, dst in LATIN_FOLDS:
+        key = key.replace(src, dst)
+    return key
+
+
+def token_trigrams(token: str) -> set[str]:
+    padded = f"  {token} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+def dice(a: set[str], b: set[str]) -> float:
+    return 2 * len(a & b) / (len(a) + len(b)) if a and b else 0.0
+
+
+class Named(Protocol):
+    name: str
+
+
+class NameIndex:
+    """Индекс имен сотрудников для нечеткого поиска
+
+    Поддерживает поиск по триграммам, по префиксам слов и транслитерацию
+    кириллица <-> латиница: "Николай", "nikolay pashchenko" и "Пащенко"
+    находят одного и того же сотрудника.
+    """
+
+    def __init__(self, items: Iterable[Named] = ()):
+        self._items: list[Named] = []
+        self._keys: list[str] = []
+        self._tokens: list[list[tuple[str, set[str]]]] = []
+        self._by_gram: dict[str, list[int]] = {}
+        self._by_prefix: dict[str, set[int]] = {}
+        self._by_key: dict[str, int] = {}
+        for item in items:
+            self.add(item)
+
+    def add(self, item: Named):
+        idx = len(self._items)
+        key = name_key(item.name)
+        tokens = [(token, token_trigrams(token)) for token in key.split()]
+
+        self._items.append(item)
+        self._keys.append(key)
+        self._tokens.append(tokens)
+        self._by_key.setdefault(key, idx)
+        for token, grams in tokens:
+            for gram in grams:
+                self._by_gram.setdefault(gram, []).append(idx)
+            for i in range(MIN_PREFIX, len(token) + 1):
+                self._by_prefix.setdefault(token[:i], set()).add(idx)
+
+    def search(self, query: str, limit: int = 5) -> list[tuple[Named, float]]:
+        """Найти наиболее похожие имена
+
+        Args:
+            query (str): имя или его часть в любой раскладке
+            limit (int, optional): максимальное количество кандидатов. Defaults to 5.
+
+        Returns:
+            list[tuple[Named, float]]: кандидаты и их оценка от 0 до 1, лучшие - первыми
+        """
+        key = name_key(query)
+        if not key:
+            return []
+
+        exact = self._by_key.get(key)
+        if exact is not None:
+            return [(self._items[exact], 1.0)]
+
+        query_tokens = [(token, token_trigrams(token)) for token in key.split()]
+
+        # Кандидаты - имена, у которых есть общие триграммы или префиксы с запросом
+        candidates: set[int] = set()
+        for token, grams in query_tokens:
+            candidates.update(self._by_prefix.get(token, ()))
+            for gram in grams:
+                candidates.update(self._by_gram.get(gram, ()))
+
+        scored = []
+        for idx in candidates:
+            name_tokens = self._tokens[idx]
+            matched = set()
+            total = 0.0
+            for token, grams in query_tokens:
+                # Лучшее совпадение слова запроса со словом имени:
+                # префикс ("Ник" -> "Николай") или коэффициент Дайса по триграммам
+                best, best_pos = 0.0, None
+                for pos, (name_token, name_grams) in enumerate(name_tokens):
+                    similarity = dice(grams, name_grams)
+                    if len(token) >= MIN_PREFIX and name_token.startswith(token):
+                        similarity = max(similarity, 0.6 + 0.4 * len(token) / len(name_token))
+                    if similarity > best:
+                        best, best_pos = similarity, pos
+                total += best
+                if best_pos is not None:
+                    matched.add(best_pos)
+
+            # Полное совпадение всех слов имени ценится выше частичного
+            coverage = len(matched) / len(name_tokens)
+            score = 0.85 * total / len(query_tokens) + 0.15 * coverage
+            if score >= MIN_SCORE:
+                scored.append((round(score, 3), idx))
+
+        scored.sort(key=lambda pair: (-pair[0], self._keys[pair[1]]))
+        return [(self._items[idx], score) for score, idx in scored[:limit]]
+
+    def __len__(self) -> int:
+        return len(self._items)
@@ -0,0 +1,412 @@
+"""Очередь заявок на бронирование (outbox)
+
+Тул create_meeting проверяет запрос, записывает заявку в таблицу booking_intents
+и сразу отвечает статусом pending: ход агента не ждет Cal.com. Встречи создает
+фоновый обработчик. Он забирает заявки запросом FOR UPDATE SKIP LOCKED (несколько
+процессов MCP сервера не возьмут одну заявку дважды), повторяет временные ошибки
+с нарастающей задержкой, а перед повтором проверяет, не создалась ли встреча в
+прошлой попытке (ответ мог потеряться по таймауту). Пока заявка в работе,
+обработчик продлевает аренду: другой обработчик возьмет ее, только если этот
+перестал отвечать. Статус заявки агент узнает тулом booking_status.
+"""
+import asyncio
+import hashlib
+import logging
+import os
+import random
+from datetime import datetime, timedelta, timezone
+from typing import Any, Awaitable, Callable
+
+from sqlalchemy import and_, or_, select, update
+from sqlalchemy.dialects.postgresql import insert
+
+from backend.database import SessionLocal
+from backend.directory import EmployeeRecord
+from backend.instrumentation import track_upstream
+from backend.metrics import REGISTRY
+from backend.preferences import LOCAL_TZ
+from shared_models import BookingIntent
+
+logger = logging.getLogger(__name__)
+
+# BOOKING_OUTBOX=0 - create_meeting бронирует синхронно, как раньше (например, без БД)
+BOOKING_OUTBOX = os.getenv("BOOKING_OUTBOX", "1") == "1"
+OUTBOX_POLL_INTERVAL = float(os.getenv("OUTBOX_POLL_INTERVAL", "2"))
+OUTBOX_BATCH = int(os.getenv("OUTBOX_BATCH", "10"))
+OUTBOX_MAX_ATTEMPTS = int(os.getenv("OUTBOX_MAX_ATTEMPTS", "5"))
+# Заявка, аренду которой обработчик не продлил за это время (процесс упал), снова доступна
+OUTBOX_LEASE = timedelta(seconds=float(os.getenv("OUTBOX_LEASE", "120")))
+# Аренда продлевается трижды за свой срок: одна неудачная попытка ее не теряет
+LEASE_RENEW_INTERVAL = OUTBOX_LEASE.total_seconds() / 3
+RETRY_BASE = 2.0
+RETRY_MAX = 300.0
+
+PENDING = "pending"
+PROCESSING = "processing"
+BOOKED = "booked"
+FAILED = "failed"
+
+# Ответы Cal.com, после которых повтор не поможет
+PERMANENT_STATUSES = {400, 401, 403, 404, 409, 422}
+
+OUTBOX_RESULTS = REGISTRY.counter(
+    "booking_outbox_total", "Итоги обработки заявок на бронирование", ("result",)
+)
+OUTBOX_DELAY = REGISTRY.histogram(
+    "booking_outbox_delay_seconds", "Время от заявки до созданной встречи"
+)
+
+# Колонки заявки, которые нужны обработчику
+JOB_COLUMNS = (
+    BookingIntent.id,
+    BookingIntent.idempotency_key,
+    BookingIntent.organizer_name,
+    BookingIntent.attendee_name,
+    BookingIntent.start_time,
+    BookingIntent.duration_minutes,
+    BookingIntent.title,
+    BookingIntent.attempts,
+    BookingIntent.calcom_booking_id,
+    BookingIntent.locked_until,
+    BookingIntent.created_at,
+)
+
+
+def make_key(
+    organizer: EmployeeRecord,
+    attendee: EmployeeRecord,
+    start: datetime,
+    duration_minutes: int,
+    title: str,
+) -> str:
+    """Ключ идемпотентности по сути встречи: повтор того же вызова дает тот же ключ"""
+    start = start.astimezone(timezone.utc).isoformat()
+    raw = f"{organizer.id}|{attendee.id}|{start}|{duration_minutes}|{title.strip()}"
+    return hashlib.sha256(raw.encode()).hexdigest()[:32]
+
+
+def same_request(
+    intent: BookingIntent,
+    organizer: EmployeeRecord,
+    attendee: EmployeeRecord,
+    start: datetime,
+    duration_minutes: int,
+    title: str,
+) -> bool:
+    """Записана ли в заявке та же встреча"""
+    return (
+        intent.organizer_id == organizer.id
+        and intent.attendee_id == attendee.id
+        and intent.start_time == start
+        and intent.duration_minutes == duration_minutes
+        and intent.title == title.strip()
+    )
+
+
+async def enqueue(
+    organizer: EmployeeRecord,
+    attendee: EmployeeRecord,
+    start: datetime,
+    duration_minutes: int,
+    title: str,
+    idempotency_key: str,
+    rebook: bool = False,
+) -> tuple[BookingIntent, bool]:
+    """Записать заявку
+
+    Заявка с тем же ключом не создается заново. Снова в очередь ставится только
+    заявка с теми же параметрами, завершившаяся ошибкой, а при rebook - и уже
+    выполненная (встречу могли отменить): перед созданием обработчик проверит,
+    жива ли прошлая встреча. Заявку с другими параметрами вызывающий отличает
+    через same_request.
+
+    Args:
+        rebook (bool): повторно ставить в очередь выполненную заявку (ключ
+            выведен из параметров встречи, а не передан вызывающим)
+
+    Returns:
+        tuple[BookingIntent, bool]: заявка и признак того, что она (заново) поставлена в очередь
+    """
+    title = title.strip()
+    statement = insert(BookingIntent).values(
+        idempotency_key=idempotency_key,
+        organizer_id=organizer.id,
+        attendee_id=attendee.id,
+        organizer_name=organizer.name,
+        attendee_name=attendee.name,
+        start_time=start,
+        duration_minutes=duration_minutes,
+        title=title,
+        status=PENDING,
+        attempts=0,
+    )
+    statement = statement.on_conflict_do_update(
+        index_elements=[BookingIntent.idempotency_key],
+        set_={
+            "status": PENDING,
+            "attempts": 0,
+            "error": None,
+            "next_attempt_at": datetime.now(timezone.utc),
+        },
+        # Повтор исполняет записанные параметры, поэтому они должны совпадать с новыми
+        where=and_(
+            BookingIntent.status.in_((FAILED, BOOKED) if rebook else (FAILED,)),
+            BookingIntent.organizer_id == statement.excluded.organizer_id,
+            BookingIntent.attendee_id == statement.excluded.attendee_id,
+            BookingIntent.start_time == statement.excluded.start_time,
+            BookingIntent.duration_minutes == statement.excluded.duration_minutes,
+            BookingIntent.title == statement.excluded.title,
+        ),
+    ).returning(BookingIntent.id)
+
+    async with SessionLocal() as session:
+        async with track_upstream("db", "outbox_enqueue"):
+            queued = (await session.execute(statement)).scalar_one_or_none()
+            await session.commit()
+            intent = (await session.execute(
+                select(BookingIntent).where(BookingIntent.idempotency_key == idempotency_key)
+            )).scalar_one()
+    return intent, queued is not None
+
+
+async def get_intents(ids: list[int] | None = None, idempotency_key: str | None = None) -> list[BookingIntent]:
+    """Заявки по id или по ключу идемпотентности"""
+    conditions = []
+    if ids:
+        conditions.append(BookingIntent.id.in_(ids))
+    if idempotency_key:
+        conditions.append(BookingIntent.idempotency_key == idempotency_key)
+    if not conditions:
+        return []
+    async with SessionLocal() as session:
+        async with track_upstream("db", "outbox_status"):
+            result = await session.execute(
+                select(BookingIntent).where(or_(*conditions)).order_by(BookingIntent.id)
+            )
+            return list(result.scalars().all())
+
+
+def describe(intent: BookingIntent) -> dict:
+    """Компактный статус заявки для ответа тула"""
+    result = {
+        "request_id": intent.id,
+        "status": intent.status,
+        "organizer": intent.organizer_name,
+        "attendee": intent.attendee_name,
+        "start": intent.start_time.astimezone(LOCAL_TZ).strftime("%Y-%m-%d %H:%M"),
+        "timezone": str(LOCAL_TZ),
+        "duration_minutes": intent.duration_minutes,
+        "title": intent.title,
+    }
+    if intent.status == BOOKED and intent.calcom_booking_id is not None:
+        result["booking_id"] = intent.calcom_booking_id
+    if intent.error:
+        result["error"] = intent.error
+    if intent.status in (PENDING, PROCESSING) and intent.attempts:
+        result["attempts"] = intent.attempts
+    return result
+
+
+async def claim(limit: int = OUTBOX_BATCH) -> list:
+    """Забрать до limit готовых к обработке заявок
+
+    Одним запросом UPDATE ... WHERE id IN (SELECT ... FOR UPDATE SKIP LOCKED):
+    заявки, уже заблокированные другим обработчиком, пропускаются без ожидания.
+    """
+    now = datetime.now(timezone.utc)
+    ready = (
+        select(BookingIntent.id)
+        .where(or_(
+            and_(BookingIntent.status == PENDING, BookingIntent.next_attempt_at <= now),
+            # Обработчик не отчитался до конца аренды - заявка снова доступна
+            and_(BookingIntent.status == PROCESSING, BookingIntent.locked_until < now),
+        ))
+        .order_by(BookingIntent.next_attempt_at)
+        .limit(limit)
+        .with_for_update(skip_locked=True)
+    )
+    statement = (
+        update(BookingIntent)
+        .where(BookingIntent.id.in_(ready))
+        .values(status=PROCESSING, attempts=BookingIntent.attempts + 1, locked_until=now + OUTBOX_LEASE)
+        .returning(*JOB_COLUMNS)
+    )
+    async with SessionLocal() as session:
+        async with track_upstream("db", "outbox_claim"):
+            jobs = list((await session.execute(statement)).all())
+            await session.commit()
+    return jobs
+
+
+class Lease:
+    """Аренда заявки обработчиком
+
+    Продление и итог записываются, только если аренда все еще наша: заявка
+    в обработке и locked_until тот, что мы поставили.
+    """
+
+    def __init__(self, job_id: int, until: datetime):
+        self.job_id = job_id
+        self.until = until
+
+    def _own(self):
+        return update(BookingIntent).where(
+            BookingIntent.id == self.job_id,
+            BookingIntent.status == PROCESSING,
+            BookingIntent.locked_until == self.until,
+        )
+
+    async def renew(self) -> bool:
+        """Продлить аренду; False - ее забрал другой обработчик"""
+        until = datetime.now(timezone.utc) + OUTBOX_LEASE
+        async with SessionLocal() as session:
+            async with track_upstream("db", "outbox_renew"):
+                result = await session.execute(self._own().values(locked_until=until))
+                await session.commit()
+        if result.rowcount:
+            self.until = until
+        return bool(result.rowcount)
+
+    async def finish(self, **values) -> bool:
+        """Записать итог заявки и снять аренду; False - аренда уже не наша"""
+        async with SessionLocal() as session:
+            async with track_upstream("db", "outbox_finish"):
+                result = await session.execute(self._own().values(locked_until=None, **values))
+                await session.commit()
+        if not result.rowcount:
+            logger.warning(f"Аренда заявки {self.job_id} истекла до записи итога: заявку взял другой обработчик")
+        return bool(result.rowcount)
+
+    async def keep(self, done: asyncio.Event):
+        """Продлевать аренду, пока не выставлен done"""
+        while True:
+            try:
+                await asyncio.wait_for(done.wait(), LEASE_RENEW_INTERVAL)
+                return
+            except TimeoutError:
+                pass
+            try:
+                if not await self.renew():
+                    logger.warning(f"Аренда заявки {self.job_id} потеряна")
+                    return
+            except Exception as e:
+                # Следующая попытка продления успеет до конца аренды
+                logger.error(f"Не удалось продлить аренду заявки {self.job_id}: {e}")
+
+
+def is_permanent(result: dict) -> bool:
+    """Ошибка create_meeting, после которой повторять заявку бессмысленно"""
+    if "candidates" in result or "conflicts" in result:
+        # Сотрудник не найден или время уже занято
+        return True
+    return result.get("status_code") in PERMANENT_STATUSES
+
+
+def retry_delay(attempt: int) -> float:
+    """Задержка перед повтором attempt (с 1): экспонента со случайным разбросом"""
+    return min(RETRY_MAX, RETRY_BASE * 2 ** (attempt - 1)) * random.uniform(0.5, 1.0)
+
+
+class OutboxWorker:
+    """Фоновый обработчик заявок
+
+    Args:
+        book (Callable): создать встречу по заявке; возвращает ответ create_meeting
+        find_existing (Callable): найти в Cal.com встречу, созданную прошлой попыткой;
+            возвращает id бронирования или None
+    """
+
+    def __init__(
+        self,
+        book: Callable[[Any], Awaitable[dict]],
+        find_existing: Callable[[Any], Awaitable[int | None]],
+    ):
+        self.book = book
+        self.find_existing = find_existing
+        self._wake = asyncio.Event()
+
+    def wake(self):
+        """Новая заявка: не ждать следующего опроса"""
+        self._wake.set()
+
+    async def run(self):
+        while True:
+            # Сбрасываем до запроса: заявка, записанная во время него, разбудит следующий круг
+            self._wake.clear()
+            try:
+                jobs = await claim()
+            except Exception as e:
+                logger.error(f"Не удалось забрать заявки на бронирование: {e}")
+                jobs = []
+            if jobs:
+                await asyncio.gather(*(self.process(job) for job in jobs))
+                continue
+            try:
+                await asyncio.wait_for(self._wake.wait(), OUTBOX_POLL_INTERVAL)
+            except TimeoutError:
+                pass
+
+    async def process(self, job):
+        """Выполнить одну заявку и записать итог"""
+        lease = Lease(job.id, job.locked_until)
+        # Итог пишется после остановки продления: иначе он мог бы разойтись с locked_until
+        done = asyncio.Event()
+        keeper = asyncio.create_task(lease.keep(done))
+        try:
+            booking_id, result = await self._attempt(job)
+        finally:
+            done.set()
+            await keeper
+
+        if booking_id is not None:
+            OUTBOX_RESULTS.inc(result="deduplicated")
+            await self._booked(job, lease, booking_id)
+            return
+        if result.get("success"):
+            OUTBOX_RESULTS.inc(result="booked")
+            await self._booked(job, lease, result["meeting"].get("booking_id"))
+            return
+
+        error = str(result.get("error"))[:1000]
+        try:
+            if is_permanent(result) or job.attempts >= OUTBOX_MAX_ATTEMPTS:
+                OUTBOX_RESULTS.inc(result="failed")
+                logger.error(f"Заявка на бронирование {job.id} не выполнена: {error}")
+                await lease.finish(status=FAILED, error=error)
+            else:
+                OUTBOX_RESULTS.inc(result="retry")
+                delay = retry_delay(job.attempts)
+                logger.warning(f"Заявка на бронирование {job.id}: {error}, повтор через {delay:.1f} с")
+                await lease.finish(
+                    status=PENDING,
+                    error=error,
+                    next_attempt_at=datetime.now(timezone.utc) + timedelta(seconds=delay),
+                )
+        except Exception as e:
+            # Итог не записан - заявку снова возьмут по истечении аренды
+            logger.error(f"Не удалось записать итог заявки {job.id}: {e}")
+
+    async def _attempt(self, job) -> tuple[int | None, dict]:
+        """Найти встречу прошлой попытки или создать новую
+
+        Returns:
+            tuple[int | None, dict]: id найденной встречи или ответ create_meeting
+        """
+        try:
+            # Прошлая попытка могла создать встречу, но ответ до нас не дошел.
+            # У повторно поставленной выполненной заявки прошлая встреча могла остаться
+            if job.attempts > 1 or job.calcom_booking_id is not None:
+                booking_id = await self.find_existing(job)
+                if booking_id is not None:
+                    return booking_id, {}
+            return None, await self.book(job)
+        except Exception as e:
+            return None, {"error": str(e) or type(e).__name__}
+
+    async def _booked(self, job, lease: Lease, booking_id: int | None):
+        OUTBOX_DELAY.observe((datetime.now(timezone.utc) - job.created_at).total_seconds())
+        try:
+            await lease.finish(status=BOOKED, calcom_booking_id=booking_id, error=None)
+        except Exception as e:
+            # Встреча создана; при повторной обработке ее найдет find_existing
+            logger.error(f"Не удалось записать итог заявки {job.id}: {e}")
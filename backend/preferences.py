@@ -0,0 +1,266 @@
+import re
+from datetime import date, datetime, time, timedelta
+from typing import Hashable, NamedTuple
+from zoneinfo import ZoneInfo
+
+from backend.intervals import Interval, intersect_intervals, merge_intervals, parse_time
+
+LOCAL_TZ = ZoneInfo("Europe/Moscow")
+
+
+def as_local(moment: datetime) -> datetime:
+    """Время без часового пояса считаем местным (LOCAL_TZ)
+
+    Единое соглашение для аргументов тулов, локальной копии бронирований
+    и кэша слотов: время с часовым поясом не меняется.
+    """
+    return moment if moment.tzinfo else moment.replace(tzinfo=LOCAL_TZ)
+
+
+def local_time(value: str) -> datetime:
+    """Разобрать время из аргумента тула; без часового пояса - местное"""
+    return as_local(parse_time(value))
+
+# Обед считаем с 13:00 до 14:00
+LUNCH_START = time(13, 0)
+LUNCH_END = time(14, 0)
+
+_TIME = r"(\d{1,2})(?:[:.](\d{2}))?(?:\s*(утра|дня|вечера|ночи|am|pm)\b)?"
+# "раньше 10" - граница сверху, но "не раньше 10" - снизу
+_NOT_LATER = re.compile(
+    rf"\b(?:не\s+позже|не\s+позднее|до|(?<!не\s)раньше|(?<!не\s)ранее|not\s+later\s+than|before|earlier\s+than)\s+{_TIME}"
+)
+_NOT_EARLIER = re.compile(
+    rf"\b(?:не\s+раньше|не\s+ранее|после|с|(?<!не\s)позже|(?<!не\s)позднее|not\s+earlier\s+than|after|later\s+than)\s+{_TIME}"
+)
+_SKIP_LUNCH = re.compile(r"\b(?:не|кроме)\s+(?:во\s+время\s+|в\s+)?обед|\b(?:not\s+during|except)\s+lunch")
+_AFTER_LUNCH = re.compile(r"после\s+обеда|after\s+lunch")
+_BEFORE_LUNCH = re.compile(r"до\s+обеда|утром|before\s+lunch|in\s+the\s+morning")
+
+# Предпочтение разбирается по частям ("не раньше 10, кроме пятницы"): отрицание
+# части ("не ставить", "не люблю", "кроме", "без") переворачивает ее ограничения
+_CLAUSE = re.compile(r"[,;.!?\n]+|\s+(?:но|а|однако|but)\s+")
+_NEGATION = re.compile(r"\b(?:не|нет|нельзя|без|кроме|никогда|not|no|never|except|avoid)\b|n't\b")
+# "не" внутри этих оборотов - часть границы, а не отрицание части
+_BOUND_NEGATION = re.compile(
+    rf"\bне\s+(?:позже|позднее|раньше|ранее)\b|\bnot\s+(?:later|earlier)\s+than\b|{_SKIP_LUNCH.pattern}"
+)
+
+_WEEKDAYS = [
+    r"понедельник\w*|пн|monday",
+    r"вторник\w*|вт|tuesday",
+    r"сред[аыуе]\w*|ср|wednesday",
+    r"четверг\w*|чт|thursday",
+    r"пятниц\w*|пт|friday",
+    r"суббот\w*|сб|saturday",
+    r"воскресень\w*|вс|sunday",
+]
+_WEEKDAY = re.compile(r"\b(?:" + "|".join(f"({pattern})" for pattern in _WEEKDAYS) + r")s?\b")
+_DAY = r"(?:" + "|".join(_WEEKDAYS) + r")s?"
+# "по будням", "кроме выходных"
+_DAY_GROUPS = {
+    re.compile(r"\b(?:будн\w*|рабоч\w+\s+дн\w*|weekdays|workdays)\b"): range(5),
+    re.compile(r"\b(?:выходн\w*|weekends?)\b"): range(5, 7),
+}
+# "с понедельника по среду", "пн-ср", "from monday to wednesday"
+_WEEKDAY_RANGE = re.compile(rf"\b(?:(?:со?|from)\s+)?({_DAY})\s*(?:-|–|—|\bпо\b|\bдо\b|\bto\b|\bthrough\b)\s*({_DAY})\b")
+# Часть из одних дней ("кроме пн, ср"): продолжает перечень предыдущей части
+_ONLY_WEEKDAYS = re.compile(rf"(?:\s|-|\b(?:и|или|по|в|во|and|or|on)\b|\b{_DAY}\b)*")
+_WEEKDAY_SHORT = ("пн", "вт", "ср", "чт", "пт", "сб", "вс")
+
+
+class Preference(NamedTuple):
+    """Предпочтение сотрудника, разобранное в ограничения на время встречи (в LOCAL_TZ)
+
+    Встреча подходит, если она целиком лежит в одном из разрешенных промежутков дня.
+    """
+
+    # Самое раннее начало и самое позднее окончание
+    earliest: time | None = None
+    latest: time | None = None
+    # Разрешенные дни недели (0 - понедельник), None - любые
+    weekdays: frozenset[int] | None = None
+    # Не ставить встречи на обед
+    skip_lunch: bool = False
+
+    @property
+    def unconstrained(self) -> bool:
+        return self == NO_PREFERENCE
+
+    def day_windows(self, day: date) -> list[Interval]:
+        """Разрешенные промежутки дня day"""
+        if self.weekdays is not None and day.weekday() not in self.weekdays:
+            return []
+        start = datetime.combine(day, self.earliest or time.min, LOCAL_TZ)
+        if self.latest:
+            end = datetime.combine(day, self.latest, LOCAL_TZ)
+        else:
+            end = datetime.combine(day + timedelta(days=1), time.min, LOCAL_TZ)
+        windows = [(start, end)]
+        if self.skip_lunch:
+            lunch_start = datetime.combine(day, LUNCH_START, LOCAL_TZ)
+            lunch_end = datetime.combine(day, LUNCH_END, LOCAL_TZ)
+            windows = [(start, min(end, lunch_start)), (max(start, lunch_end), end)]
+        return [(s, e) for s, e in windows if s < e]
+
+    def clip(self, start: datetime, end: datetime) -> list[Interval]:
+        """Части окна [start, end), подходящие под предпочтение"""
+        if self.unconstrained:
+            return [(start, end)]
+        day = start.astimezone(LOCAL_TZ).date()
+        last_day = end.astimezone(LOCAL_TZ).date()
+        allowed = []
+        while day <= last_day:
+            allowed.extend(self.day_windows(day))
+            day += timedelta(days=1)
+        # Соседние дни без ограничения по времени склеиваются через полночь
+        return intersect_intervals([(start, end)], merge_intervals(allowed))
+
+    def fits(self, start: datetime, end: datetime) -> bool:
+        """Подходит ли встреча [start, end) целиком"""
+        return self.clip(start, end) == [(start, end)]
+
+    def describe(self) -> str:
+        """Ограничения человекочитаемо (для ответа тула)"""
+        parts = []
+        if self.earliest:
+            parts.append(f"не раньше {self.earliest:%H:%M}")
+        if self.latest:
+            parts.append(f"не позже {self.latest:%H:%M}")
+        if self.skip_lunch:
+            parts.append(f"кроме обеда {LUNCH_START:%H:%M}-{LUNCH_END:%H:%M}")
+        if self.weekdays is not None:
+            parts.append("/".join(_WEEKDAY_SHORT[day] for day in sorted(self.weekdays)))
+        return ", ".join(parts) or "без ограничений"
+
+
+NO_PREFERENCE = Preference()
+
+
+def _to_time(hours: str, minutes: str | None, period: str | None = None) -> time | None:
+    h, m = int(hours), int(minutes or 0)
+    if period in ("дня", "вечера", "pm") and 1 <= h < 12:
+        h += 12
+    elif period in ("ночи", "am") and h == 12:
+        h = 0
+    if 0 <= h <= 23 and 0 <= m <= 59:
+        return time(h, m)
+    if h == 24 and m == 0:
+        return time(23, 59)
+    return None
+
+
+def _weekday(name: str) -> int:
+    return _WEEKDAY.match(name).lastindex - 1
+
+
+def _clause_weekdays(clause: str) -> set[int]:
+    """Дни недели части предпочтения, диапазоны разворачиваются"""
+    days = set()
+    for match in _WEEKDAY_RANGE.finditer(clause):
+        first, last = _weekday(match.group(1)), _weekday(match.group(2))
+        days.update((first + offset) % 7 for offset in range((last - first) % 7 + 1))
+    clause = _WEEKDAY_RANGE.sub(" ", clause)
+    for pattern, group in _DAY_GROUPS.items():
+        if pattern.search(clause):
+            days.update(group)
+    days.update(match.lastindex - 1 for match in _WEEKDAY.finditer(clause))
+    return days
+
+
+def parse_preference(preference: str | None) -> Preference:
+    """Разобрать текстовое предпочтение сотрудника в ограничения на время встречи
+
+    Понимает "не позже 15:00", "не раньше 10", "после обеда", "до обеда", "утром",
+    "не в обед", дни недели и их диапазоны ("по вторникам", "кроме пятницы",
+    "с понедельника по среду") и отрицание части ("по пятницам не ставить",
+    "до 9 утра не ставить" - значит не раньше 9).
+
+    Args:
+        preference (str | None): текст из Employee.preference
+
+    Returns:
+        Preference: ограничения (NO_PREFERENCE, если их нет)
+    """
+    if not preference:
+        return NO_PREFERENCE
+
+    text = preference.lower()
+    # Границы из слов ("после обеда") уступают явному времени ("не позже 15:00")
+    bounds: dict[str, time] = {}
+    explicit: dict[str, time] = {}
+    included, excluded = set(), set()
+    negated = False
+
+    for clause in _CLAUSE.split(text):
+        if not clause.strip():
+            continue
+        days = _clause_weekdays(clause)
+        if not (days and _ONLY_WEEKDAYS.fullmatch(clause)):
+            negated = bool(_NEGATION.search(_BOUND_NEGATION.sub(" ", clause)))
+        if days:
+            (excluded if negated else included).update(days)
+
+        # Отрицание меняет границу местами: "до 9 не ставить" - это "не раньше 9"
+        later, earlier = ("earliest", "latest") if negated else ("latest", "earliest")
+        if _AFTER_LUNCH.search(clause):
+            bounds[earlier] = LUNCH_START if negated else LUNCH_END
+        if _BEFORE_LUNCH.search(clause):
+            bounds[later] = LUNCH_END if negated else LUNCH_START
+        if (match := _NOT_LATER.search(clause)) and (moment := _to_time(*match.groups())):
+            explicit[later] = moment
+        if (match := _NOT_EARLIER.search(clause)) and (moment := _to_time(*match.groups())):
+            explicit[earlier] = moment
+
+    bounds.update(explicit)
+    if included:
+        weekdays = frozenset(included - excluded)
+    elif excluded:
+        weekdays = frozenset(range(7)) - excluded
+    else:
+        weekdays = None
+    return Preference(
+        earliest=bounds.get("earliest"),
+        latest=bounds.get("latest"),
+        weekdays=weekdays,
+        skip_lunch=bool(_SKIP_LUNCH.search(text)),
+    )
+
+
+# id сотрудника -> (текст предпочтения, разобранные ограничения)
+_compiled: dict[Hashable, tuple[str | None, Preference]] = {}
+
+
+def employee_preference(employee) -> Preference:
+    """Разобранное предпочтение сотрудника (EmployeeRecord)
+
+    Текст разбирается один раз на сотрудника и заново - только если он изменился
+    в строке employees (справочник перезагрузился с новым текстом).
+    """
+    cached = _compiled.get(employee.id)
+    if cached is None or cached[0] != employee.preference:
+        cached = _compiled[employee.id] = (employee.preference, parse_preference(employee.preference))
+    return cached[1]
+
+
+def split_slots(
+    preference: Preference,
+    slots: dict[str, list[dict]],
+    duration_minutes: int
+) -> tuple[dict[str, list[dict]], dict[str, list[dict]]]:
+    """Разделить слоты Cal.com ({дата: [{"time": ...}]}) по предпочтению
+
+    Returns:
+        tuple[dict[str, list[dict]], dict[str, list[dict]]]: подходящие слоты и слоты вне предпочтения
+    """
+    if preference.unconstrained:
+        return slots, {}
+    duration = timedelta(minutes=duration_minutes)
+    suitable: dict[str, list[dict]] = {}
+    outside: dict[str, list[dict]] = {}
+    for day, day_slots in slots.items():
+        for slot in day_slots:
+            start = parse_time(slot["time"])
+            target = suitable if preference.fits(start, start + duration) else outside
+            target.setdefault(day, []).append(slot)
+    return suitable, outside
@@ -0,0 +1,223 @@
+"""Ограничение частоты запросов к Cal.com на стороне клиента
+
+Каждый запрос берет токен из двух корзин: корзины своего API ключа и общей
+корзины хоста. Запросы, которым токена не хватило, ждут в очереди по приоритету:
+бронирования идут раньше проверок свободного времени. После ответа 429 частота
+для ключа снижается вдвое и плавно восстанавливается на успешных ответах (AIMD).
+"""
+import asyncio
+import bisect
+import itertools
+import math
+import os
+import random
+import time
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
+from enum import IntEnum
+
+from backend import tracing
+from backend.metrics import REGISTRY
+
+# Запросов в секунду и запас (burst) для одного API ключа и для хоста в целом
+CALCOM_KEY_RATE = float(os.getenv("CALCOM_KEY_RATE", "5"))
+CALCOM_KEY_BURST = float(os.getenv("CALCOM_KEY_BURST", "10"))
+CALCOM_HOST_RATE = float(os.getenv("CALCOM_HOST_RATE", "50"))
+CALCOM_HOST_BURST = float(os.getenv("CALCOM_HOST_BURST", "100"))
+
+# Повторы: экспоненциальная задержка со случайным разбросом (full jitter)
+CALCOM_MAX_RETRIES = int(os.getenv("CALCOM_MAX_RETRIES", "3"))
+BACKOFF_BASE = 0.25
+BACKOFF_MAX = 8.0
+# Если Cal.com просит ждать дольше, не повторяем: ошибка быстрее дойдет до пользователя
+CALCOM_MAX_RETRY_AFTER = float(os.getenv("CALCOM_MAX_RETRY_AFTER", "10"))
+
+# Насколько можно снизить частоту ключа после 429 и как быстро она восстанавливается
+MIN_RATE_FRACTION = 0.125
+RATE_RECOVERY = 0.05
+
+THROTTLE_WAIT = REGISTRY.histogram(
+    "calcom_throttle_wait_seconds", "Ожидание токена перед запросом к Cal.com", ("lane",)
+)
+RETRIES = REGISTRY.counter("calcom_retries_total", "Повторы запросов к Cal.com", ("reason",))
+
+
+class Priority(IntEnum):
+    """Полоса приоритета: меньшее значение обслуживается раньше"""
+
+    BOOKING = 0
+    DEFAULT = 1
+    PROBE = 2
+    # Фоновая синхронизация уступает всем запросам пользователей
+    BACKGROUND = 3
+
+
+class TokenBucket:
+    """Корзина токенов с адаптивной частотой"""
+
+    def __init__(self, rate: float, burst: float):
+        self.max_rate = rate
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.updated = time.monotonic()
+        self.blocked_until = 0.0
+
+    def _refill(self, now: float):
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait_time(self, now: float) -> float:
+        """Через сколько секунд в корзине будет токен (0 - уже есть)"""
+        self._refill(now)
+        if now < self.blocked_until:
+            return self.blocked_until - now
+        if self.tokens >= 1 - 1e-9:
+            return 0.0
+        return (1 - self.tokens) / self.rate
+
+    def take(self):
+        self.tokens -= 1
+
+    def throttled(self, now: float, retry_after: float):
+        """Сервер ответил 429: снизить частоту и не пускать запросы retry_after секунд"""
+        self._refill(now)
+        self.rate = max(self.max_rate * MIN_RATE_FRACTION, self.rate / 2)
+        self.tokens = min(self.tokens, 0.0)
+        self.blocked_until = max(self.blocked_until, now + retry_after)
+
+    def succeeded(self):
+        if self.rate < self.max_rate:
+            self.rate = min(self.max_rate, self.rate + self.max_rate * RATE_RECOVERY)
+
+
+class RateLimiter:
+    """Очередь запросов с корзинами на API ключ и на хост
+
+    Ожидающие обслуживаются по (приоритет, порядок прихода). Запрос, упершийся
+    в лимит своего ключа, не задерживает запросы с другими ключами.
+    """
+
+    def __init__(
+        self,
+        key_rate: float = CALCOM_KEY_RATE,
+        key_burst: float = CALCOM_KEY_BURST,
+        host_rate: float = CALCOM_HOST_RATE,
+        host_burst: float = CALCOM_HOST_BURST,
+    ):
+        self.key_rate = key_rate
+        self.key_burst = key_burst
+        self.host = TokenBucket(host_rate, host_burst)
+        self.keys: dict[str, TokenBucket] = {}
+        # (приоритет, номер, ключ, future)
+        self._waiters: list[tuple[int, int, str, asyncio.Future]] = []
+        self._seq = itertools.count()
+        self._timer: asyncio.TimerHandle | None = None
+        self.throttled_responses = 0
+
+    def bucket(self, key: str) -> TokenBucket:
+        bucket = self.keys.get(key)
+        if bucket is None:
+            bucket = self.keys[key] = TokenBucket(self.key_rate, self.key_burst)
+        return bucket
+
+    async def acquire(self, key: str, priority: Priority = Priority.DEFAULT) -> float:
+        """Дождаться разрешения на запрос
+
+        Returns:
+            float: сколько секунд пришлось ждать
+        """
+        now = time.monotonic()
+        bucket = self.bucket(key)
+        if not self._waiters and self.host.wait_time(now) == 0 and bucket.wait_time(now) == 0:
+            self.host.take()
+            bucket.take()
+            THROTTLE_WAIT.observe(0.0, lane=priority.name.lower())
+            return 0.0
+
+        future = asyncio.get_running_loop().create_future()
+        bisect.insort(self._waiters, (int(priority), next(self._seq), key, future))
+        with tracing.span("throttle calcom", lane=priority.name.lower()):
+            self._dispatch()
+            try:
+                await future
+            finally:
+                # Отмененный запрос не должен занимать место в очереди
+                if not future.done():
+                    future.cancel()
+        waited = time.monotonic() - now
+        THROTTLE_WAIT.observe(waited, lane=priority.name.lower())
+        return waited
+
+    def _dispatch(self):
+        """Выдать токены всем, кому их хватает, и завести таймер до следующего токена"""
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+
+        now = time.monotonic()
+        next_wake = math.inf
+        remaining = []
+        for waiter in self._waiters:
+            future = waiter[3]
+            if future.done():
+                continue
+            bucket = self.bucket(waiter[2])
+            wait = max(self.host.wait_time(now), bucket.wait_time(now))
+            if wait == 0:
+                self.host.take()
+                bucket.take()
+                future.set_result(None)
+            else:
+                remaining.append(waiter)
+                next_wake = min(next_wake, wait)
+        self._waiters = remaining
+        if remaining:
+            self._timer = asyncio.get_running_loop().call_later(next_wake, self._dispatch)
+
+    def throttled(self, key: str, retry_after: float):
+        self.throttled_responses += 1
+        self.bucket(key).throttled(time.monotonic(), retry_after)
+
+    def succeeded(self, key: str):
+        self.bucket(key).succeeded()
+
+    def waiting(self) -> dict[tuple[str, ...], float]:
+        counts = {(p.name.lower(),): 0.0 for p in Priority}
+        for priority, _, _, future in self._waiters:
+            if not future.done():
+                counts[(Priority(priority).name.lower(),)] += 1
+        return counts
+
+    def metrics(self) -> dict:
+        return {
+            "waiting": {lane: count for (lane,), count in self.waiting().items()},
+            "keys": len(self.keys),
+            "slowed_keys": sum(1 for b in self.keys.values() if b.rate < b.max_rate),
+            "throttled_responses": self.throttled_responses,
+        }
+
+
+def parse_retry_after(value: str | None) -> float | None:
+    """Заголовок Retry-After: число секунд или HTTP дата"""
+    if not value:
+        return None
+    try:
+        return max(float(value), 0.0)
+    except ValueError:
+        pass
+    try:
+        moment = parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    if moment.tzinfo is None:
+        moment = moment.replace(tzinfo=timezone.utc)
+    return max((moment - datetime.now(timezone.utc)).total_seconds(), 0.0)
+
+
+def backoff_delay(attempt: int, retry_after: float | None = None) -> float:
+    """Задержка перед повтором attempt (с 0): Retry-After, если он есть, иначе full jitter"""
+    if retry_after is not None:
+        # Небольшой разброс, чтобы ожидавшие не вернулись одновременно
+        return retry_after + random.uniform(0, BACKOFF_BASE)
+    return random.uniform(0, min(BACKOFF_MAX, BACKOFF_BASE * 2 ** attempt))
@@ -0,0 +1,126 @@
+import asyncio
+import os
+import time
+from collections import deque
+from typing import Any, Awaitable, Callable, Hashable
+
+LLM_MAX_CONCURRENCY = int(os.getenv("LLM_MAX_CONCURRENCY", "8"))
+# Сколько ждать "досылаемых" сообщений, прежде чем начать ход
+COALESCE_WINDOW = float(os.getenv("COALESCE_WINDOW", "0.3"))
+WAIT_SAMPLES = 1000
+
+
+class _ChatQueue:
+    __slots__ = ("pending", "lock", "submitters")
+
+    def __init__(self):
+        self.pending: list[str] = []
+        self.lock = asyncio.Lock()
+        self.submitters = 0
+
+
+class TurnScheduler:
+    """Планировщик ходов агента
+
+    - ходы одного чата выполняются строго по очереди, поэтому история
+      не перезаписывается параллельными вызовами агента;
+    - сообщения, пришедшие, пока чат ждет своей очереди, склеиваются в один ход;
+    - одновременно к модели обращается не больше max_concurrent ходов.
+      У каждого чата в общей очереди не больше одного хода, а семафор
+      будит ожидающих по порядку, поэтому очередь справедлива между чатами.
+    """
+
+    def __init__(
+        self,
+        max_concurrent: int = LLM_MAX_CONCURRENCY,
+        coalesce_window: float = COALESCE_WINDOW,
+    ):
+        self.max_concurrent = max_concurrent
+        self.coalesce_window = coalesce_window
+        self._slots = asyncio.Semaphore(max_concurrent)
+        self._chats: dict[Hashable, _ChatQueue] = {}
+        self._waits: deque[float] = deque(maxlen=WAIT_SAMPLES)
+        self.waiting = 0
+        self.active = 0
+        self.turns = 0
+        self.coalesced = 0
+
+    async def submit(
+        self,
+        chat_id: Hashable,
+        text: str,
+        run: Callable[[str], Awaitable[Any]],
+    ) -> Any | None:
+        """Поставить сообщение в очередь чата и выполнить ход агента
+
+        Args:
+            chat_id (Hashable): идентификатор чата
+            text (str): текст сообщения
+            run (Callable[[str], Awaitable]): выполнение хода по (склеенному) тексту
+
+        Returns:
+            Any | None: результат run или None, если сообщение вошло в ход,
+                запущенный другим вызовом (на него ответит тот вызов)
+        """
+        chat = self._chats.get(chat_id)
+        if chat is None:
+            chat = self._chats[chat_id] = _ChatQueue()
+        chat.pending.append(text)
+        chat.submitters += 1
+        enqueued_at = time.monotonic()
+
+        try:
+            async with chat.lock:
+                if not chat.pending:
+                    # Сообщение уже вошло в предыдущий ход этого чата
+                    return None
+
+                if self.coalesce_window:
+                    await asyncio.sleep(self.coalesce_window)
+                texts, chat.pending = chat.pending, []
+                self.coalesced += len(texts) - 1
+
+                self.waiting += 1
+                try:
+                    await self._slots.acquire()
+                finally:
+                    self.waiting -= 1
+                self._waits.append(time.monotonic() - enqueued_at)
+
+                self.active += 1
+                self.turns += 1
+                try:
+                    return await run("\n".join(texts))
+                finally:
+                    self.active -= 1
+                    self._slots.release()
+        finally:
+            chat.submitters -= 1
+            if chat.submitters == 0 and self._chats.get(chat_id) is chat:
+                del self._chats[chat_id]
+
+    def metrics(self) -> dict:
+        waits = sorted(self._waits)
+
+        def percentile(p: float) -> float:
+            if not waits:
+                return 0.0
+            return round(waits[min(len(waits) - 1, int(p * len(waits)))], 3)
+
+        return {
+            "max_concurrent": self.max_concurrent,
+            "active_turns": self.active,
+            "queue_depth": self.waiting,
+            "active_chats": len(self._chats),
+            "pending_messages": sum(len(c.pending) for c in self._chats.values()),
+            "turns": self.turns,
+            "coalesced_messages": self.coalesced,
+            "wait_seconds": {
+                "p50": percentile(0.5),
+                "p95": percentile(0.95),
+                "max": round(waits[-1], 3) if waits else 0.0,
+            },
+        }
+
+
+scheduler = TurnScheduler()
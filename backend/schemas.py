@@ -1,4 +1,7 @@
-from pydantic import BaseModel
+from datetime import date, datetime, timedelta
+from typing import Literal
+
+from pydantic import BaseModel, Field, model_validator
 
 class EmployeeSchema(BaseModel):
     name : str
@@ -7,4 +10,51 @@ class EmployeeSchema(BaseModel):
     department : str
     preference : str
     username : str
-    api_key : str
\ No newline at end of file
+    api_key : str
+
+class MeetingRequest(BaseModel):
+    organizer_name : str
+    attendee_name : str
+    start_time : str
+    duration_minutes : int = 60
+    title : str = "Meeting"
+
+
+class RecurrenceRule(BaseModel):
+    organizer_name : str
+    attendee_name : str
+    first_start : str
+    duration_minutes : int = 60
+    title : str = "Meeting"
+    frequency : Literal["daily", "weekly"] = "weekly"
+    interval : int = Field(default=1, ge=1)
+    count : int | None = Field(default=None, ge=1)
+    until : str | None = None
+
+    @model_validator(mode="after")
+    def check_end(self):
+        # Без count и until серия была бы бесконечной
+        if self.count is None and self.until is None:
+            raise ValueError("Укажите count или until для правила повторения")
+        return self
+
+    def occurrences(self, limit: int) -> list[MeetingRequest]:
+        """Развернуть правило повторения в список встреч (не больше limit)"""
+        start = datetime.fromisoformat(self.first_start.replace('Z', '+00:00'))
+        step = timedelta(days=self.interval * (7 if self.frequency == "weekly" else 1))
+        until = date.fromisoformat(self.until[:10]) if self.until else None
+        count = min(self.count or limit, limit)
+
+        meetings = []
+        while len(meetings) < count:
+            if until and start.date() > until:
+                break
+            meetings.append(MeetingRequest(
+                organizer_name=self.organizer_name,
+                attendee_name=self.attendee_name,
+                start_time=start.isoformat(),
+                duration_minutes=self.duration_minutes,
+                title=self.title
+            ))
+            start += step
+        return meetings
@@ -0,0 +1,32 @@
+import asyncio
+from typing import Any, Awaitable, Callable, Hashable
+
+
+class SingleFlight:
+    """Объединение одновременных одинаковых вызовов
+
+    Если по ключу уже выполняется вызов, остальные вызывающие не запускают
+    его повторно, а дожидаются того же результата (или того же исключения).
+    Вызов выполняется в отдельной задаче: отмена того, кто его запустил,
+    не отменяет его для остальных ожидающих.
+    """
+
+    def __init__(self):
+        self._inflight: dict[Hashable, asyncio.Task] = {}
+        self.shared = 0
+
+    async def do(self, key: Hashable, fn: Callable[[], Awaitable[Any]]) -> Any:
+        task = self._inflight.get(key)
+        if task is not None:
+            self.shared += 1
+        else:
+            task = self._inflight[key] = asyncio.create_task(fn())
+            task.add_done_callback(lambda done: self._done(key, done))
+        return await asyncio.shield(task)
+
+    def _done(self, key: Hashable, task: asyncio.Task):
+        if self._inflight.get(key) is task:
+            del self._inflight[key]
+        if not task.cancelled():
+            # Чтобы не было предупреждения "exception was never retrieved", если ждать уже некому
+            task.exception()
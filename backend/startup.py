@@ -0,0 +1,33 @@
+import time
+from contextlib import contextmanager
+
+
+class StartupTimer:
+    """Длительность этапов запуска (этапы могут идти параллельно)"""
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.phases: dict[str, float] = {}
+        self.total: float | None = None
+
+    @contextmanager
+    def phase(self, name: str):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.phases[name] = round(time.perf_counter() - started, 3)
+
+    def mark(self, name: str):
+        """Этап, отсчитываемый от начала запуска (например, импорт модулей)"""
+        self.phases[name] = round(time.perf_counter() - self.started, 3)
+
+    def ready(self) -> float:
+        self.total = round(time.perf_counter() - self.started, 3)
+        return self.total
+
+    def report(self) -> dict:
+        return {"total_seconds": self.total, "phases": dict(self.phases)}
+
+
+startup = StartupTimer()
@@ -0,0 +1,210 @@
+"""Потоковый ответ агента в Telegram
+
+Вместо ожидания всего agent.ainvoke пользователь сразу видит сообщение-заглушку,
+затем ход работы ("Проверяю календарь: John Geery…") и текст ответа по мере того,
+как модель его генерирует. Все это - правки одного сообщения, частота которых
+ограничена, чтобы не упереться в лимиты Telegram.
+"""
+import asyncio
+import logging
+import os
+import time
+from typing import Any, Callable
+
+logger = logging.getLogger(__name__)
+
+# Минимальный интервал между правками сообщения, секунды (Telegram ограничивает частоту правок)
+TG_EDIT_INTERVAL = float(os.getenv("TG_EDIT_INTERVAL", "1.0"))
+TG_MESSAGE_LIMIT = 4096
+
+PLACEHOLDER = "⏳ Думаю…"
+# Признак того, что текст еще дописывается
+CURSOR = " ▌"
+
+
+def describe_tool_call(name: str, args: dict) -> str:
+    """Понятное пользователю описание вызова тула"""
+    if name == "free_slots":
+        employee = args.get("employee") or {}
+        return f"Проверяю календарь: {employee.get('name', 'сотрудник')}…"
+    if name == "common_free_slots":
+        return f"Ищу общее время: {', '.join(args.get('employee_names') or [])}…"
+    if name == "team_free_windows":
+        department = args.get("department")
+        return f"Ищу окно для отдела {department}…" if department else "Ищу общее окно для команды…"
+    if name == "create_meeting":
+        return f"Бронирую встречу: {args.get('organizer_name')} и {args.get('attendee_name')}…"
+    if name == "booking_status":
+        return "Проверяю, создана ли встреча…"
+    if name == "create_meetings_batch":
+        return "Создаю встречи…"
+    if name == "find_employee":
+        return f"Ищу сотрудника «{args.get('query')}»…"
+    if name == "get_all_departments":
+        return "Смотрю список отделов…"
+    if name == "get_all_employees_from_department":
+        return f"Смотрю сотрудников отдела {args.get('department')}…"
+    if name == "employee_meetings":
+        return f"Смотрю встречи: {args.get('employee_name')}…"
+    if name == "get_full_employee_info":
+        return f"Смотрю данные сотрудника {args.get('employee_name')}…"
+    return f"Вызываю {name}…"
+
+
+async def stream_agent_turn(
+    agent,
+    messages: list,
+    on_status: Callable[[str], Any],
+    on_text: Callable[[str], Any],
+) -> list:
+    """Выполнить ход агента в потоковом режиме
+
+    Args:
+        agent: агент langchain (create_agent)
+        messages (list): история с новым сообщением пользователя
+        on_status (Callable[[str], Any]): вызывается с описанием вызываемых тулов
+        on_text (Callable[[str], Any]): вызывается с текущим текстом ответа модели
+
+    Returns:
+        list: новые сообщения хода (как new_history["messages"][len(messages):] у ainvoke)
+    """
+    from langchain_core.messages import AIMessage, AIMessageChunk
+
+    new_messages = []
+    text = ""
+    async for mode, chunk in agent.astream({"messages": messages}, stream_mode=["messages", "updates"]):
+        if mode == "messages":
+            token, metadata = chunk
+            if (
+                isinstance(token, AIMessageChunk)
+                and metadata.get("langgraph_node") == "model"
+                and isinstance(token.content, str)
+                and token.content
+            ):
+                text += token.content
+                on_text(text)
+            continue
+
+        for update in chunk.values():
+            if not isinstance(update, dict):
+                continue
+            for message in update.get("messages", []):
+                new_messages.append(message)
+                if isinstance(message, AIMessage) and message.tool_calls:
+                    # Текст перед вызовом тулов - промежуточный, ответ начнется заново
+                    text = ""
+                    on_status("\n".join(describe_tool_call(c["name"], c["args"]) for c in message.tool_calls))
+    return new_messages
+
+
+def _split(text: str, limit: int = TG_MESSAGE_LIMIT) -> list[str]:
+    """Разбить текст на части не длиннее limit, по возможности по переносам строк"""
+    parts = []
+    while len(text) > limit:
+        cut = text.rfind("\n", 0, limit)
+        if cut <= 0:
+            cut = limit
+        parts.append(text[:cut])
+        text = text[cut:].lstrip("\n")
+    return parts + [text] if text else parts
+
+
+class MessageStream:
+    """Сообщение Telegram, которое правится по мере хода агента
+
+    Правки идут из фоновой задачи не чаще раза в min_interval секунд: промежуточные
+    состояния между правками пропускаются, показывается всегда последнее.
+
+    Args:
+        message: отправленное сообщение-заглушка (telegram.Message)
+        min_interval (float): минимальный интервал между правками, секунды
+    """
+
+    def __init__(self, message, min_interval: float = TG_EDIT_INTERVAL):
+        self.message = message
+        self.min_interval = min_interval
+        self.status = ""
+        self.text = ""
+        self.edits = 0
+        self._shown = message.text
+        self._last_edit = time.monotonic()
+        self._changed = asyncio.Event()
+        self._task = asyncio.create_task(self._run())
+
+    def set_status(self, status: str):
+        self.status = status
+        self.text = ""
+        self._changed.set()
+
+    def set_text(self, text: str):
+        self.text = text
+        self._changed.set()
+
+    def render(self) -> str:
+        if self.text:
+            return self.text[:TG_MESSAGE_LIMIT - len(CURSOR)] + CURSOR
+        return f"⏳ {self.status}" if self.status else PLACEHOLDER
+
+    async def _run(self):
+        while True:
+            await self._changed.wait()
+            delay = self._last_edit + self.min_interval - time.monotonic()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            self._changed.clear()
+            await self._edit(self.render())
+
+    async def _edit(self, text: str) -> bool:
+        from telegram.error import BadRequest, RetryAfter, TelegramError
+
+        if text == self._shown:
+            return True
+        try:
+            await self.message.edit_text(text)
+        except RetryAfter as e:
+            retry_after = e.retry_after
+            # Telegram просит подождать: откладываем следующую правку, последнее состояние не теряется
+            seconds = retry_after.total_seconds() if hasattr(retry_after, "total_seconds") else retry_after
+            self._last_edit = time.monotonic() + seconds
+            self._changed.set()
+            return False
+        except BadRequest as e:
+            if "not modified" not in str(e).lower():
+                logger.warning(f"Не удалось обновить сообщение: {e}")
+                return False
+        except TelegramError as e:
+            # Сетевые сбои не должны обрывать ход агента: пропускаем правку
+            logger.warning(f"Не удалось обновить сообщение: {e}")
+            return False
+        self._shown = text
+        self._last_edit = time.monotonic()
+        self.edits += 1
+        return True
+
+    async def _stop(self):
+        self._task.cancel()
+        await asyncio.gather(self._task, return_exceptions=True)
+
+    async def finish(self, text: str):
+        """Показать окончательный ответ; длинный ответ досылается следующими сообщениями"""
+        await self._stop()
+        parts = _split(text) or ["Пустой ответ"]
+        for _ in range(3):
+            delay = self._last_edit + self.min_interval - time.monotonic()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            if await self._edit(parts[0]):
+                break
+        else:
+            # Заглушку так и не удалось поправить - отвечаем новым сообщением
+            await self.message.reply_text(parts[0])
+        for part in parts[1:]:
+            await self.message.reply_text(part)
+
+    async def discard(self):
+        """Удалить заглушку (сообщение вошло в ход, на который отвечает другое сообщение)"""
+        await self._stop()
+        try:
+            await self.message.delete()
+        except Exception as e:
+            logger.warning(f"Не удалось удалить сообщение: {e}")
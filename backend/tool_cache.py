@@ -0,0 +1,59 @@
+"""Кэш схем тулов MCP сервера на диске
+
+Агент стартует по сохраненным схемам без обращения к MCP серверу, а актуальность
+схем проверяется в фоне: версия схем - хэш списка тулов, который отдает сервер.
+"""
+import hashlib
+import json
+import logging
+import os
+
+logger = logging.getLogger(__name__)
+
+TOOL_CACHE_PATH = os.getenv("TOOL_CACHE_PATH", ".cache/mcp_tools.json")
+
+
+def schema_version(tools: list[dict]) -> str:
+    """Версия схем: хэш канонического JSON всех тулов"""
+    canonical = json.dumps(sorted(tools, key=lambda t: t["name"]), ensure_ascii=False, sort_keys=True)
+    return hashlib.sha256(canonical.encode()).hexdigest()[:16]
+
+
+def load(url: str, path: str = TOOL_CACHE_PATH) -> tuple[list[dict], str] | None:
+    """Сохраненные схемы тулов сервера url
+
+    Returns:
+        tuple[list[dict], str] | None: (схемы тулов, версия) или None,
+            если кэша нет, он поврежден или сохранен для другого сервера
+    """
+    if not path:
+        return None
+    try:
+        with open(path, encoding="utf-8") as f:
+            data = json.load(f)
+    except FileNotFoundError:
+        return None
+    except (OSError, ValueError) as e:
+        logger.warning(f"Кэш схем тулов поврежден, игнорирую: {e}")
+        return None
+
+    if data.get("url") != url or schema_version(data.get("tools", [])) != data.get("version"):
+        return None
+    return data["tools"], data["version"]
+
+
+def save(url: str, tools: list[dict], path: str = TOOL_CACHE_PATH) -> str:
+    """Сохранить схемы тулов; запись атомарная, чтобы параллельные воркеры не читали половину файла
+
+    Returns:
+        str: версия схем
+    """
+    version = schema_version(tools)
+    if not path:
+        return version
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump({"url": url, "version": version, "tools": tools}, f, ensure_ascii=False, indent=2)
+    os.replace(tmp_path, path)
+    return version
@@ -0,0 +1,459 @@
+"""Сквозная трассировка хода агента: Telegram -> LLM -> MCP -> Cal.com
+
+Спаны связываются через contextvars внутри процесса и через заголовок
+W3C traceparent между ботом и MCP сервером. Экспорт задается переменными:
+
+    TRACE_EXPORTER=file          JSONL в TRACE_FILE (по умолчанию traces.jsonl)
+    TRACE_EXPORTER=otlp          OTLP/HTTP JSON на OTLP_ENDPOINT/v1/traces
+    TRACE_EXPORTER=file,otlp     оба варианта
+
+Сводка по критическим путям ходов:
+    uv run -m backend.tracing summary traces.jsonl
+"""
+import argparse
+import atexit
+import json
+import logging
+import os
+import queue
+import re
+import secrets
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar, Token
+from functools import wraps
+
+import httpx
+
+logger = logging.getLogger(__name__)
+
+TRACE_EXPORTER = os.getenv("TRACE_EXPORTER", "")
+TRACE_FILE = os.getenv("TRACE_FILE", "traces.jsonl")
+OTLP_ENDPOINT = os.getenv("OTLP_ENDPOINT", "http://127.0.0.1:4318")
+OTLP_BATCH_SIZE = 256
+OTLP_FLUSH_INTERVAL = 1.0
+
+_TRACEPARENT = re.compile(r"^00-([0-9a-f]{32})-([0-9a-f]{16})-[0-9a-f]{2}$")
+
+# OTLP SpanKind
+SPAN_KINDS = {"internal": 1, "server": 2, "client": 3}
+
+
+class Span:
+    """Спан: интервал работы с атрибутами, привязанный к трассе"""
+
+    __slots__ = (
+        "trace_id", "span_id", "parent_id", "name", "kind", "service",
+        "attributes", "start", "end", "status", "error", "_started",
+    )
+
+    def __init__(self, name: str, trace_id: str, parent_id: str | None, kind: str, attributes: dict):
+        self.trace_id = trace_id
+        self.span_id = secrets.token_hex(8)
+        self.parent_id = parent_id
+        self.name = name
+        self.kind = kind
+        self.service = _service_name
+        self.attributes = attributes
+        self.start = time.time()
+        self.end: float | None = None
+        self.status = "ok"
+        self.error: str | None = None
+        self._started = time.perf_counter()
+
+    @property
+    def traceparent(self) -> str:
+        return f"00-{self.trace_id}-{self.span_id}-01"
+
+    def set(self, **attributes):
+        self.attributes.update(attributes)
+
+    def record_error(self, error):
+        self.status = "error"
+        self.error = error if isinstance(error, str) else f"{type(error).__name__}: {error}"
+
+    def finish(self):
+        if self.end is not None:
+            return
+        self.end = self.start + (time.perf_counter() - self._started)
+        for exporter in _exporters:
+            try:
+                exporter.export(self)
+            except Exception as e:
+                logger.warning(f"Не удалось экспортировать спан {self.name}: {e}")
+
+    def as_dict(self) -> dict:
+        return {
+            "trace_id": self.trace_id,
+            "span_id": self.span_id,
+            "parent_id": self.parent_id,
+            "name": self.name,
+            "kind": self.kind,
+            "service": self.service,
+            "start": self.start,
+            "end": self.end,
+            "duration_ms": round((self.end - self.start) * 1000, 3) if self.end else None,
+            "status": self.status,
+            "error": self.error,
+            "attributes": self.attributes,
+        }
+
+
+_current: ContextVar[Span | None] = ContextVar("current_span", default=None)
+_service_name = os.getenv("TRACE_SERVICE_NAME", "office-manager")
+_exporters: list = []
+
+
+def parse_traceparent(header: str | None) -> tuple[str, str] | None:
+    """(trace_id, parent_span_id) из заголовка traceparent"""
+    if not header:
+        return None
+    match = _TRACEPARENT.match(header.strip().lower())
+    if not match or match.group(1) == "0" * 32:
+        return None
+    return match.group(1), match.group(2)
+
+
+def current_span() -> Span | None:
+    return _current.get()
+
+
+def start_span(name: str, parent: Span | str | None = None, kind: str = "internal", **attributes) -> Span:
+    """Начать спан, не делая его текущим
+
+    Args:
+        name (str): имя спана
+        parent (Span | str | None): родительский спан, заголовок traceparent
+            или None - тогда родителем будет текущий спан
+        kind (str): internal, server или client
+    """
+    if parent is None:
+        parent = _current.get()
+    if isinstance(parent, Span):
+        return Span(name, parent.trace_id, parent.span_id, kind, attributes)
+    remote = parse_traceparent(parent)
+    if remote:
+        return Span(name, remote[0], remote[1], kind, attributes)
+    return Span(name, secrets.token_hex(16), None, kind, attributes)
+
+
+def activate(span: Span | None) -> Token:
+    """Сделать спан текущим для дочерних спанов"""
+    return _current.set(span)
+
+
+def deactivate(token: Token):
+    """Вернуть текущий спан, бывший до activate"""
+    _current.reset(token)
+
+
+@contextmanager
+def span(name: str, parent: Span | str | None = None, kind: str = "internal", **attributes):
+    """Спан на время блока; внутри блока он является текущим"""
+    current = start_span(name, parent, kind, **attributes)
+    token = _current.set(current)
+    try:
+        yield current
+    except BaseException as e:
+        current.record_error(e)
+        raise
+    finally:
+        _current.reset(token)
+        current.finish()
+
+
+def traced(name: str, **attributes):
+    """Декоратор: корутина выполняется внутри спана name"""
+    def decorator(fn):
+        @wraps(fn)
+        async def wrapper(*args, **kwargs):
+            with span(name, **attributes):
+                return await fn(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+class FileExporter:
+    """Построчная запись спанов в JSONL файл"""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+        self._file = open(path, "a", encoding="utf-8")
+
+    def export(self, span: Span):
+        line = json.dumps(span.as_dict(), ensure_ascii=False, default=str)
+        with self._lock:
+            self._file.write(line + "\n")
+            self._file.flush()
+
+    def close(self):
+        with self._lock:
+            self._file.close()
+
+
+def to_otlp(spans: list[Span]) -> dict:
+    """Тело запроса OTLP/HTTP JSON"""
+    by_service: dict[str, list[dict]] = {}
+    for s in spans:
+        by_service.setdefault(s.service, []).append({
+            "traceId": s.trace_id,
+            "spanId": s.span_id,
+            "parentSpanId": s.parent_id or "",
+            "name": s.name,
+            "kind": SPAN_KINDS.get(s.kind, 1),
+            "startTimeUnixNano": str(int(s.start * 1e9)),
+            "endTimeUnixNano": str(int(s.end * 1e9)),
+            "attributes": [
+                {"key": key, "value": {"stringValue": str(value)}}
+                for key, value in s.attributes.items()
+            ],
+            "status": {"code": 2, "message": s.error} if s.status == "error" else {"code": 1},
+        })
+    return {
+        "resourceSpans": [
+            {
+                "resource": {"attributes": [{"key": "service.name", "value": {"stringValue": service}}]},
+                "scopeSpans": [{"scope": {"name": "backend.tracing"}, "spans": otlp_spans}],
+            }
+            for service, otlp_spans in by_service.items()
+        ]
+    }
+
+
+def from_otlp(payload: dict) -> list[dict]:
+    """Спаны из тела OTLP/HTTP JSON в формате JSONL файла (для заглушки коллектора)"""
+    kinds = {value: key for key, value in SPAN_KINDS.items()}
+    records = []
+    for resource_spans in payload.get("resourceSpans", []):
+        service = next(
+            (a["value"].get("stringValue") for a in resource_spans.get("resource", {}).get("attributes", [])
+             if a.get("key") == "service.name"),
+            None
+        )
+        for scope_spans in resource_spans.get("scopeSpans", []):
+            for s in scope_spans.get("spans", []):
+                start = int(s["startTimeUnixNano"]) / 1e9
+                end = int(s["endTimeUnixNano"]) / 1e9
+                status = s.get("status", {})
+                records.append({
+                    "trace_id": s["traceId"],
+                    "span_id": s["spanId"],
+                    "parent_id": s.get("parentSpanId") or None,
+                    "name": s["name"],
+                    "kind": kinds.get(s.get("kind"), "internal"),
+                    "service": service,
+                    "start": start,
+                    "end": end,
+                    "duration_ms": round((end - start) * 1000, 3),
+                    "status": "error" if status.get("code") == 2 else "ok",
+                    "error": status.get("message"),
+                    "attributes": {
+                        a["key"]: next(iter(a["value"].values()), None) for a in s.get("attributes", [])
+                    },
+                })
+    return records
+
+
+class OTLPExporter:
+    """Отправка спанов пачками в OTLP/HTTP коллектор из фонового потока
+
+    Поток не зависит от event loop, поэтому экспорт не задерживает ход агента.
+    """
+
+    def __init__(self, endpoint: str):
+        self.url = endpoint.rstrip("/") + "/v1/traces"
+        self._queue: queue.Queue[Span | None] = queue.Queue()
+        self._thread = threading.Thread(target=self._run, name="otlp-exporter", daemon=True)
+        self._thread.start()
+
+    def export(self, span: Span):
+        self._queue.put(span)
+
+    def _run(self):
+        with httpx.Client(timeout=5) as client:
+            stopping = False
+            while not stopping:
+                batch = []
+                deadline = time.monotonic() + OTLP_FLUSH_INTERVAL
+                while len(batch) < OTLP_BATCH_SIZE:
+                    try:
+                        item = self._queue.get(timeout=max(deadline - time.monotonic(), 0.01))
+                    except queue.Empty:
+                        break
+                    if item is None:
+                        stopping = True
+                        break
+                    batch.append(item)
+                if not batch:
+                    continue
+                try:
+                    client.post(self.url, json=to_otlp(batch)).raise_for_status()
+                except Exception as e:
+                    logger.warning(f"OTLP коллектор недоступен, потеряно спанов: {len(batch)} ({e})")
+
+    def close(self):
+        self._queue.put(None)
+        self._thread.join(timeout=5)
+
+
+def init_tracing(service_name: str, exporter: str | None = None, path: str | None = None):
+    """Настроить имя сервиса и экспорт спанов
+
+    Args:
+        service_name (str): имя сервиса в спанах ("telegram-bot", "mcp-server")
+        exporter (str | None): file, otlp, file,otlp; по умолчанию TRACE_EXPORTER
+        path (str | None): файл для экспорта file; по умолчанию TRACE_FILE
+    """
+    global _service_name
+    _service_name = os.getenv("TRACE_SERVICE_NAME", service_name)
+    if _exporters:
+        return
+
+    kinds = {kind.strip() for kind in (exporter if exporter is not None else TRACE_EXPORTER).split(",")}
+    if "file" in kinds:
+        _exporters.append(FileExporter(path or TRACE_FILE))
+    if "otlp" in kinds:
+        _exporters.append(OTLPExporter(OTLP_ENDPOINT))
+    for exp in _exporters:
+        atexit.register(exp.close)
+    if _exporters:
+        logger.info(f"Трассировка включена: {', '.join(sorted(kinds))}")
+
+
+# ---------- Сводка ----------
+
+TURN_ROOTS = ("telegram.message", "console.turn", "agent.turn")
+# Префикс имени спана -> категория в сводке
+SPAN_CATEGORIES = {
+    "telegram.": "telegram",
+    "console.": "agent",
+    "agent.": "agent",
+    "llm ": "llm",
+    "tool ": "tool",
+    "mcp.call ": "mcp.call",
+    "mcp.http ": "mcp.http",
+    "mcp.tool ": "mcp.tool",
+    "calcom ": "calcom",
+    "throttle ": "throttle",
+    "db ": "db",
+}
+
+
+def category(name: str) -> str:
+    return next((value for prefix, value in SPAN_CATEGORIES.items() if name.startswith(prefix)), "other")
+
+
+def load_spans(path: str) -> list[dict]:
+    with open(path, encoding="utf-8") as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def critical_path(node: dict, children: dict[str, list[dict]], depth: int = 0) -> list[tuple[int, dict]]:
+    """Спаны, определяющие длительность node, с глубиной вложенности
+
+    Идем от конца спана назад: берем позже всех завершившегося потомка,
+    затем потомка, завершившегося до его начала, и так далее. Параллельные
+    ветки, которые никого не задерживали, в путь не попадают.
+    """
+    chain = []
+    cursor = node["end"]
+    for child in sorted(children.get(node["span_id"], []), key=lambda s: s["end"], reverse=True):
+        if child["end"] <= cursor + 1e-6:
+            chain.append(child)
+            cursor = child["start"]
+    path = [(depth, node)]
+    for child in reversed(chain):
+        path.extend(critical_path(child, children, depth + 1))
+    return path
+
+
+def self_times(spans: list[dict], children: dict[str, list[dict]]) -> dict[str, float]:
+    """Собственное время (без дочерних спанов) по категориям, мс"""
+    totals: dict[str, float] = {}
+    for s in spans:
+        child_time = sum(c["duration_ms"] for c in children.get(s["span_id"], []))
+        own = max(s["duration_ms"] - child_time, 0.0)
+        key = category(s["name"])
+        totals[key] = totals.get(key, 0.0) + own
+    return totals
+
+
+def summarize(spans: list[dict], root_names: tuple[str, ...] = TURN_ROOTS) -> list[dict]:
+    """Сводка по ходам: длительность, критический путь и распределение времени
+
+    Ходом считается трасса с корнем из root_names; если таких нет (например,
+    в файле только спаны MCP сервера), - любая трасса.
+    """
+    by_trace: dict[str, list[dict]] = {}
+    for s in spans:
+        if s.get("end") is not None:
+            by_trace.setdefault(s["trace_id"], []).append(s)
+
+    turns = []
+    for trace_id, trace_spans in by_trace.items():
+        ids = {s["span_id"] for s in trace_spans}
+        children: dict[str, list[dict]] = {}
+        for s in trace_spans:
+            if s["parent_id"] in ids:
+                children.setdefault(s["parent_id"], []).append(s)
+        roots = [s for s in trace_spans if s["parent_id"] not in ids]
+        root = max(roots, key=lambda s: (s["name"] in root_names, s["duration_ms"]))
+        turns.append({
+            "trace_id": trace_id,
+            "root": root["name"],
+            "is_turn": root["name"] in root_names,
+            "duration_ms": root["duration_ms"],
+            "spans": len(trace_spans),
+            "critical_path": [
+                (depth, s["name"], s["duration_ms"]) for depth, s in critical_path(root, children)
+            ],
+            "self_ms": self_times(trace_spans, children),
+        })
+    if any(turn["is_turn"] for turn in turns):
+        turns = [turn for turn in turns if turn["is_turn"]]
+    return sorted(turns, key=lambda t: t["duration_ms"], reverse=True)
+
+
+def print_summary(turns: list[dict], top: int):
+    if not turns:
+        print("Спанов нет")
+        return
+    durations = sorted(t["duration_ms"] for t in turns)
+    p = lambda q: durations[min(len(durations) - 1, int(q * len(durations)))]
+    print(f"Ходов: {len(turns)}, p50 {p(0.5):.0f} мс, p95 {p(0.95):.0f} мс, max {durations[-1]:.0f} мс")
+
+    totals: dict[str, float] = {}
+    for turn in turns:
+        for key, value in turn["self_ms"].items():
+            totals[key] = totals.get(key, 0.0) + value
+    overall = sum(totals.values()) or 1.0
+    print("Доля времени по категориям: " + ", ".join(
+        f"{key} {value / overall:.0%}" for key, value in sorted(totals.items(), key=lambda kv: -kv[1])
+    ))
+
+    for turn in turns[:top]:
+        print(f"\n{turn['root']} {turn['trace_id']}: {turn['duration_ms']:.0f} мс, спанов {turn['spans']}")
+        for depth, name, duration in turn["critical_path"]:
+            print(f"{'  ' * (depth + 1)}{name}: {duration:.1f} мс")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Трассы ходов агента")
+    commands = parser.add_subparsers(dest="command", required=True)
+    summary = commands.add_parser("summary", help="сводка по критическим путям ходов")
+    summary.add_argument("path", nargs="?", default=TRACE_FILE)
+    summary.add_argument("--top", type=int, default=5, help="сколько самых долгих ходов показать")
+    summary.add_argument("--json", action="store_true", help="вывести сводку в JSON")
+    args = parser.parse_args()
+
+    turns = summarize(load_spans(args.path))
+    if args.json:
+        print(json.dumps(turns, ensure_ascii=False, indent=2))
+    else:
+        print_summary(turns, args.top)
+
+
+if __name__ == "__main__":
+    main()
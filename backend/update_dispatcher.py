@@ -0,0 +1,127 @@
+import asyncio
+import logging
+import os
+import traceback
+from collections import deque
+from typing import Any, Awaitable, Callable, Hashable
+
+logger = logging.getLogger(__name__)
+
+TG_WORKERS = int(os.getenv("TG_WORKERS", "8"))
+# Ожидающих обновлений на воркер; при переполнении вебхук отвечает 503 и Telegram повторит доставку
+TG_QUEUE_SIZE = int(os.getenv("TG_QUEUE_SIZE", "1000"))
+SEEN_UPDATES = 10000
+
+
+class QueueFull(Exception):
+    pass
+
+
+class UpdateDispatcher:
+    """Обработка обновлений из вебхука
+
+    У каждого чата своя очередь, которую разбирает своя задача: обновления одного
+    чата обрабатываются строго по порядку, а разные чаты - параллельно, не больше
+    workers ходов одновременно. Долгий ход задерживает только свой чат, а не
+    все чаты с тем же хэшем. Повторные доставки одного update_id отбрасываются.
+    """
+
+    def __init__(
+        self,
+        handle: Callable[[Any], Awaitable[None]],
+        workers: int = TG_WORKERS,
+        queue_size: int = TG_QUEUE_SIZE,
+    ):
+        self.handle = handle
+        self.workers = workers
+        self.max_pending = workers * queue_size
+        self._slots = asyncio.Semaphore(workers)
+        # Чат -> ожидающие обновления и задача, которая их разбирает
+        self._chats: dict[Hashable, deque] = {}
+        self._tasks: dict[Hashable, asyncio.Task] = {}
+        self._running = False
+        self._seen: set[int] = set()
+        self._seen_order: deque[int] = deque()
+        self.accepted = 0
+        self.duplicates = 0
+        self.rejected = 0
+        self.processed = 0
+        self.failed = 0
+
+    def start(self):
+        self._running = True
+
+    async def stop(self, timeout: float = 30):
+        """Дождаться обработки принятых обновлений и остановить обработку"""
+        self._running = False
+        tasks = list(self._tasks.values())
+        if tasks:
+            _, unfinished = await asyncio.wait(tasks, timeout=timeout)
+            if unfinished:
+                logger.warning(f"Не дождались обработки {self.pending} обновлений")
+            for task in unfinished:
+                task.cancel()
+            await asyncio.gather(*unfinished, return_exceptions=True)
+
+    def submit(self, update_id: int, chat_key: Hashable, update: Any) -> bool:
+        """Поставить обновление в очередь чата
+
+        Returns:
+            bool: False, если обновление с таким update_id уже принято
+
+        Raises:
+            QueueFull: ожидающих обновлений слишком много (или обработка остановлена)
+        """
+        if update_id in self._seen:
+            self.duplicates += 1
+            return False
+
+        if not self._running or self.pending >= self.max_pending:
+            self.rejected += 1
+            raise QueueFull(f"Очередь обновлений переполнена ({self.max_pending})")
+
+        self._chats.setdefault(chat_key, deque()).append(update)
+        if chat_key not in self._tasks:
+            self._tasks[chat_key] = asyncio.create_task(self._drain(chat_key), name=f"chat-{chat_key}")
+
+        self._seen.add(update_id)
+        self._seen_order.append(update_id)
+        if len(self._seen_order) > SEEN_UPDATES:
+            self._seen.discard(self._seen_order.popleft())
+        self.accepted += 1
+        return True
+
+    async def _drain(self, chat_key: Hashable):
+        queue = self._chats[chat_key]
+        try:
+            while queue:
+                async with self._slots:
+                    update = queue.popleft()
+                    try:
+                        await self.handle(update)
+                        self.processed += 1
+                    except Exception:
+                        self.failed += 1
+                        logger.error(f"Ошибка обработки обновления:\n{traceback.format_exc()}")
+        finally:
+            # Между проверкой пустой очереди и этим местом нет await: новое обновление
+            # чата либо уже разобрано, либо запустит новую задачу
+            del self._chats[chat_key]
+            del self._tasks[chat_key]
+
+    @property
+    def pending(self) -> int:
+        return sum(len(queue) for queue in self._chats.values())
+
+    def metrics(self) -> dict:
+        return {
+            "workers": self.workers,
+            "pending": self.pending,
+            "active_chats": len(self._tasks),
+            "max_queue_depth": max((len(queue) for queue in self._chats.values()), default=0),
+            "accepted": self.accepted,
+            "duplicates": self.duplicates,
+            "rejected": self.rejected,
+            "processed": self.processed,
+            "failed": self.failed,
+        }
@@ -0,0 +1,233 @@
+"""Локальная заглушка Cal.com API для бенчмарков
+
+Поддерживает /v1/event-types, /v1/slots и /v1/bookings в том объеме,
+в котором их использует mcp_server.py. Задержка и доля ошибок настраиваются,
+как и лимит запросов в секунду на API ключ (сверх него - 429 с Retry-After).
+"""
+import asyncio
+import itertools
+import random
+from collections import deque
+from datetime import date, datetime, time, timedelta
+from zoneinfo import ZoneInfo
+
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse
+
+WORK_START = time(9, 0)
+WORK_END = time(18, 0)
+
+
+class FakeCalCom:
+    """Состояние заглушки: event types и бронирования по API ключам"""
+
+    def __init__(
+        self,
+        latency_ms: float = 50,
+        jitter_ms: float = 20,
+        error_rate: float = 0.0,
+        rate_limit_rate: float = 0.0,
+        key_rate: float = 0.0,
+        seed: int | None = None,
+    ):
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self.error_rate = error_rate
+        self.rate_limit_rate = rate_limit_rate
+        self.key_rate = key_rate
+        self.key_windows: dict[str, deque[float]] = {}
+        self.rejected = 0
+        self.random = random.Random(seed)
+        self.ids = itertools.count(1)
+        self.event_types: dict[str, list[dict]] = {}
+        self.bookings: dict[str, list[dict]] = {}
+        self.requests: dict[str, int] = {}
+
+    def event_types_for(self, api_key: str) -> list[dict]:
+        if api_key not in self.event_types:
+            self.event_types[api_key] = [
+                {"id": next(self.ids), "title": "Meeting 30min", "slug": "meeting-30min", "length": 30},
+                {"id": next(self.ids), "title": "Meeting 60min", "slug": "meeting-60min", "length": 60},
+            ]
+        return self.event_types[api_key]
+
+    def over_key_rate(self, api_key: str) -> bool:
+        """Скользящее окно в 1 секунду на API ключ"""
+        if not self.key_rate:
+            return False
+        now = asyncio.get_running_loop().time()
+        window = self.key_windows.setdefault(api_key, deque())
+        while window and window[0] <= now - 1:
+            window.popleft()
+        if len(window) >= self.key_rate:
+            return True
+        window.append(now)
+        return False
+
+    async def simulate(self, endpoint: str, api_key: str = "") -> JSONResponse | None:
+        """Задержка сети и случайные ошибки"""
+        self.requests[endpoint] = self.requests.get(endpoint, 0) + 1
+        if self.over_key_rate(api_key):
+            self.rejected += 1
+            return JSONResponse({"message": "Rate limit exceeded"}, status_code=429, headers={"Retry-After": "1"})
+        delay = self.latency_ms + self.random.uniform(-self.jitter_ms, self.jitter_ms)
+        await asyncio.sleep(max(delay, 0) / 1000)
+
+        roll = self.random.random()
+        if roll < self.rate_limit_rate:
+            return JSONResponse({"message": "Too many requests"}, status_code=429, headers={"Retry-After": "1"})
+        if roll < self.rate_limit_rate + self.error_rate:
+            return JSONResponse({"message": "Internal server error"}, status_code=500)
+        return None
+
+    def free_slots(self, username: str, length: int, start: date, end: date, tz: ZoneInfo) -> dict:
+        busy = [
+            (b["start"], b["end"]) for b in self.bookings.get(username, [])
+        ]
+        slots = {}
+        day = start
+        while day < end:
+            if day.weekday() < 5:
+                current = datetime.combine(day, WORK_START, tz)
+                day_end = datetime.combine(day, WORK_END, tz)
+                step = timedelta(minutes=length)
+                day_slots = []
+                while current + step <= day_end:
+                    if not any(s < current + step and current < e for s, e in busy):
+                        day_slots.append({"time": current.isoformat()})
+                    current += step
+                if day_slots:
+                    slots[day.isoformat()] = day_slots
+            day += timedelta(days=1)
+        return slots
+
+
+def create_app(state: FakeCalCom | None = None) -> FastAPI:
+    state = state or FakeCalCom()
+    app = FastAPI(title="Fake Cal.com")
+    app.state.calcom = state
+
+    @app.get("/v1/event-types")
+    async def list_event_types(apiKey: str):
+        if error := await state.simulate("GET /v1/event-types", apiKey):
+            return error
+        return {"event_types": state.event_types_for(apiKey)}
+
+    @app.post("/v1/event-types")
+    async def create_event_type(apiKey: str, request: Request):
+        if error := await state.simulate("POST /v1/event-types", apiKey):
+            return error
+        body = await request.json()
+        event_types = state.event_types_for(apiKey)
+        if any(et["slug"] == body["slug"] for et in event_types):
+            return JSONResponse({"message": "Slug already exists"}, status_code=409)
+        event_type = {
+            "id": next(state.ids),
+            "title": body["title"],
+            "slug": body["slug"],
+            "length": body["length"],
+        }
+        event_types.append(event_type)
+        return JSONResponse({"event_type": event_type}, status_code=201)
+
+    @app.get("/v1/slots")
+    async def list_slots(
+        apiKey: str,
+        eventTypeId: int,
+        startTime: str,
+        endTime: str,
+        username: str = "",
+        timeZone: str = "UTC",
+    ):
+        if error := await state.simulate("GET /v1/slots", apiKey):
+            return error
+        length = next(
+            (et["length"] for et in state.event_types_for(apiKey) if et["id"] == eventTypeId),
+            None
+        )
+        if length is None:
+            return JSONResponse({"message": "Event type not found"}, status_code=404)
+        slots = state.free_slots(
+            username,
+            length,
+            date.fromisoformat(startTime[:10]),
+            date.fromisoformat(endTime[:10]),
+            ZoneInfo(timeZone),
+        )
+        return {"slots": slots}
+
+    @app.get("/v1/bookings")
+    async def list_bookings(
+        apiKey: str,
+        username: str = "",
+        sortBy: str = "createdAt",
+        order: str = "asc",
+        take: int = 100,
+        page: int = 1,
+    ):
+        if error := await state.simulate("GET /v1/bookings", apiKey):
+            return error
+        # Бронирования календаря, которому принадлежит ключ (как в Cal.com v1)
+        owned = [b for b in itertools.chain.from_iterable(state.bookings.values()) if b["api_key"] == apiKey]
+        owned.sort(key=lambda b: b[sortBy], reverse=order == "desc")
+        return {
+            "bookings": [
+                {
+                    "id": b["id"],
+                    "uid": b["uid"],
+                    "title": b["title"],
+                    "status": b["status"],
+                    "startTime": b["start"].isoformat(),
+                    "endTime": b["end"].isoformat(),
+                    "attendees": b["attendees"],
+                    "metadata": b["metadata"],
+                    "createdAt": b["createdAt"].isoformat(),
+                    "updatedAt": b["updatedAt"].isoformat(),
+                }
+                for b in owned[(page - 1) * take:page * take]
+            ]
+        }
+
+    @app.post("/v1/bookings")
+    async def create_booking(apiKey: str, request: Request, username: str = ""):
+        if error := await state.simulate("POST /v1/bookings", apiKey):
+            return error
+        body = await request.json()
+        length = next(
+            (et["length"] for et in state.event_types_for(apiKey) if et["id"] == body["eventTypeId"]),
+            30
+        )
+        start = datetime.fromisoformat(body["start"].replace("Z", "+00:00"))
+        end = start + timedelta(minutes=length)
+        bookings = state.bookings.setdefault(username, [])
+        if any(b["start"] < end and start < b["end"] for b in bookings):
+            return JSONResponse({"message": "Slot is already booked"}, status_code=409)
+
+        now = datetime.now(ZoneInfo("UTC"))
+        responses = body.get("responses", {})
+        booking = {
+            "id": next(state.ids),
+            "uid": f"fake-{len(bookings)}",
+            "title": body.get("metadata", {}).get("title", "Meeting"),
+            "start": start,
+            "end": end,
+            "status": "ACCEPTED",
+            "api_key": apiKey,
+            "attendees": [{"name": responses.get("name"), "email": responses.get("email")}],
+            "metadata": body.get("metadata", {}),
+            "createdAt": now,
+            "updatedAt": now,
+        }
+        bookings.append(booking)
+        return {"id": booking["id"], "uid": booking["uid"], "url": f"https://cal.example/booking/{booking['uid']}"}
+
+    @app.get("/stats")
+    async def stats():
+        return {"requests": state.requests}
+
+    return app
+
+
+if __name__ == "__main__":
+    import uvicorn
+    uvicorn.run(create_app(), host="127.0.0.1", port=8090)
@@ -0,0 +1,43 @@
+"""Локальная заглушка OTLP/HTTP коллектора
+
+Принимает POST /v1/traces в формате OTLP JSON и дописывает спаны в JSONL файл
+того же формата, что у TRACE_EXPORTER=file, чтобы по нему работала сводка:
+    uv run -m bench.fake_collector --out traces.jsonl
+    uv run -m backend.tracing summary traces.jsonl
+"""
+import argparse
+import json
+
+from fastapi import FastAPI, Request
+
+from backend.tracing import from_otlp
+
+
+def create_app(path: str) -> FastAPI:
+    app = FastAPI(title="Fake OTLP collector")
+    app.state.received = 0
+
+    @app.post("/v1/traces")
+    async def traces(request: Request):
+        records = from_otlp(await request.json())
+        with open(path, "a", encoding="utf-8") as f:
+            for record in records:
+                f.write(json.dumps(record, ensure_ascii=False) + "\n")
+        app.state.received += len(records)
+        return {"partialSuccess": {}}
+
+    @app.get("/stats")
+    async def stats():
+        return {"spans": app.state.received}
+
+    return app
+
+
+if __name__ == "__main__":
+    import uvicorn
+
+    parser = argparse.ArgumentParser(description="Заглушка OTLP коллектора")
+    parser.add_argument("--out", default="traces.jsonl")
+    parser.add_argument("--port", type=int, default=4318)
+    args = parser.parse_args()
+    uvicorn.run(create_app(args.out), host="127.0.0.1", port=args.port)
@@ -0,0 +1,139 @@
+"""Локальная заглушка OpenAI-совместимого /v1/chat/completions
+
+Отвечает по сценарию: на сообщение пользователя вызывает тул (первый
+подходящий по ключевым словам из SCRIPT), на результат тула - отвечает текстом.
+Так агент проходит полный цикл "модель -> тул -> модель" без облачной модели.
+При "stream": true ответ отдается чанками SSE: первый токен - через треть задержки.
+"""
+import asyncio
+import itertools
+import json
+import random
+import time
+
+from fastapi import FastAPI, Request
+from fastapi.responses import StreamingResponse
+
+# (ключевое слово в сообщении пользователя, имя тула, аргументы)
+SCRIPT = [
+    ("отдел", "get_all_departments", {}),
+    ("сотрудник", "get_all_employees_from_department", {"department": "AI"}),
+    ("найди", "find_employee", {"query": "Nikolay"}),
+    ("общ", "common_free_slots", {
+        "employee_names": ["Николай Пащенко", "John Geery"],
+        "date_from": "2030-01-07",
+        "date_to": "2030-01-08",
+        "duration_minutes": 30,
+    }),
+]
+DEFAULT_TOOL = ("get_all_departments", {})
+
+
+class FakeLLM:
+    def __init__(self, latency_ms: float = 300, jitter_ms: float = 100, seed: int | None = None):
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self.random = random.Random(seed)
+        self.ids = itertools.count(1)
+        self.requests = 0
+
+    def pick_tool(self, text: str, tools: list[dict]) -> tuple[str, dict] | None:
+        available = {t["function"]["name"] for t in tools if t.get("type") == "function"}
+        for keyword, name, args in SCRIPT:
+            if keyword in text.lower() and name in available:
+                return name, args
+        if DEFAULT_TOOL[0] in available:
+            return DEFAULT_TOOL
+        return None
+
+    def completion(self, body: dict) -> dict:
+        messages = body.get("messages", [])
+        last = messages[-1] if messages else {"role": "user", "content": ""}
+        message: dict = {"role": "assistant", "content": None}
+        finish_reason = "stop"
+
+        text = last.get("content") or ""
+        if isinstance(text, list):
+            text = " ".join(part.get("text", "") for part in text if isinstance(part, dict))
+        tool = self.pick_tool(text, body.get("tools", [])) if last.get("role") == "user" else None
+        if tool:
+            name, args = tool
+            message["tool_calls"] = [{
+                "id": f"call_{next(self.ids)}",
+                "type": "function",
+                "function": {"name": name, "arguments": json.dumps(args, ensure_ascii=False)},
+            }]
+            finish_reason = "tool_calls"
+        else:
+            message["content"] = "Готово: данные получены."
+
+        prompt_tokens = sum(len(json.dumps(m, ensure_ascii=False)) for m in messages) // 3
+        return {
+            "id": f"chatcmpl-{next(self.ids)}",
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": body.get("model", "fake"),
+            "choices": [{"index": 0, "message": message, "finish_reason": finish_reason}],
+            "usage": {"prompt_tokens": prompt_tokens, "completion_tokens": 20, "total_tokens": prompt_tokens + 20},
+        }
+
+
+def stream_chunks(completion: dict, delay: float, include_usage: bool):
+    """Ответ completion в виде чанков chat.completion.chunk (SSE)"""
+    choice = completion["choices"][0]
+    message = choice["message"]
+
+    def chunk(delta: dict, finish_reason: str | None = None) -> str:
+        body = {
+            "id": completion["id"],
+            "object": "chat.completion.chunk",
+            "created": completion["created"],
+            "model": completion["model"],
+            "choices": [{"index": 0, "delta": delta, "finish_reason": finish_reason}],
+        }
+        return f"data: {json.dumps(body, ensure_ascii=False)}\n\n"
+
+    async def events():
+        await asyncio.sleep(delay / 3)
+        yield chunk({"role": "assistant", "content": ""})
+        if message.get("tool_calls"):
+            # Аргументы тула модель дописывает до конца ответа
+            await asyncio.sleep(delay * 2 / 3)
+            calls = [{"index": i, **call} for i, call in enumerate(message["tool_calls"])]
+            yield chunk({"tool_calls": calls})
+        else:
+            words = message["content"].split(" ")
+            for i, word in enumerate(words):
+                await asyncio.sleep(delay * 2 / 3 / len(words))
+                yield chunk({"content": word if i == 0 else f" {word}"})
+        yield chunk({}, choice["finish_reason"])
+        if include_usage:
+            usage = {**completion, "object": "chat.completion.chunk", "choices": []}
+            yield f"data: {json.dumps(usage, ensure_ascii=False)}\n\n"
+        yield "data: [DONE]\n\n"
+
+    return StreamingResponse(events(), media_type="text/event-stream")
+
+
+def create_app(state: FakeLLM | None = None) -> FastAPI:
+    state = state or FakeLLM()
+    app = FastAPI(title="Fake LLM")
+    app.state.llm = state
+
+    @app.post("/v1/chat/completions")
+    async def chat_completions(request: Request):
+        state.requests += 1
+        delay = max(state.latency_ms + state.random.uniform(-state.jitter_ms, state.jitter_ms), 0) / 1000
+        body = await request.json()
+        if body.get("stream"):
+            include_usage = bool((body.get("stream_options") or {}).get("include_usage"))
+            return stream_chunks(state.completion(body), delay, include_usage)
+        await asyncio.sleep(delay)
+        return state.completion(body)
+
+    return app
+
+
+if __name__ == "__main__":
+    import uvicorn
+    uvicorn.run(create_app(), host="127.0.0.1", port=8091)
@@ -0,0 +1,372 @@
+"""Офлайн-бенчмарк MCP тулов и агента
+
+Поднимает локальные заглушки Cal.com и LLM, нагружает тулы mcp_server.py
+(и, с флагом --agent, весь цикл агента из init_agent) параллельными запросами
+и печатает p50/p95/p99 задержки и пропускную способность по каждому тулу.
+
+Запуск:
+    uv run -m bench.run --requests 500 --concurrency 50 --calcom-latency 80
+    uv run -m bench.run --agent --agent-turns 50 --concurrency 10
+    uv run -m bench.run --agent --trace traces.jsonl && uv run -m backend.tracing summary traces.jsonl
+"""
+import argparse
+import asyncio
+import json
+import logging
+import os
+import random
+import socket
+import tempfile
+import time
+import uuid
+from datetime import date, timedelta
+
+import uvicorn
+
+from bench import fake_calcom, fake_llm
+
+EMPLOYEES = [
+    ("Николай Пащенко", "AI", "Встречи не позже 15:00"),
+    ("John Geery", "Sales", "Встречи после обеда"),
+    ("Vadim Denisov", "AI", "Нет"),
+]
+# Понедельник в будущем: у заглушки Cal.com рабочие дни пн-пт
+BENCH_DAY = date(2030, 1, 7)
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+async def serve(app, port: int) -> tuple[uvicorn.Server, asyncio.Task]:
+    server = uvicorn.Server(uvicorn.Config(app, host="127.0.0.1", port=port, log_level="warning"))
+    task = asyncio.create_task(server.serve())
+    while not server.started:
+        await asyncio.sleep(0.01)
+    return server, task
+
+
+async def stop(server: uvicorn.Server, task: asyncio.Task):
+    server.should_exit = True
+    await task
+
+
+def percentile(values: list[float], p: float) -> float:
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(len(values) - 1, int(p * len(values)))]
+
+
+def report(title: str, results: dict[str, list[tuple[float, bool]]], elapsed: float) -> dict:
+    rows = {}
+    print(f"\n{title} (за {elapsed:.2f} с)")
+    print(f"{'name':<36}{'count':>7}{'errors':>8}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'rps':>9}")
+    for name, samples in sorted(results.items()):
+        latencies = [latency * 1000 for latency, _ in samples]
+        errors = sum(1 for _, ok in samples if not ok)
+        row = {
+            "count": len(samples),
+            "errors": errors,
+            "p50_ms": round(percentile(latencies, 0.50), 2),
+            "p95_ms": round(percentile(latencies, 0.95), 2),
+            "p99_ms": round(percentile(latencies, 0.99), 2),
+            "rps": round(len(samples) / elapsed, 2) if elapsed else 0.0,
+        }
+        rows[name] = row
+        print(
+            f"{name:<36}{row['count']:>7}{row['errors']:>8}{row['p50_ms']:>10}"
+            f"{row['p95_ms']:>10}{row['p99_ms']:>10}{row['rps']:>9}"
+        )
+    return rows
+
+
+def seed_directory():
+    from backend.directory import directory, EmployeeRecord
+    from shared_models import Employee
+
+    records = []
+    for name, department, preference in EMPLOYEES:
+        username = name.lower().replace(" ", "-")
+        employee = Employee(
+            name=name,
+            email=f"{username}@example.com",
+            position=1,
+            department=department,
+            preference=preference,
+            cal_com_username=username,
+            cal_com_api_key=f"key-{username}",
+        )
+        employee.id = uuid.uuid4()
+        records.append(EmployeeRecord(employee))
+    directory.replace(records, version="bench")
+    return records
+
+
+def tool_scenarios(records, detail: bool = False) -> list[tuple[str, callable]]:
+    employee = records[0]
+    employee_arg = {
+        "name": employee.name,
+        "email": employee.email,
+        "position": employee.position,
+        "department": employee.department,
+        "preference": employee.preference,
+        "username": employee.cal_com_username,
+        "api_key": employee.cal_com_api_key,
+    }
+
+    def random_day() -> str:
+        return (BENCH_DAY + timedelta(days=random.randrange(5))).isoformat()
+
+    def meeting() -> dict:
+        # Случайное время в пределах 60 рабочих дней, чтобы бронирования редко конфликтовали
+        day = BENCH_DAY + timedelta(weeks=random.randrange(12), days=random.randrange(5))
+        hour = random.randrange(6, 14)
+        return {
+            "organizer_name": records[1].name,
+            "attendee_name": records[2].name,
+            "start_time": f"{day.isoformat()}T{hour:02d}:{random.choice(['00', '30'])}:00Z",
+            "duration_minutes": 30,
+            "detail": detail,
+        }
+
+    return [
+        ("get_all_departments", lambda: {}),
+        ("get_all_employees_from_department", lambda: {"department": "AI"}),
+        ("find_employee", lambda: {"query": random.choice(["Nikolay", "джон", "Denisov"])}),
+        ("free_slots", lambda: {
+            "employee": employee_arg,
+            "date_from": random_day(),
+            "date_to": random_day(),
+            "duration_minutes": 30,
+            "detail": detail,
+        }),
+        ("common_free_slots", lambda: {
+            "employee_names": [r.name for r in records],
+            "date_from": BENCH_DAY.isoformat(),
+            "date_to": (BENCH_DAY + timedelta(days=2)).isoformat(),
+            "duration_minutes": 30,
+        }),
+        ("team_free_windows", lambda: {
+            "department": "AI",
+            "employee_names": [records[1].name],
+            "date_from": random_day(),
+            "duration_minutes": 60,
+            "min_free": 2,
+        }),
+        ("create_meeting", meeting),
+    ]
+
+
+def is_error(result) -> bool:
+    if result.is_error:
+        return True
+    content = result.structured_content
+    if isinstance(content, dict):
+        if "error" in content:
+            return True
+        bookings = content.get("bookings", {})
+        return any(isinstance(b, dict) and "error" in b for b in bookings.values())
+    return False
+
+
+async def bench_tools(args, records) -> dict:
+    from fastmcp import Client
+    import mcp_server
+
+    scenarios = tool_scenarios(records, detail=args.detail)
+    if args.tools:
+        scenarios = [s for s in scenarios if s[0] in args.tools]
+    results: dict[str, list[tuple[float, bool]]] = {name: [] for name, _ in scenarios}
+    # Размер ответа в том виде, в каком он уйдет в контекст модели
+    sizes: dict[str, list[int]] = {name: [] for name, _ in scenarios}
+    queue = asyncio.Queue()
+    for i in range(args.requests):
+        queue.put_nowait(scenarios[i % len(scenarios)])
+
+    async with Client(mcp_server.mcp) as client:
+        async def worker():
+            while not queue.empty():
+                name, make_args = queue.get_nowait()
+                started = time.perf_counter()
+                try:
+                    result = await client.call_tool(name, make_args(), raise_on_error=False)
+                    ok = not is_error(result)
+                    sizes[name].append(sum(len(getattr(block, "text", "")) for block in result.content))
+                except Exception:
+                    ok = False
+                results[name].append((time.perf_counter() - started, ok))
+
+        started = time.perf_counter()
+        await asyncio.gather(*(worker() for _ in range(args.concurrency)))
+        elapsed = time.perf_counter() - started
+
+    rows = report("MCP тулы", results, elapsed)
+    for name, samples in sizes.items():
+        if samples:
+            rows[name]["result_chars"] = round(sum(samples) / len(samples))
+    print("Средний размер ответа, символов:", json.dumps(
+        {name: row.get("result_chars") for name, row in rows.items()}, ensure_ascii=False
+    ))
+    return rows
+
+
+async def bench_agent(args) -> dict:
+    import mcp_server
+
+    mcp_port = free_port()
+    llm_port = free_port()
+    llm_state = fake_llm.FakeLLM(latency_ms=args.llm_latency, jitter_ms=args.llm_latency / 3, seed=args.seed)
+    llm_server = await serve(fake_llm.create_app(llm_state), llm_port)
+    mcp_http = await serve(mcp_server.mcp.http_app(), mcp_port)
+
+    os.environ["LLM_BASE_URL"] = f"http://127.0.0.1:{llm_port}/v1/"
+    os.environ["MCP_SERVER_URL"] = f"http://127.0.0.1:{mcp_port}/mcp"
+    os.environ.setdefault("AI_API_KEY", "bench")
+    # Отдельный кэш схем тулов, чтобы не затирать кэш рабочего сервера
+    os.environ["TOOL_CACHE_PATH"] = os.path.join(tempfile.mkdtemp(), "mcp_tools.json")
+    from langchain.messages import HumanMessage
+    from backend import tracing
+    from backend.langchain_agent import close_agent, get_router, init_agent
+    from backend.streaming import stream_agent_turn
+
+    prompts = [
+        "Какие есть отделы?",
+        "Какие сотрудники в отделе AI?",
+        "Найди сотрудника Николай",
+        "Найди общее время для встречи",
+    ]
+    results: dict[str, list[tuple[float, bool]]] = {"agent_turn": []}
+    if args.stream:
+        # Когда пользователь увидит первое обновление сообщения: вызов тула или первые токены
+        results["first_update"] = []
+    started_init = time.perf_counter()
+    agent = await init_agent()
+    results["init_agent"] = [(time.perf_counter() - started_init, True)]
+    # Повторный запуск берет схемы тулов из кэша на диске
+    started_init = time.perf_counter()
+    agent = await init_agent()
+    results["init_agent_cached"] = [(time.perf_counter() - started_init, True)]
+
+    queue = asyncio.Queue()
+    for i in range(args.agent_turns):
+        queue.put_nowait(prompts[i % len(prompts)])
+
+    async def worker():
+        while not queue.empty():
+            prompt = queue.get_nowait()
+            started = time.perf_counter()
+            try:
+                with tracing.span("agent.turn", prompt=prompt):
+                    # Справочные вопросы без модели, как в боте (--no-fast-path - все через агента)
+                    reply = None if args.no_fast_path else await get_router().route(prompt)
+                    if reply is None and args.stream:
+                        first_update = []
+
+                        def on_update(_):
+                            if not first_update:
+                                first_update.append(time.perf_counter() - started)
+
+                        await stream_agent_turn(agent, [HumanMessage(prompt)], on_update, on_update)
+                        results["first_update"].append((first_update[0] if first_update else 0.0, True))
+                    elif reply is None:
+                        await agent.ainvoke({"messages": [HumanMessage(prompt)]})
+                ok = True
+            except Exception as e:
+                logging.getLogger(__name__).warning(f"agent turn failed: {e}")
+                ok = False
+            results["agent_turn"].append((time.perf_counter() - started, ok))
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(args.concurrency)))
+    elapsed = time.perf_counter() - started
+
+    await close_agent()
+    await stop(*mcp_http)
+    await stop(*llm_server)
+    rows = report("Агент", results, elapsed)
+    rows["llm_requests"] = llm_state.requests
+    rows["intent_router"] = get_router().metrics()
+    return rows
+
+
+async def main(args):
+    random.seed(args.seed)
+    if args.trace:
+        from backend import tracing
+        tracing.init_tracing("bench", exporter="file", path=args.trace)
+    calcom_state = fake_calcom.FakeCalCom(
+        latency_ms=args.calcom_latency,
+        jitter_ms=args.calcom_latency / 3,
+        error_rate=args.error_rate,
+        rate_limit_rate=args.rate_limit_rate,
+        key_rate=args.calcom_key_rate,
+        seed=args.seed,
+    )
+    calcom_port = free_port()
+    calcom_server = await serve(fake_calcom.create_app(calcom_state), calcom_port)
+
+    # mcp_server читает адрес Cal.com при импорте
+    os.environ["CALCOM_HOST"] = f"http://127.0.0.1:{calcom_port}"
+    # Бенчмарк работает без Postgres: локальная копия бронирований выключена
+    os.environ.setdefault("BOOKINGS_MIRROR", "0")
+    # Индекс свободного времени догружается по запросу, без фоновой загрузки
+    os.environ.setdefault("AVAILABILITY_PRELOAD", "0")
+    # Очередь заявок живет в Postgres: без него create_meeting бронирует синхронно
+    os.environ.setdefault("BOOKING_OUTBOX", "0")
+    import mcp_server
+    mcp_server.calcom.base_url = os.environ["CALCOM_HOST"]
+    logging.getLogger().setLevel(logging.WARNING)
+
+    records = seed_directory()
+    # Сетка индекса начинается с дня бенчмарка
+    mcp_server.availability_index.reset(BENCH_DAY)
+    summary = {"tools": await bench_tools(args, records)}
+    if args.agent:
+        summary["agent"] = await bench_agent(args)
+
+    summary["calcom_requests"] = calcom_state.requests
+    summary["calcom_rejected"] = calcom_state.rejected
+    summary["throttle"] = mcp_server.calcom.limiter.metrics()
+    summary["caches"] = {
+        "event_types": mcp_server.event_types_cache.stats(),
+        "slots": mcp_server.slots_cache.stats(),
+    }
+    print("\nCal.com запросы:", json.dumps(calcom_state.requests, ensure_ascii=False))
+    print("Кэши:", json.dumps(summary["caches"], ensure_ascii=False))
+    print("Отказов Cal.com по лимиту ключа:", calcom_state.rejected)
+    print("Троттлинг:", json.dumps(summary["throttle"], ensure_ascii=False))
+
+    await mcp_server.calcom.aclose()
+    await stop(*calcom_server)
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(summary, f, ensure_ascii=False, indent=2)
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Офлайн-бенчмарк MCP сервера и агента")
+    parser.add_argument("--requests", type=int, default=300, help="количество вызовов тулов")
+    parser.add_argument("--concurrency", type=int, default=20, help="число параллельных клиентов")
+    parser.add_argument("--tools", nargs="*", help="ограничить набор тулов")
+    parser.add_argument("--calcom-latency", type=float, default=50, help="задержка Cal.com, мс")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="доля ответов 500 от Cal.com")
+    parser.add_argument("--rate-limit-rate", type=float, default=0.0, help="доля ответов 429 от Cal.com")
+    parser.add_argument("--calcom-key-rate", type=float, default=0.0, help="лимит Cal.com, запросов/с на API ключ (0 - без лимита)")
+    parser.add_argument("--agent", action="store_true", help="нагрузить также агента (init_agent)")
+    parser.add_argument("--agent-turns", type=int, default=40, help="количество ходов агента")
+    parser.add_argument("--llm-latency", type=float, default=300, help="задержка модели, мс")
+    parser.add_argument("--detail", action="store_true", help="полные ответы free_slots и create_meeting")
+    parser.add_argument("--stream", action="store_true", help="ходы агента в потоковом режиме (как в боте)")
+    parser.add_argument("--no-fast-path", action="store_true", help="справочные вопросы тоже через модель")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--json", help="сохранить результаты в JSON файл")
+    parser.add_argument("--trace", help="записать спаны в JSONL файл (см. backend.tracing summary)")
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    asyncio.run(main(parse_args()))
@@ -1,21 +1,48 @@
-from fastmcp import FastMCP, Context
+import asyncio
+from contextlib import asynccontextmanager
+from datetime import date, datetime, timedelta, timezone
+from functools import reduce
+
+from fastmcp import FastMCP
 from fastmcp.tools.tool import ToolResult
-from sqlalchemy import select
-from    sqlalchemy.orm import selectinload
+from starlette.requests import Request
+from starlette.responses import PlainTextResponse
 import logging
 import os
 from dotenv import load_dotenv
-import requests
+import httpx
 
-from backend.database import SessionLocal
-from shared_models import Employee
-from backend.schemas import EmployeeSchema
+from backend.calcom_client import calcom, CalComError
+from backend.rate_limiter import Priority
+from backend.directory import directory, EmployeeRecord
+from backend.mcp_middleware import ToolMetricsMiddleware
+from backend.tracing import init_tracing
+from backend.metrics import REGISTRY
+from backend.cache import TTLCache
+from backend.singleflight import SingleFlight
+from backend.intervals import intersect_intervals, parse_time, slots_to_intervals, subtract_intervals
+from backend.preferences import employee_preference, split_slots, Preference, NO_PREFERENCE, LOCAL_TZ, local_time
+from backend.schemas import EmployeeSchema, MeetingRequest, RecurrenceRule
+from backend.compact import compact_booking, compact_slots, slot_ranges
+from backend import bookings, outbox
+from backend.availability import AvailabilityIndex, AVAILABILITY_TTL
 
 load_dotenv()
 
 USER_AGENT = "Office manager"
 
-CAL_COM_URL = os.getenv("CALCOM_HOST")
+# Ограничения пакетного бронирования
+MAX_BATCH_SIZE = int(os.getenv("MAX_BATCH_SIZE", "100"))
+MAX_BATCH_PARALLEL = int(os.getenv("MAX_BATCH_PARALLEL", "10"))
+
+# AVAILABILITY_PRELOAD=0 отключает фоновую загрузку индекса свободного времени
+AVAILABILITY_PRELOAD = os.getenv("AVAILABILITY_PRELOAD", "1") == "1"
+# Сколько занятых сотрудников перечислять в окне team_free_windows
+MAX_UNAVAILABLE_NAMES = 10
+
+# Ожидание завершения заявок в booking_status
+MAX_STATUS_WAIT = 10.0
+STATUS_POLL_INTERVAL = 0.25
 
 logging.basicConfig(
     level=logging.INFO,
@@ -25,7 +52,84 @@ logging.basicConfig(
 
 logger = logging.getLogger(__name__)
 
-mcp = FastMCP(USER_AGENT)
+# Кэш event types: api_key -> {длительность в минутах: id event type}
+event_types_cache = TTLCache(
+    maxsize=int(os.getenv("EVENT_TYPES_CACHE_SIZE", "256")),
+    ttl=float(os.getenv("EVENT_TYPES_CACHE_TTL", "600")),
+)
+# Кэш свободных слотов: (username, event_type_id, день) -> слоты за этот день
+slots_cache = TTLCache(
+    maxsize=int(os.getenv("SLOTS_CACHE_SIZE", "4096")),
+    ttl=float(os.getenv("SLOTS_CACHE_TTL", "60")),
+)
+# Одновременные поиски/создания event type с одинаковыми (api_key, длительность)
+event_type_flight = SingleFlight()
+# Битовые строки свободного времени сотрудников для team_free_windows
+availability_index = AvailabilityIndex()
+# Одновременные загрузки строки индекса одного сотрудника
+availability_flight = SingleFlight()
+
+
+@asynccontextmanager
+async def lifespan(server: FastMCP):
+    # Загружаем справочник сотрудников, чтобы тулы не ходили в БД
+    try:
+        await directory.load()
+    except Exception as e:
+        logger.error(f"Справочник сотрудников не загружен, повторим при первом вызове: {e}")
+    refresh_task = asyncio.create_task(directory.run_refresh_loop())
+    # Локальная копия бронирований догоняет изменения в Cal.com в фоне
+    sync_task = asyncio.create_task(bookings.run_sync_loop()) if bookings.BOOKINGS_MIRROR else None
+    # Индекс свободного времени обновляется заранее, чтобы поиск окон не ждал Cal.com
+    availability_task = asyncio.create_task(run_availability_refresh()) if AVAILABILITY_PRELOAD else None
+    # Встречи из очереди заявок создаются в фоне
+    outbox_task = asyncio.create_task(outbox_worker.run()) if outbox.BOOKING_OUTBOX else None
+
+    yield
+
+    refresh_task.cancel()
+    if sync_task is not None:
+        sync_task.cancel()
+    if availability_task is not None:
+        availability_task.cancel()
+    if outbox_task is not None:
+        outbox_task.cancel()
+    # Закрываем пул соединений к Cal.com
+    await calcom.aclose()
+
+
+init_tracing("mcp-server")
+mcp = FastMCP(USER_AGENT, lifespan=lifespan)
+mcp.add_middleware(ToolMetricsMiddleware())
+
+CACHES = {"event_types": event_types_cache, "slots": slots_cache}
+REGISTRY.callback_counter(
+    "mcp_cache_requests_total",
+    "Обращения к кэшам MCP сервера",
+    ("cache", "result"),
+    lambda: {
+        (name, result): cache.stats()[result]
+        for name, cache in CACHES.items() for result in ("hits", "misses")
+    },
+)
+REGISTRY.gauge(
+    "mcp_cache_hit_ratio",
+    "Доля попаданий в кэш",
+    ("cache",),
+    lambda: {(name,): cache.stats()["hit_ratio"] for name, cache in CACHES.items()},
+)
+REGISTRY.gauge(
+    "mcp_cache_size",
+    "Количество записей в кэше",
+    ("cache",),
+    lambda: {(name,): len(cache) for name, cache in CACHES.items()},
+)
+
+
+@mcp.custom_route("/metrics", methods=["GET"])
+async def metrics(request: Request) -> PlainTextResponse:
+    """Метрики в формате Prometheus (доступны при HTTP транспорте)"""
+    return PlainTextResponse(REGISTRY.render(), media_type="text/plain; version=0.0.4")
 
 async def create_custom_event_type(
     api_key: str,
@@ -46,9 +150,9 @@ async def create_custom_event_type(
     if not slug:
         slug = f"meeting-{duration_minutes}min"
     
-    response = requests.post(
-        f"{CAL_COM_URL}/v1/event-types",
-        params={"apiKey": api_key},
+    response = await calcom.post(
+        "/v1/event-types",
+        api_key=api_key,
         json={
             "title": title,
             "slug": slug,
@@ -58,6 +162,8 @@ async def create_custom_event_type(
     )
     
     if response.status_code in [200, 201]:
+        # Список event types изменился - сбрасываем кэш для этого ключа
+        event_types_cache.invalidate(api_key)
         return response.json()
     else:
         return {"error": response.text}
@@ -73,28 +179,280 @@ async def find_event_type_by_duration(
     Returns:
         int | None: id event type
     """    
-    # Получить все event types пользователя
-    response = requests.get(
-        f"{CAL_COM_URL}/v1/event-types",
-        params={"apiKey": api_key}
+    index = event_types_cache.get(api_key)
+    if index is None:
+        # Получить все event types пользователя
+        response = await calcom.get("/v1/event-types", api_key=api_key)
+        if response.status_code != 200:
+            return None
+
+        # Индекс длительность -> id (берем первый подходящий, как и раньше)
+        index = {}
+        for et in response.json().get("event_types", []):
+            index.setdefault(et["length"], et["id"])
+        event_types_cache.set(api_key, index)
+
+    return index.get(duration_minutes)
+
+async def ensure_event_type(
+        api_key: str,
+        duration_minutes: int,
+        title: str) -> tuple[int | None, dict | None]:
+    """Найти event type с нужной длительностью или создать его
+
+    Одновременные вызовы с одинаковыми (api_key, duration_minutes) выполняют
+    один поиск/создание и получают общий результат.
+
+    Args:
+        api_key (str): ключ доступа к календарю
+        duration_minutes (int): длительность в минутах
+        title (str): название для нового event type
+
+    Returns:
+        tuple[int | None, dict | None]: id event type и ответ Cal.com при ошибке создания
+    """
+    async def lookup_or_create():
+        event_type_id = await find_event_type_by_duration(
+            api_key=api_key,
+            duration_minutes=duration_minutes
+        )
+        if event_type_id:
+            return event_type_id, None
+
+        logger.info(f"Creating new event type for {duration_minutes} minutes")
+        create_response = await create_custom_event_type(
+            api_key=api_key,
+            title=title,
+            duration_minutes=duration_minutes
+        )
+        if "event_type" in create_response and "id" in create_response["event_type"]:
+            return create_response["event_type"]["id"], None
+
+        # Event type мог создать другой процесс (конфликт slug) - перечитываем
+        event_types_cache.invalidate(api_key)
+        event_type_id = await find_event_type_by_duration(
+            api_key=api_key,
+            duration_minutes=duration_minutes
+        )
+        if event_type_id:
+            return event_type_id, None
+        return None, create_response
+
+    return await event_type_flight.do((api_key, duration_minutes), lookup_or_create)
+
+async def fetch_slots(
+        api_key: str,
+        username: str,
+        event_type_id: int,
+        date_from: str,
+        date_to: str) -> dict:
+    """Запросить свободные слоты из Cal.com API
+
+    Слоты кэшируются по дням, поэтому пересекающиеся диапазоны
+    запрашивают у Cal.com только недостающие дни.
+
+    Args:
+        api_key (str): ключ доступа к календарю
+        username (str): имя пользователя в Cal.com
+        event_type_id (int): id event type нужной длительности
+        date_from (str): начальная дата YYYY-MM-DD
+        date_to (str): конечная дата YYYY-MM-DD
+
+    Raises:
+        CalComError: Cal.com вернул неуспешный ответ
+
+    Returns:
+        dict: слоты по дням в формате Cal.com ({дата: [{"time": ...}]})
+    """
+    try:
+        first_day = date.fromisoformat(date_from[:10])
+        last_day = date.fromisoformat(date_to[:10])
+    except ValueError:
+        # Нестандартный формат дат - отдаем как есть в Cal.com, без кэша
+        return await request_slots(api_key, username, event_type_id, date_from, date_to)
+
+    days = [
+        (first_day + timedelta(days=i)).isoformat()
+        for i in range((last_day - first_day).days + 1)
+    ]
+    slots = {}
+    missing = []
+    for day in days:
+        cached = slots_cache.get((username, event_type_id, day))
+        if cached is None:
+            missing.append(day)
+        else:
+            slots[day] = cached
+
+    if missing:
+        # Один запрос на весь диапазон недостающих дней, включая последний день
+        fetched = await request_slots(
+            api_key, username, event_type_id,
+            missing[0],
+            (date.fromisoformat(missing[-1]) + timedelta(days=1)).isoformat()
+        )
+        for day in days[days.index(missing[0]):days.index(missing[-1]) + 1]:
+            slots[day] = fetched.get(day, [])
+            slots_cache.set((username, event_type_id, day), slots[day])
+
+    return {day: slots[day] for day in days if slots[day]}
+
+async def request_slots(
+        api_key: str,
+        username: str,
+        event_type_id: int,
+        start_time: str,
+        end_time: str,
+        priority: Priority = Priority.PROBE) -> dict:
+    """Запрос /v1/slots к Cal.com без кэша"""
+    response = await calcom.get(
+        "/v1/slots",
+        api_key=api_key,
+        params={
+            "username": username,
+            "eventTypeId": event_type_id,
+            "startTime": start_time,
+            "endTime": end_time,
+            "timeZone": "Europe/Moscow"
+        },
+        # Проверки свободного времени уступают очередь бронированиям
+        priority=priority
     )
-    
-    if response.status_code == 200:
-        event_types = response.json().get("event_types", [])
-        
-        # Ищем подходящий по длительности
-        for et in event_types:
-            if et["length"] == duration_minutes:
-                return et["id"]
-    
-    return None
+
+    if response.status_code != 200:
+        logger.error(f"Cal.com API error: {response.status_code} - {response.text}")
+        raise CalComError(response.status_code, response.text)
+
+    return response.json().get("slots", {})
+
+def invalidate_slots(usernames: list[str], start_time: str, duration_minutes: int):
+    """Сбросить кэш слотов календарей на дни, которые задевает встреча"""
+    try:
+        start = local_time(start_time)
+    except ValueError:
+        slots_cache.invalidate_where(lambda key: key[0] in usernames)
+        return
+
+    end = start + timedelta(minutes=duration_minutes)
+    days = {
+        start.astimezone(LOCAL_TZ).date().isoformat(),
+        end.astimezone(LOCAL_TZ).date().isoformat()
+    }
+    removed = slots_cache.invalidate_where(
+        lambda key: key[0] in usernames and key[2] in days
+    )
+    logger.info(f"Сброшено {removed} записей кэша слотов для {usernames} на {sorted(days)}")
+
+def candidate_names(candidates: list[tuple[EmployeeRecord, float]]) -> list[str]:
+    return [record.name for record, _ in candidates]
+
+def preference_note(text: str | None, preference: Preference) -> dict:
+    """Предпочтение в ответе тула: исходный текст рядом с разобранными ограничениями
+
+    Разбор текста эвристический, поэтому модель сверяется с самим текстом.
+    """
+    if not text:
+        return {}
+    return {"preference": text, "preference_parsed": preference.describe()}
+
+async def refresh_availability(
+        employees: list[EmployeeRecord],
+        priority: Priority = Priority.PROBE) -> dict[str, str]:
+    """Загрузить в индекс свободное время сотрудников на весь горизонт индекса
+
+    Слоты запрашиваются event type длиной в интервал сетки индекса: так каждый
+    свободный интервал сетки - отдельный слот Cal.com. Запрос идет мимо кэша
+    слотов: строки индекса обновляются раз в TTL, и дни всего горизонта
+    вытеснили бы из кэша слоты, нужные тулам.
+
+    Args:
+        employees (list[EmployeeRecord]): сотрудники
+        priority (Priority): полоса запросов к Cal.com
+
+    Returns:
+        dict[str, str]: ошибки загрузки по именам сотрудников
+    """
+    availability_index.roll()
+    bucket_minutes = int(availability_index.bucket.total_seconds() // 60)
+    origin = availability_index.origin
+    date_from = origin.date().isoformat()
+    date_to = availability_index.end.date().isoformat()
+
+    async def load_row(employee: EmployeeRecord):
+        event_type_id, create_response = await ensure_event_type(
+            api_key=employee.cal_com_api_key,
+            duration_minutes=bucket_minutes,
+            title=f"Meeting {bucket_minutes}min"
+        )
+        if not event_type_id:
+            raise CalComError(0, str(create_response.get("error", "Unknown error")))
+        slots = await request_slots(
+            employee.cal_com_api_key,
+            employee.cal_com_username,
+            event_type_id,
+            date_from,
+            date_to,
+            priority=priority
+        )
+        if availability_index.origin != origin:
+            # Пока шел запрос, сетка сдвинулась на новый день: слоты не покрывают ее горизонт
+            raise CalComError(0, "Сетка индекса сдвинулась во время загрузки")
+        availability_index.set_free(employee.id, slots_to_intervals(slots, bucket_minutes))
+
+    async def load(employee: EmployeeRecord):
+        # Фоновая загрузка не должна задерживать тот же запрос пользователя
+        await availability_flight.do((employee.id, priority), lambda: load_row(employee))
+
+    results = await asyncio.gather(*(load(e) for e in employees), return_exceptions=True)
+    return {
+        e.name: str(getattr(r, "details", r) or type(r).__name__)
+        for e, r in zip(employees, results) if isinstance(r, Exception)
+    }
+
+async def run_availability_refresh(interval: float = AVAILABILITY_TTL / 2):
+    """Фоновая задача: держать строки всех сотрудников справочника свежими"""
+    while True:
+        try:
+            await directory.ensure_loaded()
+            errors = await refresh_availability(directory.all(), Priority.BACKGROUND)
+            if errors:
+                logger.error(f"Не удалось обновить индекс свободного времени: {errors}")
+        except Exception as e:
+            logger.error(f"Обновление индекса свободного времени не удалось: {e}")
+        await asyncio.sleep(interval)
+
+async def local_conflicts(employees: list[EmployeeRecord], start_time: str, duration_minutes: int) -> list[dict]:
+    """Встречи сотрудников из локальной копии, пересекающиеся с новой встречей"""
+    if not bookings.BOOKINGS_MIRROR:
+        return []
+    try:
+        start = local_time(start_time)
+    except ValueError:
+        # Формат времени проверит Cal.com
+        return []
+    try:
+        found = await bookings.find_conflicts(
+            [e.id for e in employees],
+            start,
+            start + timedelta(minutes=duration_minutes)
+        )
+    except Exception as e:
+        # Копия недоступна - решение о конфликте остается за Cal.com
+        logger.error(f"Не удалось проверить конфликты по локальной копии: {e}")
+        return []
+    names = {e.id: e.name for e in employees}
+    return [
+        {"employee": names[b.employee_id], "booking_id": b.calcom_booking_id, **bookings.describe(b)}
+        for b in found
+    ]
 
 async def create_meeting(
     organizer_name: str,     # ← От кого исходит встреча
     attendee_name: str,      # ← Кому назначается встреча
     start_time: str,
     duration_minutes: int,
-    title: str = "Meeting"
+    title: str = "Meeting",
+    idempotency_key: str | None = None
 ) -> dict:
     """Назначает встречу между двумя сотрудниками
     
@@ -104,59 +462,66 @@ async def create_meeting(
         start_time: Время начала в ISO 8601 формате (например, "2025-12-10T14:00:00Z")
         duration_minutes: Длительность встречи в минутах
         title: Название встречи
+        idempotency_key: Ключ заявки из очереди (сохраняется в metadata бронирования)
     
     Returns:
         dict: Информация о созданной встрече
     """
     
-    # Получаем обоих сотрудников из БД
-    async with SessionLocal() as session:
-        # Организатор (от кого)
-        result_organizer = await session.execute(
-            select(Employee).where(Employee.name == organizer_name)
-        )
-        organizer = result_organizer.scalar_one_or_none()
-        logger.info(f"organizer: {organizer.name}")
-        # Участник (кому)
-        result_attendee = await session.execute(
-            select(Employee).where(Employee.name == attendee_name)
-        )
-        attendee = result_attendee.scalar_one_or_none()
-        logger.info(f"attendee: {attendee.name}")
-        if not organizer:
-            return {"error": f"Организатор '{organizer_name}' не найден в БД"}
-        
-        if not attendee:
-            return {"error": f"Участник '{attendee_name}' не найден в БД"}
+    # Получаем обоих сотрудников из справочника
+    await directory.ensure_loaded()
+    # Организатор (от кого)
+    organizer, candidates = directory.resolve(organizer_name)
+    if not organizer:
+        return {
+            "error": f"Организатор '{organizer_name}' не найден в БД",
+            "candidates": candidate_names(candidates)
+        }
+    logger.info(f"organizer: {organizer.name}")
+
+    # Участник (кому)
+    attendee, candidates = directory.resolve(attendee_name)
+    if not attendee:
+        return {
+            "error": f"Участник '{attendee_name}' не найден в БД",
+            "candidates": candidate_names(candidates)
+        }
+    logger.info(f"attendee: {attendee.name}")
+
+    # 0. Конфликты по локальной копии бронирований - без запросов к Cal.com
+    conflicts = await local_conflicts([organizer, attendee], start_time, duration_minutes)
+    if conflicts:
+        return {
+            "error": "Время уже занято встречей",
+            "conflicts": conflicts
+        }
     
-    # 1. Находим или создаем event type для организатора
-    event_type_id = await find_event_type_by_duration(
+    # 1-2. Находим или создаем event type для организатора
+    event_type_id, create_response = await ensure_event_type(
         api_key=organizer.cal_com_api_key,  # ← API ключ ОРГАНИЗАТОРА
-        duration_minutes=duration_minutes
+        duration_minutes=duration_minutes,
+        title=f"{title} ({duration_minutes}min)"
     )
-    
-    # 2. Если event type не найден - создаем
     if not event_type_id:
-        logger.info(f"Creating new event type for {duration_minutes} minutes")
-        create_response = await create_custom_event_type(
-            api_key=organizer.cal_com_api_key,
-            title=f"{title} ({duration_minutes}min)",
-            duration_minutes=duration_minutes
-        )
-        
-        if "event_type" in create_response and "id" in create_response["event_type"]:
-            event_type_id = create_response["event_type"]["id"]
-        else:
-            return {
-                "error": "Failed to create event type",
-                "details": create_response
-            }
+        return {
+            "error": "Failed to create event type",
+            "details": create_response
+        }
     
+    metadata = {
+        "organizer": organizer_name,
+        "attendee": attendee_name
+    }
+    if idempotency_key:
+        # По ключу повтор заявки найдет встречу, созданную прошлой попыткой
+        metadata["idempotencyKey"] = idempotency_key
+
     # 3. Создаем встречу в календаре ОРГАНИЗАТОРА
-    response = requests.post(
-        f"{CAL_COM_URL}/v1/bookings",
+    response = await calcom.post(
+        "/v1/bookings",
+        api_key=organizer.cal_com_api_key,
+        priority=Priority.BOOKING,
         params={
-            "apiKey": organizer.cal_com_api_key,
             "username": organizer.cal_com_username
         },  # ← Создаем В КАЛЕНДАРЕ организатора
         json={
@@ -168,22 +533,38 @@ async def create_meeting(
             },
             "timeZone": "Europe/Moscow",
             "language": "ru",
-            "metadata": {
-                "organizer": organizer_name,
-                "attendee": attendee_name
-            }
+            "metadata": metadata
         }
     )
     
     if response.status_code not in [200, 201]:
         return {
             "error": f"Cal.com API error: {response.status_code}",
+            "status_code": response.status_code,
             "details": response.text
         }
     
     booking_data = response.json()
 
     logger.info(booking_data)
+    await bookings.record_booking(organizer, attendee, booking_data, start_time, duration_minutes, title)
+
+    # Занятое время больше не свободно - сбрасываем кэш слотов
+    invalidate_slots(
+        [organizer.cal_com_username, attendee.cal_com_username],
+        start_time,
+        duration_minutes
+    )
+    try:
+        start = local_time(start_time)
+        availability_index.mark_busy(
+            [organizer.id, attendee.id],
+            start,
+            start + timedelta(minutes=duration_minutes)
+        )
+    except ValueError:
+        # Нестандартный формат времени: строки обновятся при следующей загрузке
+        pass
     
     return {
         "success": True,
@@ -205,44 +586,233 @@ async def create_meeting(
         }
     }
 
+async def execute_intent(job) -> dict:
+    """Создать встречу по заявке из очереди"""
+    return await create_meeting(
+        organizer_name=job.organizer_name,
+        attendee_name=job.attendee_name,
+        start_time=job.start_time.isoformat(),
+        duration_minutes=job.duration_minutes,
+        title=job.title,
+        idempotency_key=job.idempotency_key
+    )
+
+async def find_existing_booking(job) -> int | None:
+    """Найти в календаре организатора встречу, созданную прошлой попыткой заявки
+
+    Совпадением считается бронирование с ключом заявки в metadata или с тем же
+    началом и тем же участником.
+    """
+    await directory.ensure_loaded()
+    organizer = directory.get(job.organizer_name)
+    attendee = directory.get(job.attendee_name)
+    if organizer is None:
+        return None
+    response = await calcom.get(
+        "/v1/bookings",
+        api_key=organizer.cal_com_api_key,
+        params={"sortBy": "createdAt", "order": "desc", "take": 50},
+        priority=Priority.BOOKING
+    )
+    if response.status_code != 200:
+        raise CalComError(response.status_code, response.text)
+
+    for booking in response.json().get("bookings", []):
+        if booking.get("status") in bookings.INACTIVE_STATUSES:
+            continue
+        if (booking.get("metadata") or {}).get("idempotencyKey") == job.idempotency_key:
+            return booking["id"]
+        emails = {(a.get("email") or "").casefold() for a in booking.get("attendees") or []}
+        if (
+            attendee is not None
+            and parse_time(booking["startTime"]) == job.start_time
+            and (attendee.email or "").casefold() in emails
+        ):
+            return booking["id"]
+    return None
+
+outbox_worker = outbox.OutboxWorker(book=execute_intent, find_existing=find_existing_booking)
+
+async def enqueue_meeting(
+    organizer_name: str,
+    attendee_name: str,
+    start_time: str,
+    duration_minutes: int,
+    title: str,
+    idempotency_key: str | None
+) -> dict:
+    """Проверить запрос на встречу и поставить его в очередь заявок
+
+    Returns:
+        dict: статус заявки (pending) или ошибка проверки
+    """
+    await directory.ensure_loaded()
+    organizer, candidates = directory.resolve(organizer_name)
+    if not organizer:
+        return {
+            "success": False,
+            "error": f"Организатор '{organizer_name}' не найден в БД",
+            "candidates": candidate_names(candidates)
+        }
+    attendee, candidates = directory.resolve(attendee_name)
+    if not attendee:
+        return {
+            "success": False,
+            "error": f"Участник '{attendee_name}' не найден в БД",
+            "candidates": candidate_names(candidates)
+        }
+    try:
+        start = local_time(start_time)
+    except ValueError:
+        return {"success": False, "error": "start_time должно быть в формате ISO 8601"}
+    if not 0 < duration_minutes <= 24 * 60:
+        return {"success": False, "error": "Длительность встречи должна быть от 1 минуты до 24 часов"}
+    if start < datetime.now(timezone.utc):
+        return {"success": False, "error": "Время встречи уже прошло"}
+
+    key = idempotency_key or outbox.make_key(organizer, attendee, start, duration_minutes, title)
+    # Повтор уже выполненной заявки находит ее до проверки конфликтов: ее встреча
+    # уже в локальной копии и иначе выглядела бы занятым временем
+    try:
+        existing = next(iter(await outbox.get_intents(idempotency_key=key)), None)
+    except Exception as e:
+        logger.error(f"Не удалось найти заявку по ключу: {e}")
+        return {"success": False, "error": "Не удалось поставить встречу в очередь", "details": str(e)}
+    if existing is not None:
+        if not outbox.same_request(existing, organizer, attendee, start, duration_minutes, title):
+            return key_reused(existing)
+        if existing.status in (outbox.PENDING, outbox.PROCESSING) or (
+            existing.status == outbox.BOOKED and idempotency_key is not None
+        ):
+            return {"success": True, **outbox.describe(existing), "duplicate": True}
+
+    conflicts = await local_conflicts([organizer, attendee], start.isoformat(), duration_minutes)
+    if existing is not None and existing.status == outbox.BOOKED:
+        if any(c["booking_id"] == existing.calcom_booking_id for c in conflicts):
+            # Встреча заявки еще в календаре - это повтор, а не новая встреча
+            return {"success": True, **outbox.describe(existing), "duplicate": True}
+    if conflicts:
+        return {"success": False, "error": "Время уже занято встречей", "conflicts": conflicts}
+
+    try:
+        # Ключ по параметрам не должен навсегда закрывать встречу: ее могли отменить
+        intent, queued = await outbox.enqueue(
+            organizer, attendee, start, duration_minutes, title, key,
+            rebook=idempotency_key is None
+        )
+    except Exception as e:
+        logger.error(f"Не удалось записать заявку на встречу: {e}")
+        return {"success": False, "error": "Не удалось поставить встречу в очередь", "details": str(e)}
+
+    if not queued and not outbox.same_request(intent, organizer, attendee, start, duration_minutes, title):
+        return key_reused(intent)
+    if queued:
+        outbox_worker.wake()
+    result = {"success": True, **outbox.describe(intent)}
+    if not queued:
+        # Та же встреча уже запрошена: отдаем статус существующей заявки, дубль не создается
+        result["duplicate"] = True
+    return result
+
+def key_reused(intent) -> dict:
+    """Ответ на ключ идемпотентности, уже использованный для другой встречи"""
+    return {
+        "success": False,
+        "error": "idempotency_key уже использован для другой встречи",
+        "existing": outbox.describe(intent)
+    }
+
 @mcp.tool()
 async def get_all_departments() -> list[str]:
     """
     Получает список всех отделов компании
     """  
-    async with SessionLocal() as session:  
-        logger.info("Tool вызван: get_all_departments()")
-        result = await session.execute(
-            select(Employee.department).distinct()
-        )
-        departments = result.scalars().all()
-
-        return departments
+    logger.info("Tool вызван: get_all_departments()")
+    await directory.ensure_loaded()
+    return directory.departments()
     
 @mcp.tool()
 async def get_all_employees_from_department(department: str) -> list[str]:
     """
     Получает список всех сотрудников отдела
     """  
-    async with SessionLocal() as session:  
-        logger.info(f"Tool вызван: get_all_employees_from_department(department: {department})")
-        result = await session.execute(
-            select(Employee.name).where(Employee.department == department)
-        )
-        employees = result.scalars().all()
-
-        return employees
+    logger.info(f"Tool вызван: get_all_employees_from_department(department: {department})")
+    await directory.ensure_loaded()
+    return [e.name for e in directory.by_department(department)]
     
 @mcp.tool()
 async def get_full_employee_info(employee_name: str):
     """
         Получить полную информацию о пользователе по его имени
     """
-    async with SessionLocal() as session:
-        stmt = select(Employee).where(Employee.name == employee_name)
-        result = await session.execute(stmt)
-        row = result.scalar_one_or_none()
-        return row
+    await directory.ensure_loaded()
+    record, _ = directory.resolve(employee_name)
+    return record.as_dict() if record else None
+
+@mcp.tool(
+    name="find_employee",
+    description="Ищет сотрудников по неточному имени (опечатки, часть имени, латиница/кириллица)"
+)
+async def find_employee(query: str, limit: int = 5) -> dict:
+    """
+    Найти сотрудников, имя которых похоже на запрос
+
+    Args:
+        query (str): Имя, фамилия или их часть в любой раскладке (например, "Nikolay")
+        limit (int): Максимальное количество кандидатов. Defaults to 5.
+
+    Returns:
+        dict: Кандидаты с оценкой сходства от 0 до 1, лучшие - первыми
+    """
+    logger.info(f"Tool вызван: find_employee(query={query})")
+    await directory.ensure_loaded()
+    return {
+        "query": query,
+        "candidates": [
+            {
+                "name": record.name,
+                "department": record.department,
+                "score": score
+            }
+            for record, score in directory.search(query, limit)
+        ]
+    }
+
+@mcp.tool(
+    name="employee_meetings",
+    description="Показывает уже назначенные встречи сотрудника за период (по локальной копии календаря)"
+)
+async def get_employee_meetings(employee_name: str, date_from: str, date_to: str) -> dict:
+    """
+    Встречи сотрудника из локальной копии бронирований Cal.com
+
+    Args:
+        employee_name (str): Имя сотрудника из базы данных
+        date_from (str): Начальная дата в формате YYYY-MM-DD
+        date_to (str): Конечная дата в формате YYYY-MM-DD (включительно)
+
+    Returns:
+        dict: Встречи сотрудника по времени начала
+    """
+    logger.info(f"Tool вызван: get_employee_meetings({employee_name}, {date_from} to {date_to})")
+    if not bookings.BOOKINGS_MIRROR:
+        return {"error": "Локальная копия бронирований отключена (BOOKINGS_MIRROR=0)"}
+
+    await directory.ensure_loaded()
+    employee, candidates = directory.resolve(employee_name)
+    if not employee:
+        return {
+            "error": f"Сотрудник '{employee_name}' не найден в базе данных",
+            "candidates": candidate_names(candidates)
+        }
+
+    start = datetime.combine(date.fromisoformat(date_from), datetime.min.time(), LOCAL_TZ)
+    end = datetime.combine(date.fromisoformat(date_to) + timedelta(days=1), datetime.min.time(), LOCAL_TZ)
+    found = await bookings.employee_bookings(employee.id, start, end)
+    return {
+        "employee": employee.name,
+        "meetings": [bookings.describe(b) for b in found]
+    }
 
 @mcp.tool(
     name="create_meeting",
@@ -253,20 +823,36 @@ async def create_meeting_both_calendars(
     attendee_name: str,
     start_time: str,
     duration_minutes: int,
-    title: str = "Meeting"
+    title: str = "Meeting",
+    detail: bool = False,
+    idempotency_key: str | None = None
 ) -> dict:
     """Создать встречу для сотрудников
 
+    Встреча ставится в очередь и создается в фоне: ответ сразу приходит со статусом
+    pending и request_id для тула booking_status. Повторный вызов с теми же
+    параметрами (или тем же idempotency_key) не создает вторую встречу.
+
     Args:
         organizer_name (str): организатор
         attendee_name (str): собеседник
         start_time (str): начало собрания (формат ISO 8601)
         duration_minutes (int): длительность
         title (str, optional): Заголовок. Defaults to "Meeting".
+        detail (bool, optional): Полный ответ (username, ссылки на календари), только
+            без очереди (BOOKING_OUTBOX=0). Defaults to False.
+        idempotency_key (str | None, optional): Свой ключ идемпотентности; с другими
+            параметрами встречи тот же ключ дает ошибку. Defaults to None (ключ строится
+            из участников, времени, длительности и заголовка; отмененную встречу
+            можно поставить заново).
 
     Returns:
         dict: _description_
     """    
+    if outbox.BOOKING_OUTBOX:
+        return ToolResult(structured_content=await enqueue_meeting(
+            organizer_name, attendee_name, start_time, duration_minutes, title, idempotency_key
+        ))
     
     booking1 = await create_meeting(
         organizer_name=organizer_name,
@@ -284,7 +870,10 @@ async def create_meeting_both_calendars(
     #     duration_minutes=duration_minutes,
     #     title=title
     # )
-    
+
+    if not detail:
+        return ToolResult(structured_content=compact_booking(booking1))
+
     return ToolResult(
         structured_content={
         "success": True,
@@ -294,6 +883,46 @@ async def create_meeting_both_calendars(
         }
     })
 
+@mcp.tool(
+    name="booking_status",
+    description="Статус встреч, поставленных в очередь тулом create_meeting"
+)
+async def get_booking_status(
+    request_ids: list[int] | None = None,
+    idempotency_key: str | None = None,
+    wait_seconds: float = 0
+) -> dict:
+    """
+    Узнать, созданы ли встречи из очереди
+
+    Args:
+        request_ids (list[int] | None): request_id из ответа create_meeting. Defaults to None.
+        idempotency_key (str | None): Ключ идемпотентности заявки. Defaults to None.
+        wait_seconds (float): Подождать до этого времени (не больше MAX_STATUS_WAIT секунд),
+            пока заявки в очереди не завершатся. Defaults to 0.
+
+    Returns:
+        dict: Статусы заявок: pending, processing, booked или failed
+    """
+    if not request_ids and not idempotency_key:
+        return {"error": "Укажите request_ids или idempotency_key"}
+
+    deadline = asyncio.get_running_loop().time() + min(max(wait_seconds, 0), MAX_STATUS_WAIT)
+    while True:
+        try:
+            intents = await outbox.get_intents(request_ids, idempotency_key)
+        except Exception as e:
+            logger.error(f"Не удалось получить статус заявок: {e}")
+            return {"error": "Не удалось получить статус заявок", "details": str(e)}
+        waiting = any(i.status in (outbox.PENDING, outbox.PROCESSING) for i in intents)
+        if not waiting or asyncio.get_running_loop().time() >= deadline:
+            break
+        await asyncio.sleep(STATUS_POLL_INTERVAL)
+
+    if not intents:
+        return {"error": "Заявки не найдены"}
+    return ToolResult(structured_content={"requests": [outbox.describe(i) for i in intents]})
+
 @mcp.tool(
     name="free_slots",
     description="Проверяет наличие свободных слотов в определенный промежуток"
@@ -302,7 +931,9 @@ async def get_available_slots(
     employee: EmployeeSchema,
     date_from: str,
     date_to: str,
-    duration_minutes: int = 60
+    duration_minutes: int = 60,
+    detail: bool = False,
+    respect_preference: bool = True
 ) -> dict:
     """
     Получить свободные временные слоты сотрудника с заданной длительностью
@@ -312,100 +943,86 @@ async def get_available_slots(
         date_from (str): Начальная дата в формате YYYY-MM-DD (например, "2025-12-10")
         date_to (str): Конечная дата в формате YYYY-MM-DD (например, "2025-12-15")
         duration_minutes (int): Длительность встречи в минутах. Defaults to 60.
+        detail (bool): Каждый слот отдельно с началом и концом в ISO 8601. По умолчанию
+            свободное время отдается диапазонами по дням ("10:00-12:30"), начало встречи -
+            от начала диапазона с шагом start_step_minutes. Defaults to False.
+        respect_preference (bool): Учесть предпочтение сотрудника (поле preference):
+            подходящие слоты - в free, остальные - в outside_preference (при detail -
+            признак fits_preference у слота). Defaults to True.
     
     Returns:
         dict: Словарь со свободными слотами по дням
     """
-    from datetime import datetime, timedelta
-    
     logger.info(f"Tool вызван: get_available_slots(employee={employee.name}, {date_from} to {date_to}, duration={duration_minutes}min)")
     
-    # 1. Найти сотрудника в БД
-    async with SessionLocal() as session:
-        result = await session.execute(
-            select(Employee).where(Employee.name == employee.name)
-        )
-        employee_result = result.scalar_one_or_none()
-        
-        if not employee_result:
-            logger.error(f"Сотрудник '{employee.name}' не найден")
-            return {
-                "error": f"Сотрудник '{employee.name}' не найден в базе данных",
-                "employee": employee.name
-            }
-        
-        # Получаем Cal.com username (если есть поле в модели)
-        cal_username = getattr(employee_result, 'cal_com_username', None)
+    # 1. Найти сотрудника в справочнике
+    await directory.ensure_loaded()
+    employee_result, candidates = directory.resolve(employee.name)
+    
+    if not employee_result:
+        logger.error(f"Сотрудник '{employee.name}' не найден")
+        return {
+            "error": f"Сотрудник '{employee.name}' не найден в базе данных",
+            "employee": employee.name,
+            "candidates": candidate_names(candidates)
+        }
+    
+    # Получаем Cal.com username
+    cal_username = employee_result.cal_com_username
     
     # 2. Найти или создать event type с нужной длительностью
-    event_type_id = await find_event_type_by_duration(
-        api_key=employee.api_key, 
-        duration_minutes=duration_minutes
+    event_type_id, create_response = await ensure_event_type(
+        api_key=employee_result.cal_com_api_key,
+        duration_minutes=duration_minutes,
+        title=f"Meeting {duration_minutes}min"
     )
     
     if not event_type_id:
-        logger.info(f"Event type на {duration_minutes} минут не найден, создаём новый")
-        create_response = await create_custom_event_type(
-            api_key=employee.api_key,
-            title=f"Meeting {duration_minutes}min",
-            duration_minutes=duration_minutes
-        )
-        
-        if "event_type" in create_response and "id" in create_response["event_type"]:
-            event_type_id = create_response["event_type"]["id"]
-            logger.info(f"Создан event type ID: {event_type_id}")
-        else:
-            logger.error(f"Не удалось создать event type: {create_response}")
-            return {
-                "error": f"Не удалось создать event type для {duration_minutes} минут",
-                "details": create_response.get("error", "Unknown error")
-            }
+        logger.error(f"Не удалось создать event type: {create_response}")
+        return {
+            "error": f"Не удалось создать event type для {duration_minutes} минут",
+            "details": create_response.get("error", "Unknown error")
+        }
     
     # 3. Запросить свободные слоты из Cal.com API
-    start_time = f"{date_from}"
-    end_time = f"{date_to}"
-    
     try:
-        response = requests.get(
-            f"{CAL_COM_URL}/v1/slots",
-            params={
-                "apiKey": employee.api_key,
-                "username": cal_username,
-                "eventTypeId": event_type_id,
-                "startTime": start_time,
-                "endTime": end_time,
-                "timeZone": "Europe/Moscow"
-            },
-            timeout=10
+        slots_data = await fetch_slots(
+            api_key=employee_result.cal_com_api_key,
+            username=cal_username,
+            event_type_id=event_type_id,
+            date_from=date_from,
+            date_to=date_to
         )
+
+        # Слоты вне предпочтения не отбрасываем: разбор текста может ошибиться,
+        # поэтому они идут отдельно, после подходящих
+        preference = employee_preference(employee_result) if respect_preference else NO_PREFERENCE
+        note = preference_note(employee_result.preference if respect_preference else None, preference)
         
-        if response.status_code != 200:
-            logger.error(f"Cal.com API error: {response.status_code} - {response.text}")
-            return ToolResult(
-                structured_content={
-                    "error": f"Ошибка Cal.com API: {response.status_code}",
-                    "details": response.text,
-                    "employee": employee.name
-                }
-            )
-        
-        api_response = response.json()
-        slots_data = api_response.get("slots", {})
-        
+        if not detail:
+            # 4. Слоты диапазонами по дням - в разы меньше токенов в контексте модели
+            suitable, outside = split_slots(preference, slots_data, duration_minutes)
+            result = {**compact_slots(employee.name, suitable, duration_minutes), **note}
+            if outside:
+                result["outside_preference"], _ = slot_ranges(outside, duration_minutes)
+            return ToolResult(structured_content=result)
+
         # 4. Обогатить слоты информацией о времени окончания
         enhanced_slots = {}
         total_count = 0
         
-        for date, slots in slots_data.items():
-            enhanced_slots[date] = []
+        for day, slots in slots_data.items():
+            enhanced_slots[day] = []
             for slot in slots:
                 start = datetime.fromisoformat(slot["time"].replace('Z', '+00:00'))
                 end = start + timedelta(minutes=duration_minutes)
                 
-                enhanced_slots[date].append({
+                enhanced_slots[day].append({
                     "start": slot["time"],
                     "end": end.isoformat()
                 })
+                if not preference.unconstrained:
+                    enhanced_slots[day][-1]["fits_preference"] = preference.fits(start, end)
                 total_count += 1
         
         logger.info(f"Найдено {total_count} свободных слотов для {employee.name}")
@@ -420,11 +1037,20 @@ async def get_available_slots(
                     "to": date_to
                 },
                 "slots": enhanced_slots,
-                "total_slots": total_count
+                "total_slots": total_count,
+                **note
             }
         )
         
-    except requests.exceptions.Timeout:
+    except CalComError as e:
+        return ToolResult(
+            structured_content={
+                "error": f"Ошибка Cal.com API: {e.status_code}",
+                "details": e.details,
+                "employee": employee.name
+            }
+        )
+    except httpx.TimeoutException:
         logger.error("Timeout при запросе к Cal.com API")
         return ToolResult(
             structured_content={
@@ -442,5 +1068,498 @@ async def get_available_slots(
             }
         )
 
+@mcp.tool(
+    name="common_free_slots",
+    description="Находит общие свободные окна для нескольких сотрудников с учетом их предпочтений"
+)
+async def get_common_free_slots(
+    employee_names: list[str],
+    date_from: str,
+    date_to: str,
+    duration_minutes: int = 60,
+    limit: int = 20,
+    respect_preferences: bool = True
+) -> dict:
+    """
+    Найти окна, в которые свободны все перечисленные сотрудники
+
+    Слоты всех сотрудников запрашиваются параллельно и пересекаются на сервере.
+    По умолчанию первыми идут части окон, подходящие под предпочтения (поле
+    preference) всех сотрудников, за ними - остальное время, ранжированное
+    по тому, скольким сотрудникам оно подходит.
+
+    Args:
+        employee_names (list[str]): Имена сотрудников из базы данных
+        date_from (str): Начальная дата в формате YYYY-MM-DD
+        date_to (str): Конечная дата в формате YYYY-MM-DD
+        duration_minutes (int): Длительность встречи в минутах. Defaults to 60.
+        limit (int): Максимальное количество окон в ответе. Defaults to 20.
+        respect_preferences (bool): Первыми - окна, подходящие под предпочтения всех.
+            Defaults to True.
+
+    Returns:
+        dict: Общие свободные окна, лучшие - первыми
+    """
+    logger.info(f"Tool вызван: get_common_free_slots({employee_names}, {date_from} to {date_to}, duration={duration_minutes}min)")
+
+    names = list(dict.fromkeys(employee_names))
+    if not names:
+        return {"error": "Не указаны сотрудники"}
+
+    await directory.ensure_loaded()
+    resolved = {name: directory.resolve(name) for name in names}
+
+    missing = {
+        name: candidate_names(candidates)
+        for name, (e, candidates) in resolved.items() if e is None
+    }
+    if missing:
+        return {
+            "error": "Сотрудники не найдены в базе данных",
+            "employees": list(missing),
+            "candidates": missing
+        }
+    employees = {e.name: e for e, _ in resolved.values()}
+    names = list(employees)
+
+    async def employee_intervals(employee: EmployeeRecord):
+        event_type_id, create_response = await ensure_event_type(
+            api_key=employee.cal_com_api_key,
+            duration_minutes=duration_minutes,
+            title=f"Meeting {duration_minutes}min"
+        )
+        if not event_type_id:
+            raise CalComError(0, str(create_response.get("error", "Unknown error")))
+
+        slots = await fetch_slots(
+            api_key=employee.cal_com_api_key,
+            username=employee.cal_com_username,
+            event_type_id=event_type_id,
+            date_from=date_from,
+            date_to=date_to
+        )
+        return slots_to_intervals(slots, duration_minutes)
+
+    # Параллельно запрашиваем слоты всех сотрудников
+    ordered = list(employees.values())
+    results = await asyncio.gather(
+        *(employee_intervals(e) for e in ordered),
+        return_exceptions=True
+    )
+    errors = {
+        e.name: str(getattr(r, "details", r) or type(r).__name__)
+        for e, r in zip(ordered, results) if isinstance(r, Exception)
+    }
+    if errors:
+        logger.error(f"Не удалось получить слоты: {errors}")
+        return {"error": "Не удалось получить слоты части сотрудников", "details": errors}
+
+    duration = timedelta(minutes=duration_minutes)
+    common = [
+        (start, end) for start, end in reduce(intersect_intervals, results)
+        if end - start >= duration
+    ]
+
+    # Предпочтения разобраны заранее и кэшируются по сотрудникам
+    preferences = {e.name: employee_preference(e) for e in ordered}
+
+    def long_enough(parts: list) -> list:
+        return [(s, e) for s, e in parts if e - s >= duration]
+
+    def ranked(start: datetime, end: datetime) -> dict:
+        parts = {name: long_enough(pref.clip(start, end)) for name, pref in preferences.items()}
+
+        # Начало, при котором встреча подходит наибольшему числу сотрудников:
+        # его всегда можно сдвинуть к началу окна или к началу чьей-то подходящей части
+        suggested_start, fits = start, []
+        for candidate in sorted({start} | {s for part in parts.values() for s, _ in part}):
+            group = [
+                name for name, part in parts.items()
+                if any(s <= candidate and candidate + duration <= e for s, e in part)
+            ]
+            if len(group) > len(fits):
+                suggested_start, fits = candidate, group
+        return {
+            "start": start.isoformat(),
+            "end": end.isoformat(),
+            "suggested_start": suggested_start.isoformat(),
+            "fits_preferences_of": fits,
+            "score": len(fits)
+        }
+
+    suitable = []
+    windows = []
+    for start, end in common:
+        if not respect_preferences:
+            windows.append(ranked(start, end))
+            continue
+        # Части окна, подходящие всем, идут первыми; остаток окна не отбрасывается,
+        # а ранжируется: разбор предпочтений может ошибиться
+        preferred = long_enough(reduce(intersect_intervals, (p.clip(start, end) for p in preferences.values())))
+        suitable.extend(ranked(s, e) for s, e in preferred)
+        windows.extend(ranked(s, e) for s, e in long_enough(subtract_intervals([(start, end)], preferred)))
+
+    windows.sort(key=lambda w: (-w["score"], w["start"]))
+    note = None
+    if respect_preferences:
+        if windows and not suitable:
+            note = "Нет окон, подходящих под предпочтения всех сотрудников: окна ранжированы по числу тех, кому они подходят"
+        windows = suitable + windows
+    logger.info(f"Найдено {len(windows)} общих окон для {names}")
+
+    result = {
+        "employees": names,
+        "duration_minutes": duration_minutes,
+        "date_range": {
+            "from": date_from,
+            "to": date_to
+        },
+        "windows": windows[:limit],
+        "total_windows": len(windows)
+    }
+    if respect_preferences:
+        texts = {
+            e.name: preference_note(e.preference, preferences[e.name])
+            for e in ordered if e.preference
+        }
+        if texts:
+            result["preferences"] = texts
+    if note:
+        result["note"] = note
+    return ToolResult(structured_content=result)
+
+@mcp.tool(
+    name="team_free_windows",
+    description="Находит ближайшие окна, в которые свободны все (или хотя бы min_free) сотрудники из списка или отдела"
+)
+async def get_team_free_windows(
+    employee_names: list[str] | None = None,
+    department: str | None = None,
+    duration_minutes: int = 60,
+    min_free: int | None = None,
+    count: int = 5,
+    date_from: str | None = None,
+    date_to: str | None = None,
+    respect_preferences: bool = True
+) -> dict:
+    """
+    Найти самые ранние окна для встречи команды
+
+    Ответ строится по индексу свободного времени без запросов к Cal.com
+    (кроме сотрудников, которых в индексе еще нет). Окна не пересекаются.
+
+    Args:
+        employee_names (list[str] | None): Имена сотрудников. Defaults to None.
+        department (str | None): Отдел: добавляет всех его сотрудников. Defaults to None.
+        duration_minutes (int): Длительность встречи в минутах. Defaults to 60.
+        min_free (int | None): Сколько сотрудников должны быть свободны. Defaults to None (все).
+        count (int): Сколько окон вернуть. Defaults to 5.
+        date_from (str | None): Начальная дата YYYY-MM-DD. Defaults to None (сейчас).
+        date_to (str | None): Конечная дата YYYY-MM-DD. Defaults to None (горизонт индекса).
+        respect_preferences (bool): Первыми - окна, в которые сотрудники свободны
+            в часы, подходящие под их предпочтения (fits_preferences). Defaults to True.
+
+    Returns:
+        dict: Окна по возрастанию времени (сначала подходящие под предпочтения), для каждого - кто занят
+    """
+    logger.info(f"Tool вызван: get_team_free_windows({employee_names}, department={department}, duration={duration_minutes}min, min_free={min_free})")
+
+    await directory.ensure_loaded()
+    employees: dict = {}
+    if department:
+        members = directory.by_department(department)
+        if not members:
+            return {
+                "error": f"Отдел '{department}' не найден или в нем нет сотрудников",
+                "departments": directory.departments()
+            }
+        employees.update((e.id, e) for e in members)
+
+    resolved = {name: directory.resolve(name) for name in dict.fromkeys(employee_names or [])}
+    missing = {
+        name: candidate_names(candidates)
+        for name, (e, candidates) in resolved.items() if e is None
+    }
+    if missing:
+        return {
+            "error": "Сотрудники не найдены в базе данных",
+            "employees": list(missing),
+            "candidates": missing
+        }
+    employees.update((e.id, e) for e, _ in resolved.values())
+    if not employees:
+        return {"error": "Не указаны сотрудники или отдел"}
+
+    ordered = list(employees.values())
+    min_free = len(ordered) if min_free is None else min_free
+    if not 1 <= min_free <= len(ordered):
+        return {"error": f"min_free должно быть от 1 до {len(ordered)}"}
+
+    availability_index.roll()
+    try:
+        start = max(datetime.now(LOCAL_TZ), availability_index.origin)
+        if date_from:
+            start = max(start, datetime.combine(date.fromisoformat(date_from[:10]), datetime.min.time(), LOCAL_TZ))
+        end = availability_index.end
+        if date_to:
+            end = min(end, datetime.combine(date.fromisoformat(date_to[:10]) + timedelta(days=1), datetime.min.time(), LOCAL_TZ))
+    except ValueError:
+        return {"error": "Даты должны быть в формате YYYY-MM-DD"}
+    if start >= end:
+        return {
+            "error": "Диапазон дат вне горизонта индекса",
+            "available_from": availability_index.origin.date().isoformat(),
+            "available_to": (availability_index.end - timedelta(days=1)).date().isoformat()
+        }
+
+    # Догружаем сотрудников, которых нет в индексе или чьи строки устарели.
+    # Во время загрузки сетка может сдвинуться на новый день и сбросить индекс,
+    # поэтому строки проверяются после нее и догружаются еще раз
+    errors = {}
+    for _ in range(2):
+        stale = set(availability_index.stale(list(employees)))
+        if not stale:
+            break
+        errors = await refresh_availability([e for e in ordered if e.id in stale])
+        if all(e.id in availability_index for e in ordered):
+            break
+    unknown = [e.name for e in ordered if e.id not in availability_index]
+    if unknown:
+        logger.error(f"Не удалось получить слоты {unknown}: {errors}")
+        return {
+            "error": "Не удалось получить слоты части сотрудников",
+            "employees": unknown,
+            "details": errors
+        }
+
+    ids = [e.id for e in ordered]
+    preferences = [employee_preference(e) for e in ordered]
+    ranked = respect_preferences and not all(p.unconstrained for p in preferences)
+    found = availability_index.earliest_windows(
+        ids, duration_minutes, min_free, count, start, end,
+        preferences=preferences if ranked else None
+    )
+    found = [(window, True) for window in found]
+    if ranked and len(found) < count:
+        # Окон в удобные по предпочтениям часы мало: добавляем окна без учета
+        # предпочтений после них. Каждое найденное окно пересекает не больше двух таких
+        extra = availability_index.earliest_windows(
+            ids, duration_minutes, min_free, count + len(found), start, end
+        )
+        taken = [(s, e) for (s, e, _), _ in found]
+        extra = [
+            (window, False) for window in extra
+            if not any(window[0] < e and s < window[1] for s, e in taken)
+        ]
+        found += extra[:count - len(found)]
+
+    windows = []
+    for (window_start, window_end, free), fits in found:
+        busy = [e.name for e, is_free in zip(ordered, free) if not is_free]
+        local_start = window_start.astimezone(LOCAL_TZ)
+        window = {
+            "start": local_start.strftime("%Y-%m-%d %H:%M"),
+            "end": window_end.astimezone(LOCAL_TZ).strftime("%H:%M"),
+            "free_count": len(ordered) - len(busy),
+            "unavailable": busy[:MAX_UNAVAILABLE_NAMES]
+        }
+        if len(busy) > MAX_UNAVAILABLE_NAMES:
+            window["unavailable_more"] = len(busy) - MAX_UNAVAILABLE_NAMES
+        if ranked:
+            window["fits_preferences"] = fits
+        windows.append(window)
+    logger.info(f"Найдено {len(windows)} окон для {len(ordered)} сотрудников")
+
+    result = {
+        "employees": len(ordered),
+        "min_free": min_free,
+        "duration_minutes": duration_minutes,
+        "timezone": str(LOCAL_TZ),
+        "windows": windows
+    }
+    if errors:
+        result["stale"] = list(errors)
+    return ToolResult(structured_content=result)
+
+@mcp.tool(
+    name="create_meetings_batch",
+    description="Создает несколько встреч за один вызов: по списку или по правилу повторения"
+)
+async def create_meetings_batch(
+    meetings: list[MeetingRequest] | None = None,
+    recurrence: RecurrenceRule | None = None,
+    max_parallel: int = 5,
+    check_availability: bool = True
+) -> dict:
+    """
+    Забронировать пакет встреч (регулярные встречи, серия 1:1 для отдела и т.п.)
+
+    Сначала за один проход проверяется доступность всех встреч, затем
+    подходящие бронируются параллельно (не больше max_parallel одновременно).
+    С очередью заявок каждая встреча становится заявкой со своим ключом
+    идемпотентности (status=pending и request_id для booking_status): повтор
+    пакета не создает встречи второй раз.
+
+    Args:
+        meetings (list[MeetingRequest], optional): Список встреч
+        recurrence (RecurrenceRule, optional): Правило повторения (ежедневно/еженедельно),
+            обязательно с count или until
+        max_parallel (int): Сколько бронирований выполнять одновременно. Defaults to 5.
+        check_availability (bool): Проверять ли свободные слоты перед бронированием. Defaults to True.
+
+    Returns:
+        dict: Отчет по каждой встрече и сводка
+    """
+    items = list(meetings or [])
+    if recurrence:
+        # На одну встречу больше лимита: так видно, что серия в него не помещается
+        items.extend(recurrence.occurrences(max(MAX_BATCH_SIZE - len(items) + 1, 0)))
+    logger.info(f"Tool вызван: create_meetings_batch({len(items)} встреч)")
+
+    if not items:
+        return {"error": "Не переданы встречи для бронирования"}
+    if len(items) > MAX_BATCH_SIZE:
+        # Молча отбросить лишние встречи нельзя: серия оказалась бы забронирована не целиком
+        return {
+            "error": f"В пакете больше {MAX_BATCH_SIZE} встреч: разбейте его на несколько вызовов "
+                     f"или сократите серию (count/until)"
+        }
+
+    await directory.ensure_loaded()
+    report = [
+        {
+            "index": i,
+            "organizer": item.organizer_name,
+            "attendee": item.attendee_name,
+            "start_time": item.start_time,
+            "duration_minutes": item.duration_minutes,
+            "status": "pending"
+        }
+        for i, item in enumerate(items)
+    ]
+
+    # 1. Проверка сотрудников и времени
+    people = {}
+    intervals = {}
+    for entry, item in zip(report, items):
+        organizer, _ = directory.resolve(item.organizer_name)
+        attendee, _ = directory.resolve(item.attendee_name)
+        if not organizer or not attendee:
+            entry.update(status="failed", error="Сотрудник не найден в БД")
+            continue
+        try:
+            start = datetime.fromisoformat(item.start_time.replace('Z', '+00:00'))
+        except ValueError:
+            entry.update(status="failed", error="Неверный формат start_time")
+            continue
+        if start.tzinfo is None:
+            start = start.replace(tzinfo=LOCAL_TZ)
+        entry.update(organizer=organizer.name, attendee=attendee.name)
+        people[entry["index"]] = (organizer, attendee)
+        intervals[entry["index"]] = (start, start + timedelta(minutes=item.duration_minutes))
+
+    # 2. Пересечения встреч внутри пакета у одного и того же сотрудника
+    busy: dict[str, list[tuple[datetime, datetime]]] = {}
+    for idx in sorted(intervals, key=lambda i: intervals[i][0]):
+        start, end = intervals[idx]
+        names = {p.name for p in people[idx]}
+        if any(s < end and start < e for name in names for s, e in busy.get(name, [])):
+            report[idx].update(status="conflict", error="Пересекается с другой встречей пакета")
+            continue
+        for name in names:
+            busy.setdefault(name, []).append((start, end))
+
+    # 3. Проверка доступности одним проходом: по одному запросу слотов
+    # на каждого (сотрудник, длительность) за весь диапазон дат пакета
+    if check_availability:
+        groups: dict[tuple[str, int], list[int]] = {}
+        for idx, pair in people.items():
+            if report[idx]["status"] != "pending":
+                continue
+            for person in pair:
+                groups.setdefault((person.name, items[idx].duration_minutes), []).append(idx)
+
+        async def free_starts(name: str, duration_minutes: int, indexes: list[int]):
+            person = directory.get(name)
+            event_type_id, create_response = await ensure_event_type(
+                api_key=person.cal_com_api_key,
+                duration_minutes=duration_minutes,
+                title=f"Meeting {duration_minutes}min"
+            )
+            if not event_type_id:
+                raise CalComError(0, str(create_response.get("error", "Unknown error")))
+            days = [intervals[i][0].astimezone(LOCAL_TZ).date() for i in indexes]
+            slots = await fetch_slots(
+                api_key=person.cal_com_api_key,
+                username=person.cal_com_username,
+                event_type_id=event_type_id,
+                date_from=min(days).isoformat(),
+                date_to=max(days).isoformat()
+            )
+            return {
+                parse_time(slot["time"])
+                for day_slots in slots.values() for slot in day_slots
+            }
+
+        keys = list(groups)
+        results = await asyncio.gather(
+            *(free_starts(name, duration, groups[(name, duration)]) for name, duration in keys),
+            return_exceptions=True
+        )
+        for (name, duration), starts in zip(keys, results):
+            for idx in groups[(name, duration)]:
+                if report[idx]["status"] != "pending":
+                    continue
+                if isinstance(starts, Exception):
+                    report[idx].update(status="failed", error=f"Не удалось получить слоты {name}: {starts}")
+                elif intervals[idx][0] not in starts:
+                    report[idx].update(status="unavailable", error=f"{name} занят в это время")
+
+    # 4. Параллельное бронирование с ограничением
+    semaphore = asyncio.Semaphore(max(1, min(max_parallel, MAX_BATCH_PARALLEL)))
+
+    async def book(idx: int):
+        item = items[idx]
+        organizer, attendee = people[idx]
+        # Через очередь: ключ идемпотентности встречи, повторы и аренда заявки
+        create = enqueue_meeting if outbox.BOOKING_OUTBOX else create_meeting
+        async with semaphore:
+            try:
+                result = await create(
+                    organizer_name=organizer.name,
+                    attendee_name=attendee.name,
+                    start_time=item.start_time,
+                    duration_minutes=item.duration_minutes,
+                    title=item.title,
+                    idempotency_key=None
+                )
+            except Exception as e:
+                result = {"error": f"Внутренняя ошибка: {e}"}
+        if not result.get("success"):
+            report[idx].update(status="failed", error=result.get("error"))
+        elif "request_id" in result:
+            report[idx].update(status=result["status"], request_id=result["request_id"])
+            if result.get("booking_id") is not None:
+                report[idx]["booking_id"] = result["booking_id"]
+        else:
+            report[idx].update(status="booked", booking_id=result["meeting"]["booking_id"])
+
+    await asyncio.gather(*(book(idx) for idx in people if report[idx]["status"] == "pending"))
+
+    summary = {}
+    for entry in report:
+        summary[entry["status"]] = summary.get(entry["status"], 0) + 1
+    logger.info(f"create_meetings_batch: {summary}")
+
+    # Заявки в очереди (pending) приняты: итог по ним - в booking_status
+    accepted = (outbox.BOOKED, outbox.PENDING, outbox.PROCESSING)
+    return ToolResult(
+        structured_content={
+            "success": all(entry["status"] in accepted for entry in report),
+            "summary": summary,
+            "meetings": report
+        }
+    )
+
 if __name__ == "__main__":
     mcp.run(transport="streamable-http", host="localhost", port=8000)
@@ -1,8 +1,9 @@
 import uuid
+from datetime import datetime
 
-from sqlalchemy import Integer, String
+from sqlalchemy import BigInteger, DateTime, ForeignKey, Index, Integer, String, UniqueConstraint, func
 from sqlalchemy.orm import relationship, Mapped, mapped_column, MappedAsDataclass
-from sqlalchemy.dialects.postgresql import UUID
+from sqlalchemy.dialects.postgresql import JSONB, UUID
 
 from backend.database import Base
 
@@ -45,3 +46,204 @@ class Employee(MappedAsDataclass, Base):
         String(100),
         comment="Ключ доступа к календарю"
     )
+
+
+class ConversationMessage(MappedAsDataclass, Base):
+    """Сообщение диалога с агентом (таблица только пополняется)"""
+    __tablename__ = 'conversation_messages'
+    __table_args__ = (
+        Index('ix_conversation_messages_conversation_id_id', 'conversation_id', 'id'),
+    )
+
+    id: Mapped[int] = mapped_column(
+        BigInteger,
+        primary_key=True,
+        autoincrement=True,
+        init=False
+    )
+    conversation_id: Mapped[str] = mapped_column(
+        String(64),
+        comment="Идентификатор диалога (чат Telegram, консоль)"
+    )
+    role: Mapped[str] = mapped_column(
+        String(16),
+        comment="Тип сообщения: human, ai, tool, system"
+    )
+    payload: Mapped[dict] = mapped_column(
+        JSONB,
+        comment="Сериализованное сообщение LangChain без пустых полей"
+    )
+    created_at: Mapped[datetime] = mapped_column(
+        DateTime(timezone=True),
+        server_default=func.now(),
+        init=False
+    )
+
+
+class Booking(MappedAsDataclass, Base):
+    """Встреча сотрудника: локальная копия бронирования Cal.com
+
+    Одно бронирование дает строку для каждого участника-сотрудника, поэтому
+    занятость сотрудника - это диапазон индекса (employee_id, start_time).
+    """
+    __tablename__ = 'bookings'
+    __table_args__ = (
+        Index('ix_bookings_employee_id_start_time', 'employee_id', 'start_time'),
+        UniqueConstraint('employee_id', 'calcom_booking_id', name='uq_bookings_employee_id_calcom_booking_id'),
+    )
+
+    id: Mapped[int] = mapped_column(
+        BigInteger,
+        primary_key=True,
+        autoincrement=True,
+        init=False
+    )
+    employee_id: Mapped[uuid.UUID] = mapped_column(
+        UUID(as_uuid=True),
+        ForeignKey('employees.id', ondelete='CASCADE'),
+        comment="Сотрудник, у которого занято время"
+    )
+    calcom_booking_id: Mapped[int] = mapped_column(
+        BigInteger,
+        comment="id бронирования в Cal.com"
+    )
+    title: Mapped[str] = mapped_column(
+        String(255),
+        comment="Название встречи"
+    )
+    start_time: Mapped[datetime] = mapped_column(
+        DateTime(timezone=True),
+        comment="Начало встречи"
+    )
+    end_time: Mapped[datetime] = mapped_column(
+        DateTime(timezone=True),
+        comment="Окончание встречи"
+    )
+    status: Mapped[str] = mapped_column(
+        String(16),
+        comment="Статус в Cal.com: ACCEPTED, PENDING, CANCELLED, REJECTED"
+    )
+    role: Mapped[str] = mapped_column(
+        String(16),
+        comment="Роль сотрудника во встрече: organizer или attendee"
+    )
+    participants: Mapped[list] = mapped_column(
+        JSONB,
+        comment="Имена участников встречи"
+    )
+    calcom_updated_at: Mapped[datetime | None] = mapped_column(
+        DateTime(timezone=True),
+        comment="Время последнего изменения бронирования в Cal.com"
+    )
+    synced_at: Mapped[datetime] = mapped_column(
+        DateTime(timezone=True),
+        server_default=func.now(),
+        onupdate=func.now(),
+        init=False
+    )
+
+
+class BookingSyncCursor(MappedAsDataclass, Base):
+    """Докуда синхронизированы бронирования календаря сотрудника"""
+    __tablename__ = 'booking_sync_cursors'
+
+    employee_id: Mapped[uuid.UUID] = mapped_column(
+        UUID(as_uuid=True),
+        ForeignKey('employees.id', ondelete='CASCADE'),
+        primary_key=True
+    )
+    cursor: Mapped[datetime | None] = mapped_column(
+        DateTime(timezone=True),
+        comment="Наибольшее время изменения бронирования, уже загруженного из Cal.com"
+    )
+    synced_at: Mapped[datetime] = mapped_column(
+        DateTime(timezone=True),
+        server_default=func.now(),
+        onupdate=func.now(),
+        init=False
+    )
+
+
+class BookingIntent(MappedAsDataclass, Base):
+    """Заявка на бронирование в очереди (outbox)
+
+    Тул create_meeting только записывает заявку, встречу в Cal.com создает
+    фоновый обработчик. Ключ идемпотентности не дает повторному вызову
+    с теми же параметрами создать вторую встречу.
+    """
+    __tablename__ = 'booking_intents'
+    __table_args__ = (
+        Index('ix_booking_intents_status_next_attempt_at', 'status', 'next_attempt_at'),
+    )
+
+    id: Mapped[int] = mapped_column(
+        BigInteger,
+        primary_key=True,
+        autoincrement=True,
+        init=False
+    )
+    idempotency_key: Mapped[str] = mapped_column(
+        String(64),
+        unique=True,
+        comment="Ключ идемпотентности: одинаковые заявки дают одну встречу"
+    )
+    organizer_id: Mapped[uuid.UUID] = mapped_column(
+        UUID(as_uuid=True),
+        ForeignKey('employees.id', ondelete='CASCADE'),
+        comment="Организатор (в чьем календаре создается встреча)"
+    )
+    attendee_id: Mapped[uuid.UUID] = mapped_column(
+        UUID(as_uuid=True),
+        ForeignKey('employees.id', ondelete='CASCADE'),
+        comment="Участник встречи"
+    )
+    organizer_name: Mapped[str] = mapped_column(String(50))
+    attendee_name: Mapped[str] = mapped_column(String(50))
+    start_time: Mapped[datetime] = mapped_column(
+        DateTime(timezone=True),
+        comment="Начало встречи"
+    )
+    duration_minutes: Mapped[int] = mapped_column(Integer)
+    title: Mapped[str] = mapped_column(String(255))
+    status: Mapped[str] = mapped_column(
+        String(16),
+        default="pending",
+        comment="pending, processing, booked, failed"
+    )
+    attempts: Mapped[int] = mapped_column(
+        Integer,
+        default=0,
+        comment="Сколько раз обработчик брал заявку"
+    )
+    locked_until: Mapped[datetime | None] = mapped_column(
+        DateTime(timezone=True),
+        default=None,
+        comment="До какого момента заявка закреплена за обработчиком"
+    )
+    calcom_booking_id: Mapped[int | None] = mapped_column(
+        BigInteger,
+        default=None,
+        comment="id созданного бронирования в Cal.com"
+    )
+    error: Mapped[str | None] = mapped_column(
+        String(1000),
+        default=None,
+        comment="Последняя ошибка обработки"
+    )
+    next_attempt_at: Mapped[datetime] = mapped_column(
+        DateTime(timezone=True),
+        server_default=func.now(),
+        init=False,
+        comment="Не обрабатывать раньше (задержка перед повтором)"
+    )
+    created_at: Mapped[datetime] = mapped_column(
+        DateTime(timezone=True),
+        server_default=func.now(),
+        init=False
+    )
+    updated_at: Mapped[datetime] = mapped_column(
+        DateTime(timezone=True),
+        server_default=func.now(),
+        onupdate=func.now(),
+        init=False
+    )
@@ -0,0 +1,91 @@
+import math
+import uuid
+from datetime import date, datetime, timedelta
+
+import numpy as np
+import pytest
+
+from backend.availability import AvailabilityIndex, window_and
+from backend.preferences import LOCAL_TZ, parse_preference
+
+
+def brute_window_and(bits: np.ndarray, length: int) -> np.ndarray:
+    starts = bits.shape[0] - length + 1
+    rows = [np.bitwise_and.reduce(bits[t:t + length], axis=0) for t in range(max(starts, 0))]
+    return np.array(rows, dtype=bits.dtype).reshape(max(starts, 0), bits.shape[1])
+
+
+def brute_earliest_windows(free: np.ndarray, length: int, min_free: int, count: int) -> list[tuple[int, list[bool]]]:
+    """Жадно: первое окно с min_free свободными, следующее - не раньше его конца"""
+    found = []
+    t = 0
+    while len(found) < count and t + length <= free.shape[1]:
+        mask = free[:, t:t + length].all(axis=1)
+        if mask.sum() >= min_free:
+            found.append((t, mask.tolist()))
+            t += length
+        else:
+            t += 1
+    return found
+
+
+@pytest.mark.parametrize("length", [1, 2, 3, 4, 5, 7, 8, 13, 16, 31, 40])
+def test_window_and_matches_brute_force(length):
+    rng = np.random.default_rng(length)
+    bits = rng.integers(0, 256, size=(40, 3), dtype=np.uint8)
+    assert np.array_equal(window_and(bits, length), brute_window_and(bits, length))
+
+
+def test_window_and_longer_than_bits():
+    bits = np.full((3, 2), 0xFF, dtype=np.uint8)
+    assert window_and(bits, 4).shape == (0, 2)
+
+
+@pytest.mark.parametrize("seed", range(5))
+def test_earliest_windows_matches_brute_force(seed):
+    rng = np.random.default_rng(seed)
+    index = AvailabilityIndex(bucket_minutes=15, days=2, ttl=300)
+    index.reset(date(2026, 3, 2))
+    employees = [uuid.uuid4() for _ in range(11)]
+    # Длинные свободные отрезки, чтобы окна в несколько интервалов находились
+    free = np.repeat(rng.random((len(employees), index.size // 4)) < 0.7, 4, axis=1)
+    for employee_id, row in zip(employees, free):
+        intervals = [
+            (index.origin + t * index.bucket, index.origin + (t + 1) * index.bucket)
+            for t in np.flatnonzero(row)
+        ]
+        index.set_free(employee_id, intervals)
+
+    for duration, min_free in [(15, 11), (30, 8), (60, 5), (50, 3)]:
+        length = math.ceil(duration / 15)
+        found = index.earliest_windows(employees, duration, min_free, 10, index.origin, index.end)
+        expected = brute_earliest_windows(free, length, min_free, 10)
+        assert [(start, mask.tolist()) for start, _, mask in found] == [
+            (index.origin + t * index.bucket, mask) for t, mask in expected
+        ]
+        assert all(end - start == length * index.bucket for start, end, _ in found)
+
+
+def test_earliest_windows_respects_range_and_preferences():
+    index = AvailabilityIndex(bucket_minutes=15, days=2, ttl=300)
+    index.reset(date(2026, 3, 2))  # понедельник
+    employee_id = uuid.uuid4()
+    index.set_free(employee_id, [(index.origin, index.end)])
+
+    start = datetime(2026, 3, 2, 10, 7, tzinfo=LOCAL_TZ)
+    found = index.earliest_windows([employee_id], 30, 1, 1, start, index.end)
+    assert found[0][0] == datetime(2026, 3, 2, 10, 15, tzinfo=LOCAL_TZ)
+
+    preference = parse_preference("Только после 15:00")
+    found = index.earliest_windows([employee_id], 30, 1, 1, start, index.end, preferences=[preference])
+    assert found[0][0] == datetime(2026, 3, 2, 15, 0, tzinfo=LOCAL_TZ)
+
+
+def test_mark_busy_hides_window():
+    index = AvailabilityIndex(bucket_minutes=15, days=1, ttl=300)
+    index.reset(date(2026, 3, 2))
+    employee_id = uuid.uuid4()
+    index.set_free(employee_id, [(index.origin, index.end)])
+    index.mark_busy([employee_id], index.origin, index.origin + timedelta(minutes=20))
+    found = index.earliest_windows([employee_id], 15, 1, 1, index.origin, index.end)
+    assert found[0][0] == index.origin + timedelta(minutes=30)
@@ -0,0 +1,192 @@
+import asyncio
+import uuid
+from datetime import datetime, timedelta, timezone
+from types import SimpleNamespace
+
+import pytest
+
+import mcp_server
+from backend import outbox
+from backend.directory import EmployeeRecord, directory
+from shared_models import BookingIntent
+
+
+def employee(name: str) -> EmployeeRecord:
+    return EmployeeRecord(SimpleNamespace(
+        id=uuid.uuid4(),
+        name=name,
+        email=f"{name.lower()}@example.com",
+        position="",
+        department="AI",
+        preference=None,
+        cal_com_username=name.lower(),
+        cal_com_api_key=f"key-{name.lower()}",
+    ))
+
+
+class FakeOutbox:
+    """Таблица booking_intents в памяти с той же логикой повторной постановки"""
+
+    def __init__(self):
+        self.intents: dict[str, BookingIntent] = {}
+
+    async def get_intents(self, ids=None, idempotency_key=None):
+        intent = self.intents.get(idempotency_key)
+        return [intent] if intent is not None else []
+
+    async def enqueue(self, organizer, attendee, start, duration_minutes, title, idempotency_key, rebook=False):
+        intent = self.intents.get(idempotency_key)
+        if intent is None:
+            intent = BookingIntent(
+                idempotency_key=idempotency_key,
+                organizer_id=organizer.id,
+                attendee_id=attendee.id,
+                organizer_name=organizer.name,
+                attendee_name=attendee.name,
+                start_time=start,
+                duration_minutes=duration_minutes,
+                title=title.strip(),
+                status=outbox.PENDING,
+                attempts=0,
+            )
+            intent.id = len(self.intents) + 1
+            self.intents[idempotency_key] = intent
+            return intent, True
+        requeue = (outbox.FAILED, outbox.BOOKED) if rebook else (outbox.FAILED,)
+        if intent.status in requeue and outbox.same_request(
+            intent, organizer, attendee, start, duration_minutes, title
+        ):
+            intent.status = outbox.PENDING
+            return intent, True
+        return intent, False
+
+
+@pytest.fixture
+def booking(monkeypatch):
+    alice, bob = employee("Alice"), employee("Bob")
+    monkeypatch.setattr(directory, "_loaded", True)
+    directory.replace([alice, bob])
+    store = FakeOutbox()
+    monkeypatch.setattr(outbox, "get_intents", store.get_intents)
+    monkeypatch.setattr(outbox, "enqueue", store.enqueue)
+    calendar: list[dict] = []
+
+    async def local_conflicts(employees, start_time, duration_minutes):
+        return list(calendar)
+
+    monkeypatch.setattr(mcp_server, "local_conflicts", local_conflicts)
+    start = (datetime.now(timezone.utc) + timedelta(days=1)).replace(microsecond=0).isoformat()
+
+    def request(key=None, **changes):
+        arguments = {"start_time": start, "duration_minutes": 30, "title": "Sync"} | changes
+        return asyncio.run(mcp_server.enqueue_meeting("Alice", "Bob", idempotency_key=key, **arguments))
+
+    def book(result, booking_id=101):
+        """Обработчик выполнил заявку, встреча попала в локальную копию"""
+        intent = next(i for i in store.intents.values() if i.id == result["request_id"])
+        intent.status = outbox.BOOKED
+        intent.calcom_booking_id = booking_id
+        calendar.append({"employee": "Alice", "booking_id": booking_id, "title": "Sync"})
+
+    return SimpleNamespace(request=request, book=book, calendar=calendar, store=store)
+
+
+def test_duplicate_key_returns_pending_intent(booking):
+    first = booking.request(key="k1")
+    again = booking.request(key="k1")
+    assert first["status"] == outbox.PENDING and "duplicate" not in first
+    assert again["request_id"] == first["request_id"]
+    assert again["duplicate"] is True
+
+
+@pytest.mark.parametrize("key", ["k1", None])
+def test_retry_after_booked_returns_same_intent(booking, key):
+    first = booking.request(key=key)
+    booking.book(first)
+    again = booking.request(key=key)
+    assert again["success"] is True
+    assert again["duplicate"] is True
+    assert again["request_id"] == first["request_id"]
+    assert again["status"] == outbox.BOOKED
+    assert again["booking_id"] == 101
+
+
+def test_derived_key_rebooks_cancelled_meeting(booking):
+    first = booking.request()
+    booking.book(first)
+    booking.calendar.clear()  # встречу отменили
+    again = booking.request()
+    assert again["request_id"] == first["request_id"]
+    assert again["status"] == outbox.PENDING
+    assert "duplicate" not in again
+
+
+def test_conflict_with_other_meeting_is_reported(booking):
+    booking.calendar.append({"employee": "Bob", "booking_id": 7, "title": "Other"})
+    result = booking.request(key="k1")
+    assert result["success"] is False
+    assert result["conflicts"][0]["booking_id"] == 7
+
+
+def test_key_reused_with_other_parameters_is_rejected(booking):
+    first = booking.request(key="k1")
+    other = booking.request(key="k1", duration_minutes=60)
+    assert other["success"] is False
+    assert "idempotency_key" in other["error"]
+    assert other["existing"]["request_id"] == first["request_id"]
+    assert booking.store.intents["k1"].duration_minutes == 30
+
+
+def test_failed_intent_is_not_requeued_with_other_parameters(booking):
+    first = booking.request(key="k1")
+    booking.store.intents["k1"].status = outbox.FAILED
+    other = booking.request(key="k1", title="Other")
+    assert other["success"] is False
+    assert booking.store.intents["k1"].status == outbox.FAILED
+    again = booking.request(key="k1")
+    assert again["request_id"] == first["request_id"] and again["status"] == outbox.PENDING
+
+
+class FakeSession:
+    """Сессия, которая запоминает условия UPDATE и считает их выполненными"""
+
+    def __init__(self, log: list):
+        self.log = log
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        pass
+
+    async def execute(self, statement):
+        self.log.append(statement.compile().params)
+        return SimpleNamespace(rowcount=1)
+
+    async def commit(self):
+        pass
+
+
+def test_worker_renews_lease_and_finishes_under_it(monkeypatch):
+    log: list[dict] = []
+    monkeypatch.setattr(outbox, "SessionLocal", lambda: FakeSession(log))
+    monkeypatch.setattr(outbox, "LEASE_RENEW_INTERVAL", 0.02)
+
+    async def book(job):
+        await asyncio.sleep(0.1)
+        return {"success": True, "meeting": {"booking_id": 7}}
+
+    async def find_existing(job):
+        return None
+
+    claimed = datetime.now(timezone.utc)
+    job = SimpleNamespace(id=1, attempts=1, calcom_booking_id=None, locked_until=claimed, created_at=claimed)
+    asyncio.run(outbox.OutboxWorker(book, find_existing).process(job))
+
+    renewals, finish = log[:-1], log[-1]
+    assert renewals, "аренда не продлевалась"
+    # Каждое продление и итог - только под своей, последней продленной арендой
+    leases = [claimed] + [params["locked_until"] for params in renewals]
+    assert [params["locked_until_1"] for params in renewals] == leases[:-1]
+    assert finish["locked_until_1"] == leases[-1]
+    assert finish["status"] == outbox.BOOKED and finish["calcom_booking_id"] == 7
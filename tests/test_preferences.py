@@ -0,0 +1,77 @@
+from datetime import date, datetime, time
+
+import pytest
+
+from backend.preferences import NO_PREFERENCE, LOCAL_TZ, parse_preference, split_slots
+
+ALL_DAYS = frozenset(range(7))
+
+
+@pytest.mark.parametrize("text, earliest, latest, weekdays, skip_lunch", [
+    # Фразы из справочника сотрудников
+    ("Встречи не позже 15:00", None, time(15), None, False),
+    ("Встречи после обеда", time(14), None, None, False),
+    ("Не раньше 10", time(10), None, None, False),
+    ("До обеда", None, time(13), None, False),
+    ("Утром", None, time(13), None, False),
+    ("Не в обед", None, None, None, True),
+    ("По вторникам", None, None, frozenset({1}), False),
+    ("Кроме пятницы", None, None, ALL_DAYS - {4}, False),
+    ("с 10 до 18", time(10), time(18), None, False),
+    ("до 6 вечера", None, time(18), None, False),
+    ("Не раньше 11:30 по будням", time(11, 30), None, frozenset(range(5)), False),
+    ("Встречи по средам, кроме обеда", None, None, frozenset({2}), True),
+    ("Не раньше 10, кроме пн, ср", time(10), None, ALL_DAYS - {0, 2}, False),
+    # Отрицание в любом месте части предпочтения
+    ("Не назначать встречи по пятницам", None, None, ALL_DAYS - {4}, False),
+    ("Не люблю встречи в пятницу", None, None, ALL_DAYS - {4}, False),
+    ("По пятницам встречи не ставить", None, None, ALL_DAYS - {4}, False),
+    ("Без встреч по понедельникам", None, None, ALL_DAYS - {0}, False),
+    ("No meetings on fridays", None, None, ALL_DAYS - {4}, False),
+    ("Встречи до 9 утра не ставить", time(9), None, None, False),
+    ("После 18 не ставить", None, time(18), None, False),
+    ("Не ставить встречи раньше 10", time(10), None, None, False),
+    ("Не люблю встречи после обеда", None, time(13), None, False),
+    # Диапазоны дней
+    ("Встречи с понедельника по среду", None, None, frozenset({0, 1, 2}), False),
+    ("пн-ср после 11", time(11), None, frozenset({0, 1, 2}), False),
+    ("С пятницы по понедельник", None, None, frozenset({4, 5, 6, 0}), False),
+])
+def test_parse_preference(text, earliest, latest, weekdays, skip_lunch):
+    preference = parse_preference(text)
+    assert preference.earliest == earliest
+    assert preference.latest == latest
+    assert preference.weekdays == weekdays
+    assert preference.skip_lunch == skip_lunch
+
+
+@pytest.mark.parametrize("text", [None, "", "Нет", "Средний приоритет"])
+def test_parse_preference_without_constraints(text):
+    assert parse_preference(text) == NO_PREFERENCE
+
+
+def test_split_slots_keeps_slots_outside_preference():
+    slots = {
+        "2026-03-06": [  # пятница
+            {"time": "2026-03-06T10:00:00+03:00"},
+            {"time": "2026-03-06T16:00:00+03:00"},
+        ],
+        "2026-03-09": [  # понедельник
+            {"time": "2026-03-09T10:00:00+03:00"},
+            {"time": "2026-03-09T14:30:00+03:00"},
+        ],
+    }
+    suitable, outside = split_slots(parse_preference("Не позже 15:00, по пятницам не ставить"), slots, 30)
+    assert suitable == {"2026-03-09": [{"time": "2026-03-09T10:00:00+03:00"}, {"time": "2026-03-09T14:30:00+03:00"}]}
+    assert outside == {"2026-03-06": slots["2026-03-06"]}
+
+
+def test_fits_whole_meeting():
+    preference = parse_preference("Не позже 15:00")
+    day = date(2026, 3, 9)
+    assert preference.fits(
+        datetime.combine(day, time(14), LOCAL_TZ), datetime.combine(day, time(15), LOCAL_TZ)
+    )
+    assert not preference.fits(
+        datetime.combine(day, time(14, 30), LOCAL_TZ), datetime.combine(day, time(15, 30), LOCAL_TZ)
+    )
@@ -0,0 +1,66 @@
+import asyncio
+
+import pytest
+
+from backend.rate_limiter import Priority, RateLimiter, parse_retry_after
+
+
+def test_priority_lane_served_before_background():
+    async def scenario():
+        limiter = RateLimiter(key_rate=1000, key_burst=1000, host_rate=50, host_burst=1)
+        # Единственный токен хоста уходит сразу, дальше все ждут в очереди
+        assert await limiter.acquire("sync") == 0
+        served = []
+
+        async def request(name: str, priority: Priority):
+            await limiter.acquire(name, priority)
+            served.append(name)
+
+        tasks = [asyncio.create_task(request("sync-1", Priority.BACKGROUND))]
+        await asyncio.sleep(0)
+        tasks.append(asyncio.create_task(request("sync-2", Priority.BACKGROUND)))
+        await asyncio.sleep(0)
+        tasks.append(asyncio.create_task(request("probe", Priority.PROBE)))
+        await asyncio.sleep(0)
+        tasks.append(asyncio.create_task(request("booking", Priority.BOOKING)))
+        await asyncio.sleep(0)
+        assert limiter.metrics()["waiting"]["background"] == 2
+        await asyncio.gather(*tasks)
+        return served
+
+    assert asyncio.run(scenario()) == ["booking", "probe", "sync-1", "sync-2"]
+
+
+def test_cancelled_waiter_leaves_queue():
+    async def scenario():
+        limiter = RateLimiter(key_rate=1000, key_burst=1000, host_rate=50, host_burst=1)
+        await limiter.acquire("sync")
+        waiter = asyncio.create_task(limiter.acquire("alice", Priority.BOOKING))
+        await asyncio.sleep(0)
+        waiter.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await waiter
+        await limiter.acquire("bob", Priority.BACKGROUND)
+        return limiter.metrics()["waiting"]
+
+    assert sum(asyncio.run(scenario()).values()) == 0
+
+
+def test_throttled_key_slows_down_and_recovers():
+    limiter = RateLimiter(key_rate=4, key_burst=4)
+    limiter.throttled("alice", 1.0)
+    bucket = limiter.bucket("alice")
+    assert bucket.rate == 2
+    assert bucket.wait_time(bucket.updated) > 0
+    for _ in range(100):
+        limiter.succeeded("alice")
+    assert bucket.rate == 4
+    assert limiter.bucket("bob").rate == 4
+
+
+def test_parse_retry_after():
+    assert parse_retry_after("3") == 3.0
+    assert parse_retry_after("-1") == 0.0
+    assert parse_retry_after("Wed, 21 Oct 2015 07:28:00 GMT") == 0.0
+    assert parse_retry_after("скоро") is None
+    assert parse_retry_after(None) is None
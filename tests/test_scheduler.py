@@ -0,0 +1,54 @@
+import asyncio
+
+from backend.scheduler import TurnScheduler
+
+
+def test_follow_up_messages_coalesce_into_one_turn():
+    async def scenario():
+        scheduler = TurnScheduler(max_concurrent=2, coalesce_window=0.05)
+        turns = []
+
+        async def run(text: str) -> str:
+            turns.append(text)
+            return f"ответ на: {text}"
+
+        first = asyncio.create_task(scheduler.submit(1, "Найди время", run))
+        await asyncio.sleep(0)
+        second = asyncio.create_task(scheduler.submit(1, "с Алисой", run))
+        third = asyncio.create_task(scheduler.submit(1, "на завтра", run))
+        results = await asyncio.gather(first, second, third)
+        return turns, results, scheduler.metrics()
+
+    turns, results, metrics = asyncio.run(scenario())
+    assert turns == ["Найди время\nс Алисой\nна завтра"]
+    assert results == ["ответ на: Найди время\nс Алисой\nна завтра", None, None]
+    assert metrics["turns"] == 1
+    assert metrics["coalesced_messages"] == 2
+    assert metrics["active_chats"] == 0
+
+
+def test_message_during_turn_starts_next_turn():
+    async def scenario():
+        scheduler = TurnScheduler(max_concurrent=2, coalesce_window=0)
+        started = asyncio.Event()
+        release = asyncio.Event()
+        turns = []
+
+        async def run(text: str) -> str:
+            turns.append(text)
+            started.set()
+            await release.wait()
+            return text
+
+        first = asyncio.create_task(scheduler.submit(1, "первое", run))
+        await started.wait()
+        second = asyncio.create_task(scheduler.submit(1, "второе", run))
+        await asyncio.sleep(0)
+        # Пока идет первый ход, второй не начинается
+        assert turns == ["первое"]
+        release.set()
+        return turns, await asyncio.gather(first, second)
+
+    turns, results = asyncio.run(scenario())
+    assert turns == ["первое", "второе"]
+    assert results == ["первое", "второе"]
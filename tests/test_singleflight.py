@@ -0,0 +1,72 @@
+import asyncio
+
+import pytest
+
+from backend.singleflight import SingleFlight
+
+
+def test_concurrent_calls_share_one_run():
+    async def scenario():
+        flight = SingleFlight()
+        calls = 0
+
+        async def load():
+            nonlocal calls
+            calls += 1
+            await asyncio.sleep(0.01)
+            return calls
+
+        results = await asyncio.gather(*(flight.do("slots", load) for _ in range(3)))
+        return calls, results, flight.shared
+
+    calls, results, shared = asyncio.run(scenario())
+    assert calls == 1
+    assert results == [1, 1, 1]
+    assert shared == 2
+
+
+def test_follower_survives_leader_cancellation():
+    async def scenario():
+        flight = SingleFlight()
+        release = asyncio.Event()
+
+        async def load():
+            await release.wait()
+            return "slots"
+
+        leader = asyncio.create_task(flight.do("alice", load))
+        await asyncio.sleep(0)
+        follower = asyncio.create_task(flight.do("alice", load))
+        await asyncio.sleep(0)
+
+        leader.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await leader
+
+        release.set()
+        return await follower
+
+    assert asyncio.run(scenario()) == "slots"
+
+
+def test_error_is_shared_and_key_is_released():
+    async def scenario():
+        flight = SingleFlight()
+        attempts = 0
+
+        async def load():
+            nonlocal attempts
+            attempts += 1
+            await asyncio.sleep(0)
+            if attempts == 1:
+                raise RuntimeError("cal.com недоступен")
+            return "slots"
+
+        results = await asyncio.gather(
+            flight.do("alice", load), flight.do("alice", load), return_exceptions=True
+        )
+        return results, await flight.do("alice", load)
+
+    results, retry = asyncio.run(scenario())
+    assert all(isinstance(result, RuntimeError) for result in results)
+    assert retry == "slots"